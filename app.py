@@ -2,112 +2,498 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import os
 import json
+import hashlib
+import base64
+import threading
+import click
 import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
-from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import wraps
+from flask import (Blueprint, Flask, render_template, request, Response, flash, redirect,
+  url_for, abort, jsonify, current_app)
+from flask.cli import with_appcontext
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from assets import Assets, assets
+from autocomplete import Autocomplete
+from cache import ResponseCache
+from instrumentation import Instrumentation
+from sessions import Sessions
+from filters import format_datetime
 from flask_migrate import Migrate
-from datetime import date
+from config import CONFIGS
+from datetime import datetime, timedelta
+from models import db, Genre, Venue, Artist, Show, venue_genres, artist_genres, SEARCH_COLUMNS
+import bookings
+import counters
+import geo
+import matches
+import sessions
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.attributes import flag_modified
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy import column, func, literal_column, or_, table, text, tuple_
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import NullPool, QueuePool, SingletonThreadPool, StaticPool
 
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__, instance_relative_config=True)
-moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
+# Extensions are created unbound and attached to each app by create_app(),
+# so importing this module neither builds an app nor touches the database.
+migrate = Migrate()
+response_cache = ResponseCache()
+instrumentation = Instrumentation()
+static_assets = Assets()
+autocomplete = Autocomplete()
+server_sessions = Sessions()
+main = Blueprint('main', __name__)
+
+def engine_options(config):
+  '''SQLAlchemy engine arguments for the DB_* pool settings of config.'''
+  # The dialect's name, not the URL's scheme: postgres:// and
+  # postgresql:// URLs both load the 'postgresql' dialect.
+  backend = make_url(config['SQLALCHEMY_DATABASE_URI']).get_dialect().name
+  if backend == 'sqlite':
+    return {}
+  if config['DB_PGBOUNCER']:
+    # Transaction pooling hands each transaction whichever server connection
+    # is free, so nothing may outlive one: no client-side pool, and no
+    # server-side prepared statements (psycopg2 never creates them).
+    # PgBouncer does not forward startup options either, so set
+    # statement_timeout on the database role instead.
+    return {'poolclass': NullPool}
+  options = {
+    'pool_size': config['DB_POOL_SIZE'],
+    'max_overflow': config['DB_MAX_OVERFLOW'],
+    'pool_timeout': config['DB_POOL_TIMEOUT'],
+    'pool_recycle': config['DB_POOL_RECYCLE'],
+    'pool_pre_ping': config['DB_POOL_PRE_PING'],
+  }
+  if config['DB_STATEMENT_TIMEOUT'] and backend == 'postgresql':
+    options['connect_args'] = {'options': f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT']}"}
+  return options
+
+def create_app(config=None):
+  '''Build the application. config is anything app.config.from_object
+  accepts, by default the class named by FYYUR_CONFIG (development,
+  testing or production). No connection is opened until the first query;
+  the schema is managed by Flask-Migrate (`flask db upgrade`).'''
+  app = Flask(__name__, instance_relative_config=True)
+  if config is None:
+    config = CONFIGS[os.environ.get('FYYUR_CONFIG', 'development')]
+  app.config.from_object(config)
+  if not app.config['SECRET_KEY']:
+    if not (app.debug or app.testing):
+      raise RuntimeError('SECRET_KEY must be set in the environment')
+    app.config['SECRET_KEY'] = sessions.instance_secret_key(app)
+  app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+  db.init_app(app)
+  migrate.init_app(app, db)
+  response_cache.init_app(app)
+  instrumentation.init_app(app)
+  static_assets.init_app(app)
+  autocomplete.init_app(app)
+  server_sessions.init_app(app)
+  app.jinja_env.filters['datetime'] = format_datetime
+  app.register_blueprint(main)
+  app.cli.add_command(assets)
+  app.cli.add_command(catalog)
+  app.cli.add_command(counters.counters)
+  app.cli.add_command(geo.geo)
+  app.cli.add_command(matches.matches)
+  app.cli.add_command(sessions.sessions)
+  app.cli.add_command(create_db)
+
+  if not app.debug and not app.testing:
+    file_handler = FileHandler('error.log')
+    file_handler.setFormatter(
+      Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+    )
+    app.logger.setLevel(logging.INFO)
+    file_handler.setLevel(logging.INFO)
+    app.logger.addHandler(file_handler)
+    app.logger.info('errors')
+  return app
 
 #----------------------------------------------------------------------------#
-# Models.
+# Pagination.
 #----------------------------------------------------------------------------#
 
-migrate = Migrate(app, db)
+Page = namedtuple('Page', ['items', 'next_url', 'prev_url'])
 
-class Venue(db.Model):
-    __tablename__ = 'Venue'
+def encode_cursor(values):
+  values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+  return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
 
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String, nullable=False)
-    city = db.Column(db.String(120), nullable=False)
-    state = db.Column(db.String(120), nullable=False)
-    address = db.Column(db.String(120), nullable=False)
-    phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120), nullable=False)
-    image_link = db.Column(db.String(500))
-    website = db.Column(db.String(120))
-    seeking_talent = db.Column(db.Boolean)
-    seeking_description = db.Column(db.String(500))
-    facebook_link = db.Column(db.String(120))
+def decode_cursor(token, keys):
+  try:
+    values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    if len(values) != len(keys):
+      raise ValueError(token)
+    return [datetime.fromisoformat(v) if isinstance(key.type, db.DateTime) else v
+      for key, v in zip(keys, values)]
+  except (ValueError, TypeError):
+    abort(400)
+
+def page_limit():
+  limit = request.args.get('limit', current_app.config['PAGE_SIZE'], type=int)
+  return max(1, min(limit, current_app.config['MAX_PAGE_SIZE']))
+
+def keyset_paginate(query, keys, key_of):
+  '''Paginate query on the (unique) column tuple keys using ?after=/?before=
+  cursors instead of OFFSET, so every page is an index range scan.
+  key_of extracts the key values from a result row.'''
+  limit = page_limit()
+  after = request.args.get('after')
+  before = request.args.get('before')
+  if before:
+    query = query.filter(tuple_(*keys) < tuple_(*decode_cursor(before, keys))) \
+      .order_by(*[key.desc() for key in keys])
+  else:
+    if after:
+      query = query.filter(tuple_(*keys) > tuple_(*decode_cursor(after, keys)))
+    query = query.order_by(*keys)
+  rows = query.limit(limit + 1).all()
+  has_more = len(rows) > limit
+  rows = rows[:limit]
+  if before:
+    rows.reverse()
+  has_next = has_more if not before else True
+  has_prev = has_more if before else bool(after)
+
+  args = request.args.to_dict()
+  args.pop('after', None)
+  args.pop('before', None)
+  next_url = prev_url = None
+  if rows and has_next:
+    next_url = url_for(request.endpoint, **request.view_args, **args, after=encode_cursor(key_of(rows[-1])))
+  if rows and has_prev:
+    prev_url = url_for(request.endpoint, **request.view_args, **args, before=encode_cursor(key_of(rows[0])))
+  return Page(rows, next_url, prev_url)
 
-    show = db.relationship('Show', backref='venue', lazy=True)
+#----------------------------------------------------------------------------#
+# Genres.
+#----------------------------------------------------------------------------#
 
-    def __repr__(self):
-      return (f'<Venue ID: {self.id}, name: {self.name}, city: {self.city},' 
-        f' state: {self.state}, address: {self.address}, phone: {self.phone},' 
-        f' genres: {self.genres}, image_link: {self.image_link}, facebook_link: {self.facebook_link}>')
+GENRE_OWNERS = {
+  Venue: venue_genres.c.venue_id,
+  Artist: artist_genres.c.artist_id,
+}
+
+def genres_from_names(names):
+  '''Return Genre rows for names, creating any that do not exist yet.'''
+  names = list(dict.fromkeys(name.strip() for name in names if name.strip()))
+  genres = {genre.name: genre for genre in Genre.query.filter(Genre.name.in_(names))}
+  for name in names:
+    if name not in genres:
+      genres[name] = Genre(name=name)
+      db.session.add(genres[name])
+  return [genres[name] for name in names]
+
+def with_genre(model, condition):
+  '''Ids of model rows having a genre matching condition, served by the
+  genre-first association index.'''
+  owner_id = GENRE_OWNERS[model]
+  return db.session.query(owner_id) \
+    .join(Genre, Genre.id == owner_id.table.c.genre_id) \
+    .filter(condition)
 
-class Artist(db.Model):
-    __tablename__ = 'Artist'
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
 
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String, nullable=False)
-    city = db.Column(db.String(120), nullable=False)
-    state = db.Column(db.String(120), nullable=False)
-    phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120), nullable=False)
-    image_link = db.Column(db.String(500))
-    facebook_link = db.Column(db.String(120))
-    website = db.Column(db.String(120))
-    seeking_venue = db.Column(db.Boolean)
-    seeking_description = db.Column(db.String(500))
+def search_document(model):
+  # Must stay identical to the expression indexed in the pg_trgm migration.
+  space = literal_column("' '")
+  return model.name + space + model.city + space + model.state
+
+def search(model, search_term, genre=None):
+  '''Rank rows of model whose name, city, state or genres contain
+  search_term, best matches first, limited to SEARCH_LIMIT rows.
+  genre optionally restricts the results to one genre.'''
+  limit = current_app.config['SEARCH_LIMIT']
+  dialect = db.engine.dialect.name
+  pattern = f'%{search_term}%'
+  genre_matches = with_genre(model, Genre.name.ilike(pattern))
+  query = db.session.query(model.id, model.name)
+  if genre:
+    query = query.filter(model.id.in_(with_genre(model, Genre.name == genre).subquery()))
+
+  if dialect == 'sqlite' and len(search_term) >= 3:
+    index = table(f'{model.__tablename__}_search', column('rowid'), column('rank'))
+    phrase = '"' + search_term.replace('"', '""') + '"'
+    results = query.join(index, index.c.rowid == model.id) \
+      .filter(text(f'"{index.name}" MATCH :phrase')).params(phrase=phrase) \
+      .order_by(index.c.rank).limit(limit).all()
+    if len(results) < limit:
+      results += query.filter(model.id.in_(genre_matches.subquery()),
+        ~model.id.in_([result.id for result in results])) \
+        .order_by(model.name).limit(limit - len(results)).all()
+    return results
+
+  if dialect == 'postgresql':
+    document = search_document(model)
+    matches = db.session.query(model.id).filter(document.ilike(pattern)).union(genre_matches)
+    query = query.filter(model.id.in_(matches.subquery())) \
+      .order_by(func.similarity(document, search_term).desc(), model.name)
+  else:
+    # Trigram indexes cannot serve terms shorter than three characters.
+    query = query.filter(or_(model.id.in_(genre_matches.subquery()),
+      *[getattr(model, column).ilike(pattern) for column in SEARCH_COLUMNS])) \
+      .order_by(model.name)
+  return query.limit(limit).all()
 
-    show = db.relationship('Show', backref='artist', lazy=True)
+#----------------------------------------------------------------------------#
+# Shows.
+#----------------------------------------------------------------------------#
 
-    def __repr__(self):
-      return (f'<Artist ID: {self.id}, name: {self.name}, city: {self.city},' 
-        f' state: {self.state}, phone: {self.phone},' 
-        f' genres: {self.genres}, image_link: {self.image_link}, facebook_link: {self.facebook_link}>')
+def show_rows(query):
+  '''Extend query (whose last column is Show.start_time) so each row is
+  tagged as upcoming or past against the database clock and carries the
+  size of its group.'''
+  is_upcoming = Show.start_time > func.now()
+  return query.add_columns(is_upcoming.label('upcoming'),
+      func.count().over(partition_by=is_upcoming).label('period_count')) \
+    .order_by(Show.start_time, Show.id)
+
+def split_shows(rows, fields):
+  '''Split the rows of a show_rows() query into (past, upcoming,
+  past_count, upcoming_count), with rows as dicts keyed by fields.'''
+  shows = {True: [], False: []}
+  counts = {True: 0, False: 0}
+  for row in rows:
+    upcoming = bool(row.upcoming)
+    show = dict(zip(fields, row))
+    shows[upcoming].append(show)
+    counts[upcoming] = row.period_count
+  return shows[False], shows[True], counts[False], counts[True]
 
-class Show(db.Model):
-  __tablename__ = 'Show'
+#----------------------------------------------------------------------------#
+# Concurrent reads.
+#----------------------------------------------------------------------------#
 
-  id = db.Column(db.Integer, primary_key=True)
-  start_time = db.Column(db.DateTime(), nullable=False)
-  venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
-  artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
+_read_executor = None
+_read_executor_lock = threading.Lock()
+
+def read_executor():
+  global _read_executor
+  with _read_executor_lock:
+    if _read_executor is None:
+      _read_executor = ThreadPoolExecutor(current_app.config['CONCURRENT_READ_THREADS'],
+        thread_name_prefix='read')
+    return _read_executor
+
+def fetch_concurrently(query):
+  '''Start query on its own pooled connection in a background thread and
+  return a Future of its rows, so a view overlaps independent round trips
+  instead of paying for them one after another. Runs it in the request's
+  session instead when CONCURRENT_READS is off or the pool cannot hand a
+  second connection to another thread (in-memory SQLite).'''
+  engine = db.engine
+  if not current_app.config['CONCURRENT_READS'] \
+      or isinstance(engine.pool, (StaticPool, SingletonThreadPool)):
+    future = Future()
+    future.set_result(query.all())
+    return future
+  statement = query.statement
+  stats = Instrumentation.current()
+  def run():
+    with Instrumentation.recording(stats), engine.connect() as connection:
+      return connection.execute(statement).fetchall()
+  return read_executor().submit(run)
 
-  def __repr__(self):
-    return (f'<Show ID: {self.id}, start_time: {self.start_time}, venue_id: {self.venue_id}, artist_id: {self.artist_id}>')
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
 
+# Shared by the HTML views and the JSON API so both serve the same data.
 
-db.create_all()
+def venue_areas():
+  # Venues come back already ordered by area, each with its maintained
+  # count of upcoming shows, so grouping is one pass over one table.
+  venues = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state,
+    counters.upcoming_shows(Venue).label('num_upcoming_shows'))
+  if request.args.get('genre'):
+    venues = venues.filter(Venue.id.in_(with_genre(Venue, Genre.name == request.args['genre']).subquery()))
+  page = keyset_paginate(venues, (Venue.state, Venue.city, Venue.name, Venue.id),
+    lambda venue: (venue.state, venue.city, venue.name, venue.id))
+
+  data = []
+  for venue in page.items:
+    if not data or (data[-1]['city'], data[-1]['state']) != (venue.city, venue.state):
+      data.append({"city": venue.city, "state": venue.state, "venues": []})
+    data[-1]['venues'].append({"id": venue.id, "name": venue.name,
+      "num_upcoming_shows": venue.num_upcoming_shows})
+  return data, page
+
+def venue_detail(venue_id):
+  # The shows query does not depend on the venue row, so both are in flight
+  # at once.
+  shows = fetch_concurrently(show_rows(
+    db.session.query(Show.artist_id, Artist.name, Artist.image_link, Show.start_time)
+    .join(Artist, Show.artist_id == Artist.id)
+    .filter(Show.venue_id == venue_id)))
+  venue = Venue.query.options(joinedload(Venue.genres)).get(venue_id)
+  if venue is None:
+    abort(404)
+  past_shows, upcoming_shows, past_shows_count, upcoming_shows_count = split_shows(shows.result(),
+    ('artist_id', 'artist_name', 'artist_image_link', 'start_time'))
+
+  return {
+    "id": venue.id,
+    "name": venue.name,
+    "genres": [genre.name for genre in venue.genres],
+    "address": venue.address,
+    "city": venue.city,
+    "state": venue.state,
+    "phone": venue.phone,
+    "website": venue.website,
+    "facebook_link": venue.facebook_link,
+    "seeking_talent": venue.seeking_talent,
+    "seeking_description": venue.seeking_description,
+    "image_link": venue.image_link,
+    "past_shows": past_shows,
+    "upcoming_shows": upcoming_shows,
+    "past_shows_count": past_shows_count,
+    "upcoming_shows_count": upcoming_shows_count,
+    "recommended_artists": recommendation_results(matches.recommended('venue', venue_id))
+  }
+
+def artist_list():
+  artists = db.session.query(Artist.id, Artist.name)
+  if request.args.get('genre'):
+    artists = artists.filter(Artist.id.in_(with_genre(Artist, Genre.name == request.args['genre']).subquery()))
+  page = keyset_paginate(artists, (Artist.name, Artist.id),
+    lambda artist: (artist.name, artist.id))
+  data = []
+  for artist in page.items:
+    data.append({"id": artist.id, "name": artist.name})
+  return data, page
+
+def artist_detail(artist_id):
+  shows = fetch_concurrently(show_rows(
+    db.session.query(Show.venue_id, Venue.name, Venue.image_link, Show.start_time)
+    .join(Venue, Show.venue_id == Venue.id)
+    .filter(Show.artist_id == artist_id)))
+  artist = Artist.query.options(joinedload(Artist.genres)).get(artist_id)
+  if artist is None:
+    abort(404)
+  past_shows, upcoming_shows, past_shows_count, upcoming_shows_count = split_shows(shows.result(),
+    ('venue_id', 'venue_name', 'venue_image_link', 'start_time'))
+  nearby_venues = []
+  if artist.latitude is not None:
+    nearby_venues = nearby_results(Venue, artist.latitude, artist.longitude,
+      current_app.config['ARTIST_NEARBY_RADIUS_KM'], current_app.config['ARTIST_NEARBY_VENUES'])
+
+  return {
+    "id": artist.id,
+    "name": artist.name,
+    "genres": [genre.name for genre in artist.genres],
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "website": artist.website,
+    "facebook_link": artist.facebook_link,
+    "seeking_venue": artist.seeking_venue,
+    "seeking_description": artist.seeking_description,
+    "image_link": artist.image_link,
+    "past_shows": past_shows,
+    "upcoming_shows": upcoming_shows,
+    "past_shows_count": past_shows_count,
+    "upcoming_shows_count": upcoming_shows_count,
+    "nearby_venues": nearby_venues,
+    "recommended_venues": recommendation_results(matches.recommended('artist', artist_id))
+  }
+
+def nearby_results(model, latitude, longitude, radius_km, limit):
+  return [{'id': row.id, 'name': row.name, 'city': row.city, 'state': row.state,
+    'distance_km': round(distance, 1)}
+    for distance, row in geo.nearby(model, latitude, longitude, radius_km, limit)]
+
+def recommendation_results(rows):
+  # Run in the request's session, after the entity: a primary-key range
+  # lookup, not worth holding a third pooled connection for.
+  return [{'id': id, 'name': name, 'image_link': image_link, 'score': round(score, 3)}
+    for id, name, image_link, score in rows]
+
+def show_list():
+  # One joined query projecting only the columns the listing renders, instead
+  # of loading Show rows and lazily fetching venue/artist for each of them.
+  shows = db.session.query(Show.venue_id, Venue.name, Show.artist_id,
+      Artist.name, Artist.image_link, Show.start_time, Show.id) \
+    .join(Venue, Show.venue_id == Venue.id) \
+    .join(Artist, Show.artist_id == Artist.id)
+  try:
+    if request.args.get('from'):
+      shows = shows.filter(Show.start_time >= dateutil.parser.parse(request.args['from']))
+    if request.args.get('to'):
+      shows = shows.filter(Show.start_time < dateutil.parser.parse(request.args['to']))
+  except (ValueError, OverflowError):
+    abort(400)
+  page = keyset_paginate(shows, (Show.start_time, Show.id), lambda show: (show[5], show[6]))
+  data = []
+  for venue_id, venue_name, artist_id, artist_name, artist_image_link, start_time, _ in page.items:
+    data.append({'venue_id': venue_id, 'venue_name': venue_name, 'artist_id': artist_id,
+      'artist_name': artist_name, 'artist_image_link': artist_image_link, 'start_time': start_time})
+  return data, page
+
+def search_results(model, search_term, genre=None):
+  rows = search(model, search_term.strip(), genre=genre)
+  return {'count': len(rows), 'data': [{'id': row.id, 'name': row.name} for row in rows]}
 
 #----------------------------------------------------------------------------#
-# Filters.
+# Cache invalidation.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+# Cached pages are tagged 'venues', 'artists', 'shows' (listings) and
+# 'venue:<id>', 'artist:<id>' (detail pages). Writers invalidate exactly the
+# pages that render the rows they changed. Detail pages are also tagged
+# 'matches', which `flask matches build` invalidates. Artist pages list
+# nearby venues and are tagged 'venue-locations', invalidated only when a
+# venue appears, disappears or moves.
+
+def venue_tags(venue_id, moved=False, artist_ids=None):
+  '''Tags of the pages rendering the venue. Collect them before deleting
+  it; its shows, and so its artists, go with it.'''
+  if artist_ids is None:
+    artist_ids = [artist_id for artist_id, in
+      db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()]
+  return ['venues', 'shows', f'venue:{venue_id}', *(['venue-locations'] if moved else []),
+    *[f'artist:{artist_id}' for artist_id in artist_ids]]
+
+def invalidate_venue(venue_id, moved=False):
+  response_cache.invalidate(*venue_tags(venue_id, moved))
+
+def invalidate_artist(artist_id, moved=False):
+  # An artist's location only shows on its own page.
+  venue_ids = db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()
+  response_cache.invalidate('artists', 'shows', f'artist:{artist_id}',
+    *[f'venue:{venue_id}' for venue_id, in venue_ids])
+
+def refresh_matches(kind, id):
+  '''Rescore the recommendations of a just committed venue or artist. The
+  pages whose lists changed are invalidated once that is done.'''
+  try:
+    matches.refresh_later(kind, id)
+  except Exception:
+    current_app.logger.exception('refreshing the matches of %s %s failed', kind, id)
 
-app.jinja_env.filters['datetime'] = format_datetime
+def invalidate_shows(venue_id, artist_id):
+  response_cache.invalidate('shows', 'venues', f'venue:{venue_id}', f'artist:{artist_id}')
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
-@app.route('/')
+@main.route('/')
 def index():
   return render_template('pages/home.html')
 
@@ -115,91 +501,68 @@ def index():
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+@main.route('/venues')
+@response_cache.cached(lambda: ['venues'])
 def venues():
-  raw_data = Venue.query.all()
-  temp_data = []
-  for row in raw_data:
-    temp_data.append({"city": row.city, "state": row.state, "venues": [{"id": row.id, "name": row.name}]})
+  data, page = venue_areas()
+  return render_template('pages/venues.html', areas=data, page=page)
 
-  data = []
-  for venue in temp_data:
-    if(len(data) == 0):
-      venue['venues'][0]['num_upcoming_shows'] = 0
-      data.append(venue)
-    else:
-      i = 0
-      inserted = False
-      for row in data:
-        if (venue['city'] == row['city']) and (venue['state'] == row['state']):
-          venue['venues'][0]['num_upcoming_shows'] = len(row['venues'])
-          data[i]['venues'].append(venue['venues'][0])
-          inserted = True
-        i += 1
-      if inserted == False:
-        venue['venues'][0]['num_upcoming_shows'] = 0
-        data.append(venue)
-
-  return render_template('pages/venues.html', areas=data);
-
-@app.route('/venues/search', methods=['POST'])
+@main.route('/venues/search', methods=['POST'])
 def search_venues():
-  search_term = request.form.get('search_term', '')
-  venues = Venue.query.filter(Venue.name.ilike(f'%{search_term}%'))
-  response = {}
-  response['data'] = []
-  i = 1
-  for venue in venues:
-    response['count'] = i
-    response['data'].append({'id': venue.id, 'name': venue.name})
-    i += 1
+  response = search_results(Venue, request.form.get('search_term', ''), request.form.get('genre'))
 
   return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
-@app.route('/venues/<int:venue_id>')
+@main.route('/venues/<int:venue_id>')
+@response_cache.cached(lambda venue_id: [f'venue:{venue_id}', 'matches'])
 def show_venue(venue_id):
-  venue = Venue.query.get(venue_id)
-  shows = Show.query.filter_by(venue_id=venue_id).all()
-  past_shows = []
-  upcoming_shows = []
-  for show in shows:
-    if show.start_time.date() > date.today():
-      upcoming_shows.append({"artist_id": show.artist_id, "artist_name": show.artist.name, 
-        "artist_image_link": show.artist.image_link, "start_time" :str(show.start_time)})
-    else:
-      past_shows.append({"artist_id": show.artist_id, "artist_name": show.artist.name, 
-        "artist_image_link": show.artist.image_link, "start_time" :str(show.start_time)})
-
-  data = {    
-    "id": venue.id,
-    "name": venue.name,
-    "genres": venue.genres[1:-1].split(','),
-    "address": venue.address,
-    "city": venue.city,
-    "state": venue.state,
-    "phone": venue.phone,
-    "website": venue.website,
-    "facebook_link": venue.facebook_link,
-    "seeking_talent": venue.seeking_talent,
-    "seeking_description": venue.seeking_description,
-    "image_link": venue.image_link,
-    "past_shows": past_shows,
-    "upcoming_shows": upcoming_shows,
-    "past_shows_count": len(past_shows),
-    "upcoming_shows_count": len(upcoming_shows)
-    }
-
+  data = venue_detail(venue_id)
   return render_template('pages/show_venue.html', venue=data)
 
+@main.route('/venues/nearby')
+def nearby_venues():
+  '''Venues within ?radius= km (default NEARBY_RADIUS_KM) of ?lat=&lng=,
+  nearest first, as JSON.'''
+  config = current_app.config
+  point = geo.parse_point(request.args.get('lat'), request.args.get('lng'))
+  radius = request.args.get('radius', config['NEARBY_RADIUS_KM'], type=float)
+  if point is None or not 0 < radius <= config['NEARBY_MAX_RADIUS_KM']:
+    return jsonify({'error': 400, 'message': 'lat and lng must be a valid point and radius '
+      f"between 0 and {config['NEARBY_MAX_RADIUS_KM']} km"}), 400
+  data = nearby_results(Venue, point[0], point[1], radius, config['NEARBY_LIMIT'])
+  return jsonify({'lat': point[0], 'lng': point[1], 'radius_km': radius,
+    'count': len(data), 'data': data})
+
+@main.route('/venues/<int:venue_id>/availability')
+def venue_availability(venue_id):
+  '''Booked and free intervals of the venue between ?from= (default now)
+  and ?to= (default a week later), as JSON.'''
+  try:
+    start = dateutil.parser.parse(request.args['from']).replace(tzinfo=None) \
+      if request.args.get('from') else datetime.now().replace(second=0, microsecond=0)
+    end = dateutil.parser.parse(request.args['to']).replace(tzinfo=None) \
+      if request.args.get('to') else start + timedelta(days=7)
+  except (ValueError, OverflowError):
+    return jsonify({'error': 400, 'message': 'from and to must be dates or times'}), 400
+  if not start < end <= start + timedelta(days=current_app.config['AVAILABILITY_MAX_DAYS']):
+    return jsonify({'error': 400, 'message': 'to must be after from, by at most '
+      f"{current_app.config['AVAILABILITY_MAX_DAYS']} days"}), 400
+  if db.session.query(Venue.id).filter(Venue.id == venue_id).scalar() is None:
+    return jsonify({'error': 404, 'message': 'Not found'}), 404
+  booked, free = bookings.availability(venue_id, start, end)
+  intervals = lambda pairs: [{'start': to_json(s), 'end': to_json(e)} for s, e in pairs]
+  return jsonify({'venue_id': venue_id, 'from': to_json(start), 'to': to_json(end),
+    'booked': intervals(booked), 'free': intervals(free)})
+
 #  Create Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@main.route('/venues/create', methods=['GET'])
 def create_venue_form():
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
 
-@app.route('/venues/create', methods=['POST'])
+@main.route('/venues/create', methods=['POST'])
 def create_venue_submission():
   form = VenueForm(request.form)
   if form.validate_on_submit():
@@ -209,13 +572,19 @@ def create_venue_submission():
                     state=request.form['state'],
                     address=request.form['address'], 
                     phone=request.form['phone'], 
-                    genres=request.form.getlist('genres'), 
-                    facebook_link=request.form['facebook_link'])
+                    genres=genres_from_names(request.form.getlist('genres')), 
+                    facebook_link=request.form['facebook_link'],
+                    **geo.location(request.form['city'], request.form['state']))
       db.session.add(venue)
+      db.session.flush()
+      venue_id, located = venue.id, venue.geohash is not None
       db.session.commit()
+      response_cache.invalidate('venues', *(['venue-locations'] if located else []))
+      autocomplete.set('venue', venue_id, request.form['name'])
+      refresh_matches('venue', venue_id)
       flash('Venue ' + request.form['name'] + ' was successfully listed!')
     except:
-      flash('An error occurred. Venue ' + data.name + ' could not be listed.')
+      flash('An error occurred. Venue ' + request.form['name'] + ' could not be listed.')
       db.session.rollback()
     finally:
       db.session.close()
@@ -225,147 +594,182 @@ def create_venue_submission():
     return render_template('forms/new_venue.html', form=form)
 
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@main.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
+  venue = Venue.query.get(venue_id)
+  if venue is None:
+    abort(404)
+  error = False
   try:
-    venue = Venue.query.get(venue_id) 
-    db.session.delete(venue) 
+    artist_ids = [artist_id for artist_id, in
+      db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()]
+    tags = venue_tags(venue.id, moved=venue.geohash is not None, artist_ids=artist_ids)
+    version = venue.version_id
+    # The venue's shows go with it via ON DELETE CASCADE, so their artists
+    # are recounted once the delete is flushed.
+    db.session.delete(venue)
+    db.session.flush()
+    counters.refresh(Artist, artist_ids)
     db.session.commit()
-  except:
+    # Only now: a request served before the commit would cache the
+    # venue again.
+    response_cache.invalidate(*tags)
+    autocomplete.remove('venue', venue_id, version)
+  except Exception:
+    error = True
     db.session.rollback()
   finally:
     db.session.close()
-  return None
+  if error:
+    abort(500)
+  return jsonify({'success': True})
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@main.route('/artists')
+@response_cache.cached(lambda: ['artists'])
 def artists():
-  artists = Artist.query.all()
-  data = []
-  for artist in artists:
-    data.append({"id": artist.id, "name": artist.name})
-  return render_template('pages/artists.html', artists=data)
+  data, page = artist_list()
+  return render_template('pages/artists.html', artists=data, page=page)
 
-@app.route('/artists/search', methods=['POST'])
+@main.route('/artists/search', methods=['POST'])
 def search_artists():
-  search_term = request.form.get('search_term', '')
-  artists = Artist.query.filter(Artist.name.ilike(f'%{search_term}%'))
-  response = {}
-  response['data'] = []
-  i = 1
-  for artist in artists:
-    response['count'] = i
-    response['data'].append({'id': artist.id, 'name': artist.name})
-    i += 1
+  response = search_results(Artist, request.form.get('search_term', ''), request.form.get('genre'))
 
   return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
-@app.route('/artists/<int:artist_id>')
+@main.route('/artists/<int:artist_id>')
+@response_cache.cached(lambda artist_id: [f'artist:{artist_id}', 'venue-locations', 'matches'])
 def show_artist(artist_id):
-  artist = Artist.query.get(artist_id)
-  shows = Show.query.filter_by(artist_id=artist_id).all()
-  past_shows = []
-  upcoming_shows = []
-  for show in shows:
-    if show.start_time.date() > date.today():
-      upcoming_shows.append({"venue_id": show.venue_id, "venue_name": show.venue.name, 
-        "venue_image_link": show.venue.image_link, "start_time" :str(show.start_time)})
-    else:
-      past_shows.append({"venue_id": show.venue_id, "venue_name": show.venue.name, 
-        "venue_image_link": show.venue.image_link, "start_time" :str(show.start_time)})
-
-  data = {    
-    "id": artist.id,
-    "name": artist.name,
-    "genres": artist.genres[1:-1].split(','),
-    "city": artist.city,
-    "state": artist.state,
-    "phone": artist.phone,
-    "website": artist.website,
-    "facebook_link": artist.facebook_link,
-    "seeking_venue": artist.seeking_venue,
-    "seeking_description": artist.seeking_description,
-    "image_link": artist.image_link,
-    "past_shows": past_shows,
-    "upcoming_shows": upcoming_shows,
-    "past_shows_count": len(past_shows),
-    "upcoming_shows_count": len(upcoming_shows)
-    }
-
+  data = artist_detail(artist_id)
   return render_template('pages/show_artist.html', artist=data)
 
 #  Update
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+
+# Edits are optimistic: the form carries the version_id the editor started
+# from, and the update only applies if the row still has it. A conflicting
+# edit gets a 409 listing the editor's values next to the current ones, with
+# the form rebased on the current version, so submitting it again overwrites
+# knowingly rather than silently.
+EDITABLE_FIELDS = {
+  Venue: ('name', 'city', 'state', 'address', 'phone', 'genres', 'facebook_link'),
+  Artist: ('name', 'city', 'state', 'phone', 'genres', 'facebook_link'),
+}
+
+def editable_values(entity):
+  values = {field: getattr(entity, field) for field in EDITABLE_FIELDS[type(entity)]}
+  values['genres'] = [genre.name for genre in entity.genres]
+  return values
+
+def edit_form(form_class, entity):
+  '''The edit form for entity, filled in with its current values.'''
+  form = form_class(data=editable_values(entity))
+  form.version_id.data = entity.version_id
+  return form
+
+def differs(submitted, current):
+  if isinstance(current, list):
+    return sorted(submitted or []) != sorted(current)
+  # An empty form field stands for NULL
+  return (submitted or None) != (current or None)
+
+def edit_conflict(template, form, entity):
+  '''409 page for an edit made against an older version of entity.'''
+  current = editable_values(entity)
+  conflict = [(field, form[field].data, current[field])
+    for field in EDITABLE_FIELDS[type(entity)] if differs(form[field].data, current[field])]
+  # Rendered from raw_data when there is any, i.e. the submitted version
+  form.version_id.raw_data = None
+  form.version_id.data = entity.version_id
+  context = {type(entity).__name__.lower(): entity}
+  return render_template(template, form=form, conflict=conflict, **context), 409
+
+def save_edit(entity, form, template, invalidate):
+  '''Apply a validated edit form to entity and commit, unless entity has
+  changed since the version the form was filled in from.'''
+  model, entity_id, previous_version = type(entity), entity.id, entity.version_id
+  kind = model.__name__
+  if form.version_id.data != entity.version_id:
+    return edit_conflict(template, form, entity)
+  try:
+    # One flush, so the version is bumped once
+    with db.session.no_autoflush:
+      relocate = (entity.city, entity.state) != (form.city.data, form.state.data)
+      point = (entity.latitude, entity.longitude)
+      for field in EDITABLE_FIELDS[model]:
+        if field == 'genres':
+          if differs(form.genres.data, [genre.name for genre in entity.genres]):
+            entity.genres = genres_from_names(form.genres.data)
+            # Genres live in the association table: make the flush
+            # UPDATE the row too, so the version check covers them.
+            flag_modified(entity, 'name')
+        else:
+          setattr(entity, field, form[field].data)
+      if relocate:
+        for column, value in geo.location(entity.city, entity.state).items():
+          setattr(entity, column, value)
+      moved = (entity.latitude, entity.longitude) != point
+    db.session.flush()
+    version = entity.version_id
+    db.session.commit()
+  except StaleDataError:
+    # Another edit was committed between our read and our update.
+    db.session.rollback()
+    return edit_conflict(template, form, model.query.get_or_404(entity_id))
+  except Exception:
+    db.session.rollback()
+    flash(f'An error occurred. {kind} {form.name.data} could not be updated.')
+  else:
+    invalidate(entity_id, moved=moved)
+    autocomplete.set(kind.lower(), entity_id, form.name.data, version, previous_version)
+    refresh_matches(kind.lower(), entity_id)
+    flash(f'{kind} {form.name.data} was successfully updated!')
+  finally:
+    db.session.close()
+  return redirect(url_for(f'main.show_{kind.lower()}', **{f'{kind.lower()}_id': entity_id}))
+
+@main.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
-  form = ArtistForm()
-  artist = Artist.query.get(artist_id)
+  artist = Artist.query.get_or_404(artist_id)
+  form = edit_form(EditArtistForm, artist)
   return render_template('forms/edit_artist.html', form=form, artist=artist)
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@main.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
-  artist = Artist.query.get(artist_id)
-  form = ArtistForm(request.form)
+  artist = Artist.query.get_or_404(artist_id)
+  form = EditArtistForm(request.form)
   if form.validate_on_submit():
-    try:
-      artist.name = request.form['name']
-      artist.city = request.form['city']
-      artist.state = request.form['state']
-      artist.phone = request.form['phone']
-      artist.genres = request.form.getlist('genres')
-      artist.facebook_link = request.form['facebook_link']
-      db.session.commit()
-      flash('Artist ' + request.form['name'] + ' was successfully updated!')
-    except Exception:
-      flash('An error occurred. Artist ' + request.form['name'] + ' could not be updated.')
-      db.session.rollback()
-    finally:
-      db.session.close()
-      return redirect(url_for('show_artist', artist_id=artist_id))
+    return save_edit(artist, form, 'forms/edit_artist.html', invalidate_artist)
   else:
     flash(f'Failed due to the following validation error(s) : {form.errors}')
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@main.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
-  form = VenueForm()
-  venue = Venue.query.get(venue_id)
+  venue = Venue.query.get_or_404(venue_id)
+  form = edit_form(EditVenueForm, venue)
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@main.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
-  venue = Venue.query.get(venue_id)
-  form = VenueForm(request.form)
+  venue = Venue.query.get_or_404(venue_id)
+  form = EditVenueForm(request.form)
   if form.validate_on_submit():
-    try:
-      venue.name = request.form['name']
-      venue.city = request.form['city']
-      venue.state = request.form['state']
-      venue.phone = request.form['phone']
-      venue.genres = request.form.getlist('genres')
-      venue.facebook_link = request.form['facebook_link']
-      db.session.commit()
-      flash('Venue ' + request.form['name'] + ' was successfully updated!')
-    except Exception:
-      flash('An error occurred. Venue ' + request.form['name'] + ' could not be updated.')
-      db.session.rollback()
-    finally:
-      db.session.close()
-      return redirect(url_for('show_venue', venue_id=venue_id))
+    return save_edit(venue, form, 'forms/edit_venue.html', invalidate_venue)
   else:
     flash(f'Failed due to the following validation error(s) : {form.errors}')
-    return render_template('forms/edit_venue.html', form=form, venue_id=venue_id)
+    return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
+@main.route('/artists/create', methods=['GET'])
 def create_artist_form():
   form = ArtistForm()
   return render_template('forms/new_artist.html', form=form)
 
-@app.route('/artists/create', methods=['POST'])
+@main.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   form = ArtistForm(request.form)
   if form.validate_on_submit():
@@ -374,10 +778,16 @@ def create_artist_submission():
                       city=request.form['city'], 
                       state=request.form['state'],
                       phone=request.form['phone'], 
-                      genres=request.form.getlist('genres'), 
-                      facebook_link=request.form['facebook_link'])
+                      genres=genres_from_names(request.form.getlist('genres')), 
+                      facebook_link=request.form['facebook_link'],
+                      **geo.location(request.form['city'], request.form['state']))
       db.session.add(artist)
+      db.session.flush()
+      artist_id = artist.id
       db.session.commit()
+      response_cache.invalidate('artists')
+      autocomplete.set('artist', artist_id, request.form['name'])
+      refresh_matches('artist', artist_id)
       flash('Artist ' + request.form['name'] + ' was successfully listed!')
     except Exception as e:
       flash('An error occurred. Artist ' + request.form['name'] + ' could not be listed.')
@@ -393,55 +803,186 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+@main.route('/shows')
+@response_cache.cached(lambda: ['shows'])
 def shows():
-  shows = Show.query.all()
-  data = []
-  for show in shows:
-    data.append({'venue_id': show.venue_id, 'venue_name': show.venue.name, 'artist_id': show.artist_id, 
-      'artist_name': show.artist.name, 'artist_image_link': show.artist.image_link, 'start_time': str(show.start_time)})
-
-  return render_template('pages/shows.html', shows=data)
+  data, page = show_list()
+  return render_template('pages/shows.html', shows=data, page=page)
 
-@app.route('/shows/create')
+@main.route('/shows/create')
 def create_shows():
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
-@app.route('/shows/create', methods=['POST'])
+def booking_conflict(form, venue_id, taken, shown=5):
+  '''409 page for new shows clashing with the existing shows taken.'''
+  for show_id, show_venue_id, _, start_time, end_time in taken[:shown]:
+    booked = 'The venue' if show_venue_id == venue_id else 'The artist'
+    flash(f'{booked} is already booked from {format_datetime(start_time)} to '
+      f'{format_datetime(end_time)} (show {show_id}).')
+  if len(taken) > shown:
+    flash(f'{len(taken) - shown} more shows clash.')
+  return render_template('forms/new_show.html', form=form), 409
+
+@main.route('/shows/create', methods=['POST'])
 def create_show_submission():
-  try:
-    show = Show(venue_id=request.form['venue_id'], artist_id=request.form['artist_id'], 
-      start_time=request.form['start_time'])
-    db.session.add(show)
-    db.session.commit()
-    flash('Show was successfully listed!')
-  except Exception as e:
-    flash('An error occurred. Show could not be listed.')
-    db.session.rollback()
-  finally:
-    db.session.close()
+  form = ShowForm(request.form)
+  if form.validate_on_submit():
+    venue_id, artist_id = int(form.venue_id.data), int(form.artist_id.data)
+    intervals = form.bookings()
+    taken = bookings.clashes(venue_id, artist_id, intervals)
+    if taken:
+      return booking_conflict(form, venue_id, taken)
+    try:
+      # Every occurrence in one multi-row INSERT, counted in the same transaction
+      db.session.execute(Show.__table__.insert().values([
+        {'venue_id': venue_id, 'artist_id': artist_id, 'start_time': start, 'end_time': end}
+        for start, end in intervals]))
+      counters.shows_added(venue_id, artist_id, [start for start, end in intervals])
+      db.session.commit()
+      invalidate_shows(venue_id, artist_id)
+      if len(intervals) == 1:
+        flash('Show was successfully listed!')
+      else:
+        flash(f'{len(intervals)} shows were successfully listed!')
+    except IntegrityError as e:
+      db.session.rollback()
+      if bookings.is_clash(e):
+        # Booked by someone else since the check above
+        return booking_conflict(form, venue_id, bookings.clashes(venue_id, artist_id, intervals))
+      flash('An error occurred. Show could not be listed.')
+    except Exception as e:
+      flash('An error occurred. Show could not be listed.')
+      db.session.rollback()
+    finally:
+      db.session.close()
 
-  return render_template('pages/home.html')
+    return render_template('pages/home.html')
+  else:
+    flash(f'Failed due to the following validation error(s) : {form.errors}')
+    return render_template('forms/new_show.html', form=form)
 
-@app.errorhandler(404)
+#  API
+#  ----------------------------------------------------------------
+
+def to_json(value):
+  if isinstance(value, datetime):
+    return value.isoformat()
+  raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+def api_view(tags):
+  '''JSON counterpart of response_cache.cached. The compact body is cached
+  under the same tags as the HTML page and served with a strong ETag (hash
+  of the body), so a matching If-None-Match costs one cache lookup and an
+  empty 304.'''
+  def decorator(view):
+    @response_cache.cached(tags)
+    @wraps(view)
+    def body(**kwargs):
+      return json.dumps(view(**kwargs), separators=(',', ':'), default=to_json)
+
+    @wraps(view)
+    def wrapper(**kwargs):
+      data = body(**kwargs)
+      response = Response(data, mimetype='application/json')
+      response.set_etag(hashlib.sha1(data.encode()).hexdigest())
+      return response.make_conditional(request)
+    return wrapper
+  return decorator
+
+@main.route('/api/v1/venues')
+@api_view(lambda: ['venues'])
+def api_venues():
+  data, page = venue_areas()
+  return {'areas': data, 'next': page.next_url, 'prev': page.prev_url}
+
+@main.route('/api/v1/venues/search')
+@api_view(lambda: ['venues'])
+def api_search_venues():
+  return search_results(Venue, request.args.get('search_term', ''), request.args.get('genre'))
+
+@main.route('/api/v1/venues/<int:venue_id>')
+@api_view(lambda venue_id: [f'venue:{venue_id}', 'matches'])
+def api_venue(venue_id):
+  return venue_detail(venue_id)
+
+@main.route('/api/v1/artists')
+@api_view(lambda: ['artists'])
+def api_artists():
+  data, page = artist_list()
+  return {'artists': data, 'next': page.next_url, 'prev': page.prev_url}
+
+@main.route('/api/v1/artists/search')
+@api_view(lambda: ['artists'])
+def api_search_artists():
+  return search_results(Artist, request.args.get('search_term', ''), request.args.get('genre'))
+
+@main.route('/api/v1/artists/<int:artist_id>')
+@api_view(lambda artist_id: [f'artist:{artist_id}', 'venue-locations', 'matches'])
+def api_artist(artist_id):
+  return artist_detail(artist_id)
+
+def autocomplete_results(kind):
+  '''Names of kind starting with ?q= (or with a word starting with it).'''
+  limit = request.args.get('limit', type=int)
+  matches = autocomplete.lookup(kind, request.args.get('q', ''), limit)
+  return jsonify({'data': [{'id': id, 'name': name} for id, name in matches]})
+
+@main.route('/api/v1/venues/autocomplete')
+def api_autocomplete_venues():
+  return autocomplete_results('venue')
+
+@main.route('/api/v1/artists/autocomplete')
+def api_autocomplete_artists():
+  return autocomplete_results('artist')
+
+@main.route('/api/v1/shows')
+@api_view(lambda: ['shows'])
+def api_shows():
+  data, page = show_list()
+  return {'shows': data, 'next': page.next_url, 'prev': page.prev_url}
+
+#  Monitoring
+#  ----------------------------------------------------------------
+
+@main.route('/cache/stats')
+def cache_stats():
+  return jsonify(response_cache.stats())
+
+@main.route('/db/pool/stats')
+def pool_stats():
+  pool = db.engine.pool
+  stats = {'pool': type(pool).__name__}
+  if isinstance(pool, QueuePool):
+    stats.update(size=pool.size(), checked_in=pool.checkedin(),
+      checked_out=pool.checkedout(), overflow=max(pool.overflow(), 0),
+      max_overflow=current_app.config['DB_MAX_OVERFLOW'])
+  return jsonify(stats)
+
+@main.app_errorhandler(404)
 def not_found_error(error):
+    if request.path.startswith('/api/'):
+        return jsonify({'error': 404, 'message': 'Not found'}), 404
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
+@main.app_errorhandler(500)
 def server_error(error):
+    if request.path.startswith('/api/'):
+        return jsonify({'error': 500, 'message': 'Internal server error'}), 500
     return render_template('errors/500.html'), 500
 
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+from catalog import catalog
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+@click.command('create-db')
+@with_appcontext
+def create_db():
+  '''Create every table straight from the models. Meant for throwaway local
+  SQLite databases; everywhere else run `flask db upgrade`.'''
+  db.create_all()
 
 #----------------------------------------------------------------------------#
 # Launch.
@@ -449,11 +990,11 @@ if not app.debug:
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
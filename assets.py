@@ -0,0 +1,277 @@
+"""Static asset pipeline: bundles, fingerprints and pre-compresses the files
+under static/, and serves the result with far-future caching.
+
+    flask assets build
+
+concatenates and minifies each bundle in BUNDLES, copies every other static
+file, names each output after a hash of its content (main.3f2a9c1b.css),
+writes .gz and, when the brotli package is installed, .br variants next to
+it, and records the names in static/dist/manifest.json. Run it as part of
+every deploy, before the workers start.
+
+Templates link assets with asset_url('main.css') or
+asset_url('img/front-splash.jpg'). With a manifest, that is the
+fingerprinted file under /assets/, served with
+`Cache-Control: immutable` and the best pre-compressed variant the client
+accepts: a changed file gets a new name, so it never needs revalidating.
+Without one (development, or a deploy that skipped the build) bundles are
+concatenated from their sources on each request and other files come from
+/static as usual.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+
+import click
+from flask import Response, abort, current_app, request, send_from_directory, url_for
+from flask.cli import AppGroup
+from werkzeug.security import safe_join
+
+assets = AppGroup('assets', help='Build the fingerprinted static assets.')
+
+# Bundle name -> source files, relative to the static folder, in load order.
+BUNDLES = {
+    'main.css': [
+        'css/bootstrap.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    # Feature detection has to run before the page renders.
+    'head.js': [
+        'js/libs/modernizr-2.8.2.min.js',
+    ],
+    'main.js': [
+        'js/libs/jquery-1.11.1.min.js',
+        'js/libs/bootstrap-3.1.1.min.js',
+        'js/libs/moment.min.js',
+        'js/script.js',
+        'js/plugins.js',
+    ],
+}
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+# Formats that are already compressed (images, woff) are not worth it.
+COMPRESSIBLE = ('.css', '.js', '.json', '.svg', '.ttf', '.otf', '.eot')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+SOURCE_MAP = re.compile(r'^\s*//[#@] sourceMappingURL=.*$', re.MULTILINE)
+
+
+def fingerprinted(name, content):
+    """name with a hash of content before its extension."""
+    root, ext = posixpath.splitext(name)
+    return f'{root}.{hashlib.sha1(content).hexdigest()[:8]}{ext}'
+
+
+def static_files(static_folder):
+    """Every file under static_folder except build output and source maps,
+    as '/'-separated relative paths."""
+    for directory, subdirs, files in os.walk(static_folder):
+        relative = os.path.relpath(directory, static_folder).replace(os.sep, '/')
+        if relative == '.':
+            subdirs[:] = [subdir for subdir in subdirs if subdir != DIST]
+            relative = ''
+        for filename in sorted(files):
+            if not filename.endswith('.map'):
+                yield posixpath.join(relative, filename)
+
+
+def read_source(static_folder, name):
+    with open(os.path.join(static_folder, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def rewrite_css_urls(css, source, resolve):
+    """Point the relative url()s of a stylesheet at source (e.g.
+    css/main.css) to resolve(path), path being relative to the static
+    folder: the bundle is served from somewhere else."""
+    def replace(match):
+        quote, target = match.groups()
+        if target.startswith(('data:', '/', '#')) or '://' in target:
+            return match.group(0)
+        path, _, suffix = target.partition('?')
+        path, hash_sep, fragment = path.partition('#')
+        path = posixpath.normpath(posixpath.join(posixpath.dirname(source), path))
+        url = resolve(path)
+        if suffix:
+            url += '?' + suffix
+        elif hash_sep:
+            url += '#' + fragment
+        return f'url({quote}{url}{quote})'
+    return CSS_URL.sub(replace, css)
+
+
+def bundle_source(static_folder, name, resolve, minify=False):
+    """The concatenated sources of bundle name."""
+    parts = []
+    for source in BUNDLES[name]:
+        text = read_source(static_folder, source)
+        if name.endswith('.css'):
+            text = rewrite_css_urls(text, source, resolve)
+        else:
+            text = SOURCE_MAP.sub('', text)
+        parts.append(text)
+    if name.endswith('.css'):
+        text = '\n'.join(parts)
+        if minify:
+            import rcssmin
+            text = rcssmin.cssmin(text)
+    else:
+        # A statement left unterminated by one file must not run into the next.
+        text = '\n;\n'.join(parts)
+        if minify:
+            import rjsmin
+            text = rjsmin.jsmin(text)
+    return text.encode('utf-8')
+
+
+def compress(path):
+    """Write path.gz and, with brotli available, path.br, keeping only
+    variants smaller than the original. Returns their sizes."""
+    with open(path, 'rb') as f:
+        content = f.read()
+    variants = {'gz': gzip.compress(content, 9, mtime=0)}
+    try:
+        import brotli
+    except ImportError:
+        pass
+    else:
+        variants['br'] = brotli.compress(content, quality=11)
+    sizes = {}
+    for suffix, compressed in variants.items():
+        if len(compressed) < len(content):
+            with open(f'{path}.{suffix}', 'wb') as f:
+                f.write(compressed)
+            sizes[suffix] = len(compressed)
+    return sizes
+
+
+def build(static_folder, minify=True, clean=False):
+    """Build into static_folder/dist. Returns {name: (output name, size,
+    compressed sizes)} for every asset.
+
+    Outputs of earlier builds are kept unless clean is set: pages rendered
+    (or cached) before a deploy still refer to them."""
+    out = os.path.join(static_folder, DIST)
+    if clean:
+        shutil.rmtree(out, ignore_errors=True)
+    manifest = {}
+    report = {}
+
+    def write(name, content):
+        output = fingerprinted(name, content)
+        path = os.path.join(out, *output.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        sizes = compress(path) if output.endswith(COMPRESSIBLE) else {}
+        manifest[name] = output
+        report[name] = (output, len(content), sizes)
+
+    # Plain files first, so bundled stylesheets can refer to their
+    # fingerprinted names.
+    for name in static_files(static_folder):
+        with open(os.path.join(static_folder, name), 'rb') as f:
+            write(name, f.read())
+    resolve = lambda path: ('/assets/' + manifest[path] if path in manifest  # noqa: E731
+                            else '/static/' + path)
+    for name in BUNDLES:
+        write(name, bundle_source(static_folder, name, resolve, minify))
+
+    with open(os.path.join(out, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return report
+
+
+class Assets(object):
+    """Serves the output of `flask assets build` and provides the
+    asset_url() template global.
+
+    Config:
+      ASSETS_MANIFEST  path of the manifest written by the build; None to
+                       always bundle from the sources (development)
+    """
+
+    def __init__(self, app=None):
+        self.manifest = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ASSETS_MANIFEST', os.path.join(app.static_folder, DIST, MANIFEST))
+        self.manifest = None
+        path = app.config['ASSETS_MANIFEST']
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.manifest = json.load(f)
+        elif path and not app.debug and not app.testing:
+            app.logger.warning('no asset manifest at %s, serving unbuilt assets; '
+                               'run `flask assets build`', path)
+        app.add_url_rule('/assets/<path:filename>', 'assets', self._serve)
+        app.add_template_global(self.url, 'asset_url')
+        app.extensions['assets'] = self
+
+    def url(self, name):
+        """URL of the static file or bundle name."""
+        if self.manifest and name in self.manifest:
+            return url_for('assets', filename=self.manifest[name])
+        if name in BUNDLES:
+            return url_for('assets', filename=name)
+        return url_for('static', filename=name)
+
+    def _serve(self, filename):
+        if self.manifest:
+            # Any build's output, not only the current manifest's: pages
+            # rendered before a deploy may still refer to older files.
+            if filename == MANIFEST or filename.endswith(('.gz', '.br')):
+                abort(404)
+            return self._send_built(filename)
+        if filename in BUNDLES:
+            resolve = lambda path: url_for('static', filename=path)  # noqa: E731
+            response = Response(bundle_source(current_app.static_folder, filename, resolve),
+                                mimetype=mimetypes.guess_type(filename)[0])
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        abort(404)
+
+    def _send_built(self, filename):
+        directory = os.path.join(current_app.static_folder, DIST)
+        path = safe_join(directory, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        encoding = None
+        if filename.endswith(COMPRESSIBLE):
+            for suffix, name in (('br', 'br'), ('gz', 'gzip')):
+                if request.accept_encodings[name] and os.path.isfile(f'{path}.{suffix}'):
+                    encoding = name
+                    filename = f'{filename}.{suffix}'
+                    break
+        response = send_from_directory(directory, filename, mimetype=mimetype, conditional=True)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = IMMUTABLE
+        return response
+
+
+@assets.command('build')
+@click.option('--no-minify', is_flag=True, help='Concatenate bundles without minifying them.')
+@click.option('--clean', is_flag=True, help='Delete the output of earlier builds first.')
+def build_command(no_minify, clean):
+    """Bundle, minify, fingerprint and compress the static files."""
+    report = build(current_app.static_folder, minify=not no_minify, clean=clean)
+    for name in BUNDLES:
+        output, size, sizes = report[name]
+        compressed = ', '.join(f'{suffix} {size}' for suffix, size in sizes.items())
+        click.echo(f'{output}: {size} bytes ({compressed})')
+    click.echo(f'{len(report)} assets written to {os.path.join(current_app.static_folder, DIST)}')
@@ -0,0 +1,293 @@
+"""Typeahead for venue and artist names, served from memory.
+
+Each worker keeps a PrefixIndex per kind: the normalised names in a sorted
+array, plus the tail of every name from each later word on, so "pet"
+finds "Guns N Petals". A lookup is two binary searches and a short scan,
+a few microseconds however many names there are, with no round trip to
+the database.
+
+The indexes are built on a background thread when the worker serves its
+first request, and updated in place when this worker creates, edits or
+deletes a venue or artist. Changes made by other workers (or by `flask
+catalog import`) are noticed from the table itself: at most every
+AUTOCOMPLETE_CHECK_SECONDS each worker reads its row count, highest id
+and sum of row versions, and rebuilds when they differ from what its
+index holds. That is one aggregate query per kind and interval, whatever
+the cache backend. Every ORM edit bumps a version, and ids are never
+reused (Postgres sequences only go up, and the SQLite tables are
+AUTOINCREMENT), so a create moves the highest id even right after a
+delete. The worker's own changes move the values its index holds by the
+same amounts, so they cost no rebuild; a rebuild runs in the background
+while lookups keep using the old index.
+"""
+import bisect
+import threading
+import time
+import unicodedata
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.pool import SingletonThreadPool, StaticPool
+
+
+def normalize(text):
+    """Case- and accent-insensitive form of text, whitespace collapsed."""
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.casefold().split())
+
+
+class PrefixIndex(object):
+    """Names by id, searchable by prefix. Matches at the start of the name
+    rank before matches at a later word; each group is alphabetical."""
+
+    def __init__(self, names=()):
+        self.names = {}
+        self._starts = []
+        self._words = []
+        self._lock = threading.Lock()
+        for id, name in names:
+            self._insert(id, name, sort=False)
+        self._starts.sort()
+        self._words.sort()
+
+    def __len__(self):
+        return len(self.names)
+
+    @staticmethod
+    def _keys(name):
+        key = normalize(name)
+        words = key.split(' ')
+        return key, [' '.join(words[i:]) for i in range(1, len(words))]
+
+    def _insert(self, id, name, sort=True):
+        self.names[id] = name
+        start, words = self._keys(name)
+        if sort:
+            bisect.insort(self._starts, (start, id))
+            for word in words:
+                bisect.insort(self._words, (word, id))
+        else:
+            self._starts.append((start, id))
+            self._words.extend((word, id) for word in words)
+
+    def _delete(self, id):
+        start, words = self._keys(self.names.pop(id))
+        for array, key in [(self._starts, start)] + [(self._words, word) for word in words]:
+            position = bisect.bisect_left(array, (key, id))
+            if position < len(array) and array[position] == (key, id):
+                del array[position]
+
+    def set(self, id, name):
+        """Add id, or rename it."""
+        with self._lock:
+            if id in self.names:
+                self._delete(id)
+            self._insert(id, name)
+
+    def remove(self, id):
+        with self._lock:
+            if id in self.names:
+                self._delete(id)
+
+    def lookup(self, prefix, limit=10):
+        """[(id, name)] of up to limit names matching prefix."""
+        prefix = normalize(prefix)
+        if not prefix or limit <= 0:
+            return []
+        found = []
+        seen = set()
+        with self._lock:
+            for array in (self._starts, self._words):
+                position = bisect.bisect_left(array, (prefix,))
+                while position < len(array) and len(found) < limit:
+                    key, id = array[position]
+                    if not key.startswith(prefix):
+                        break
+                    if id not in seen:
+                        seen.add(id)
+                        found.append((id, self.names[id]))
+                    position += 1
+        return found
+
+
+class Autocomplete(object):
+    """Keeps a PrefixIndex of venue and artist names per worker.
+
+    Config:
+      AUTOCOMPLETE_LIMIT          matches returned by default
+      AUTOCOMPLETE_MAX_LIMIT      most matches a caller may ask for
+      AUTOCOMPLETE_CHECK_SECONDS  how often to look in the database for
+                                  other workers' changes (0: on every
+                                  lookup)
+    """
+
+    def __init__(self, app=None):
+        # kind -> (index, signature it holds, when that was last checked)
+        self._indexes = {}
+        # kind -> Future of the running build, and the changes this worker
+        # made since it started
+        self._builds = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._builder = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('AUTOCOMPLETE_LIMIT', 10)
+        app.config.setdefault('AUTOCOMPLETE_MAX_LIMIT', 50)
+        app.config.setdefault('AUTOCOMPLETE_CHECK_SECONDS', 5)
+        self._indexes = {}
+        self._builds = {}
+        self._pending = {}
+        app.before_first_request(self.warm_up)
+        app.extensions['autocomplete'] = self
+
+    @staticmethod
+    def _models():
+        from models import Venue, Artist
+        return {'venue': Venue, 'artist': Artist}
+
+    @staticmethod
+    def _in_background():
+        """Whether builds can run on a thread of their own: not on a
+        database the thread could not share (in-memory SQLite)."""
+        from models import db
+        return not isinstance(db.engine.pool, (StaticPool, SingletonThreadPool))
+
+    def _signature(self, kind):
+        """(rows, highest id, sum of versions) of kind's table. Creates,
+        deletes and ORM edits (renames included) all change it."""
+        from models import db
+        model = self._models()[kind]
+        return tuple(db.session.query(func.count(model.id), func.max(model.id),
+                                      func.sum(model.version_id)).one())
+
+    def _build(self, kind):
+        from models import db
+        model = self._models()[kind]
+        try:
+            # Read the signature first: a change committed during the build
+            # then moves it again and triggers another rebuild.
+            signature = self._signature(kind)
+            index = PrefixIndex(db.session.query(model.id, model.name))
+        except Exception:
+            with self._lock:
+                self._builds.pop(kind, None)
+                self._pending.pop(kind, None)
+            raise
+        with self._lock:
+            # This worker's changes since the build started, which it may
+            # have read too early. The signature stays as read: if it
+            # missed them, the next check rebuilds.
+            for apply in self._pending.pop(kind, []):
+                apply(index)
+            self._indexes[kind] = (index, signature, time.monotonic())
+            self._builds.pop(kind, None)
+        return index
+
+    def _rebuild(self, kind):
+        """Future of a fresh index of kind: the build already running, or a
+        new one, on the background thread where the database allows."""
+        with self._lock:
+            build = self._builds.get(kind)
+            if build is not None:
+                return build
+            build = self._builds[kind] = Future()
+            self._pending[kind] = []
+        if not self._in_background():
+            try:
+                build.set_result(self._build(kind))
+            except Exception as e:
+                build.set_exception(e)
+            return build
+        app = current_app._get_current_object()
+
+        def run():
+            with app.app_context():
+                try:
+                    build.set_result(self._build(kind))
+                except Exception as e:
+                    app.logger.exception('building the %s autocomplete index failed', kind)
+                    build.set_exception(e)
+        with self._lock:
+            if self._builder is None:
+                self._builder = ThreadPoolExecutor(1, thread_name_prefix='autocomplete')
+        self._builder.submit(run)
+        return build
+
+    def warm_up(self):
+        """Start building every index, so lookups find them ready. Runs
+        before the first request; where builds cannot run in the
+        background, the first lookup builds instead."""
+        if self._in_background():
+            for kind in self._models():
+                self._rebuild(kind)
+
+    def index(self, kind):
+        """The PrefixIndex of kind ('venue' or 'artist'). A rebuild is
+        started when another worker changed the table; until it is done,
+        lookups use the current index."""
+        entry = self._indexes.get(kind)
+        if entry is None:
+            # Only while the warm-up is running
+            return self._rebuild(kind).result()
+        if time.monotonic() - entry[2] >= current_app.config['AUTOCOMPLETE_CHECK_SECONDS']:
+            signature = self._signature(kind)
+            with self._lock:
+                # Compared with the signature held now, which includes the
+                # changes this worker made meanwhile
+                entry = self._indexes[kind]
+                self._indexes[kind] = entry[:2] + (time.monotonic(),)
+            if signature != entry[1]:
+                self._rebuild(kind)
+        return entry[0]
+
+    def lookup(self, kind, prefix, limit=None):
+        if limit is None:
+            limit = current_app.config['AUTOCOMPLETE_LIMIT']
+        limit = min(limit, current_app.config['AUTOCOMPLETE_MAX_LIMIT'])
+        return self.index(kind).lookup(prefix, limit)
+
+    def _changed(self, kind, apply, bump):
+        """Apply a committed change to this worker's index, if built, and
+        move the signature it holds by bump(signature, index), so the
+        change costs no rebuild. A change another worker committed
+        meanwhile still leaves the table's signature different."""
+        with self._lock:
+            entry = self._indexes.get(kind)
+            if entry is not None:
+                index, signature, checked = entry
+                apply(index)
+                self._indexes[kind] = (index, bump(signature, index), checked)
+            if kind in self._pending:
+                self._pending[kind].append(apply)
+
+    def set(self, kind, id, name, version=1, previous_version=None):
+        """A venue or artist was created at version (previous_version
+        None), or edited from previous_version to version."""
+        def bump(signature, index):
+            count, highest, versions = signature
+            if previous_version is None:
+                return count + 1, max(highest or 0, id), (versions or 0) + version
+            return count, highest, (versions or 0) + version - previous_version
+        self._changed(kind, lambda index: index.set(id, name), bump)
+
+    def remove(self, kind, id, version):
+        """A venue or artist at version was deleted."""
+        def bump(signature, index):
+            count, highest, versions = signature
+            if count <= 1:
+                return 0, None, None
+            if id == highest:
+                highest = max(index.names, default=None)
+            return count - 1, highest, (versions or 0) - version
+        self._changed(kind, lambda index: index.remove(id), bump)
+
+    def invalidate(self, *kinds):
+        """Rebuild this worker's indexes of kinds, e.g. after a bulk load.
+        Other workers notice the new rows by themselves."""
+        for kind in kinds:
+            self._rebuild(kind)
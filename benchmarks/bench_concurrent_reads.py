@@ -0,0 +1,95 @@
+"""Detail pages with their queries run one after another vs concurrently.
+
+Seeds a throwaway database, then measures the venue and artist detail
+pages (HTML and JSON) with CONCURRENT_READS off and on: median latency
+through the test client, and throughput under the same concurrent load.
+
+    python benchmarks/bench_concurrent_reads.py [--shows 100k] [--latency-ms 2]
+        [--concurrency 8] [--duration 10] [--database-url URL]
+
+A local SQLite file has no network round trip to overlap, so --latency-ms
+adds a sleep before every statement to stand in for the distance to a
+Postgres server; pass a real --database-url to measure without it.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_routes import load, make_app, seed, volume  # noqa: E402
+
+
+def detail_routes(args):
+    venue = lambda rng: rng.randint(1, args.venues)  # noqa: E731
+    artist = lambda rng: rng.randint(1, args.artists)  # noqa: E731
+    return [
+        ('show_venue', 'GET', lambda rng: f'/venues/{venue(rng)}', None),
+        ('show_artist', 'GET', lambda rng: f'/artists/{artist(rng)}', None),
+        ('api_venue', 'GET', lambda rng: f'/api/v1/venues/{venue(rng)}', None),
+        ('api_artist', 'GET', lambda rng: f'/api/v1/artists/{artist(rng)}', None),
+    ]
+
+
+def median_latency(app, routes, samples):
+    client = app.test_client()
+    rng = random.Random(0)
+    latencies = []
+    for i in range(samples):
+        name, method, url, data = routes[i % len(routes)]
+        started = time.perf_counter()
+        client.open(url(rng), method=method)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return statistics.median(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shows', type=volume, default='100k')
+    parser.add_argument('--venues', type=volume)
+    parser.add_argument('--artists', type=volume)
+    parser.add_argument('--database-url')
+    parser.add_argument('--latency-ms', type=float, default=2.0)
+    parser.add_argument('--samples', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+    args.cache = False
+    args.venues = args.venues or max(10, args.shows // 100)
+    args.artists = args.artists or max(20, args.shows // 50)
+    if args.database_url is None:
+        args.database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+    app = make_app(args)
+    print(f'seeding {args.shows} shows into {args.database_url} ...')
+    seed(app, args)
+    if args.latency_ms:
+        delay = args.latency_ms / 1000
+        event.listen(Engine, 'before_cursor_execute', lambda *_: time.sleep(delay))
+        print(f'simulating {args.latency_ms} ms per statement')
+
+    routes = detail_routes(args)
+    results = {}
+    for concurrent in (False, True):
+        app.config['CONCURRENT_READS'] = concurrent
+        label = 'concurrent' if concurrent else 'sequential'
+        print(label)
+        latency = median_latency(app, routes, args.samples)
+        print(f'{"test client":>24}: p50 {latency:.2f} ms')
+        results[label] = (latency, load(app, routes, args.concurrency, args.duration))
+    (sequential_latency, sequential), (concurrent_latency, concurrent) = results.values()
+    print(f'p50 {sequential_latency:.2f} -> {concurrent_latency:.2f} ms, '
+          f'throughput {sequential["throughput_rps"]} -> {concurrent["throughput_rps"]} req/s '
+          f'({concurrent["throughput_rps"] / sequential["throughput_rps"]:.2f}x) '
+          f'at concurrency {args.concurrency}')
+
+
+if __name__ == '__main__':
+    main()
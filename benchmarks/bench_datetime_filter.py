@@ -0,0 +1,62 @@
+"""Microbenchmark for the `datetime` Jinja filter.
+
+Compares the original filter (stringified timestamps re-parsed with
+dateutil, pattern re-parsed by Babel on every call) with filters.py.
+
+    python benchmarks/bench_datetime_filter.py [--calls N] [--distinct N]
+"""
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from filters import format_datetime  # noqa: E402
+
+
+def format_datetime_before(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format)
+
+
+def per_call_us(func, values, calls):
+    n = len(values)
+    timer = timeit.Timer(lambda: [func(values[i % n], 'full') for i in range(calls)])
+    return min(timer.repeat(repeat=3, number=1)) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--distinct', type=int, default=500,
+                        help='number of distinct timestamps rendered')
+    args = parser.parse_args()
+
+    start = datetime(2035, 4, 1, 20, 0)
+    values = [start + timedelta(hours=i) for i in range(args.distinct)]
+    strings = [str(value) for value in values]
+    assert format_datetime(values[0], 'full') == format_datetime_before(strings[0], 'full')
+
+    before = per_call_us(format_datetime_before, strings, args.calls)
+    format_datetime.cache_clear()
+    after_cold = per_call_us(lambda v, f: format_datetime.__wrapped__(v, f), values, args.calls)
+    after = per_call_us(format_datetime, values, args.calls)
+
+    print(f'{args.calls} calls over {args.distinct} distinct timestamps')
+    print(f'before (str + dateutil + babel):  {before:8.2f} us/call')
+    print(f'after, memo disabled:             {after_cold:8.2f} us/call')
+    print(f'after, memoized:                  {after:8.2f} us/call')
+    print(f'speedup: {before / after_cold:.1f}x compiled, {before / after:.1f}x memoized')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,330 @@
+"""Latency, throughput and queries per request for every route.
+
+Seeds a throwaway database through `flask catalog generate/import`, then:
+
+1. drives every route once per sample through the Flask test client and
+   records p50/p95/p99 latency and the number of SQL statements (read from
+   the Server-Timing header),
+2. runs a concurrent load test against a threaded server with a mix of the
+   read routes and records throughput and latency percentiles.
+
+    python benchmarks/bench_routes.py [--shows 1k|100k|1m] [--database-url URL]
+        [--samples 100] [--concurrency 8] [--duration 10] [--cache]
+        [--out results.json] [--baseline baseline.json] [--tolerance 0.25]
+
+Defaults to a temporary SQLite file; pass a throwaway Postgres URL (its
+tables are dropped and recreated) to measure there. With --baseline, exits
+non-zero when a route issues more queries than in the baseline or its p50
+grows by more than --tolerance (and 2 ms); a missing baseline file is
+written instead.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SERVER_TIMING_QUERIES = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+
+
+def volume(value):
+    value = value.lower()
+    scale = {'k': 1000, 'm': 1000000}.get(value[-1:], 1)
+    return int(float(value.rstrip('km')) * scale)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def summary(latencies):
+    latencies = [latency * 1000 for latency in latencies]
+    return {'p50_ms': round(statistics.median(latencies), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'mean_ms': round(statistics.mean(latencies), 3)}
+
+
+def make_app(args):
+    from app import create_app
+    from config import TestingConfig
+
+    class BenchmarkConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = args.database_url
+        CACHE_TYPE = 'lru' if args.cache else 'null'
+        SERVER_TIMING = True
+        SLOW_QUERY_THRESHOLD_MS = 0
+
+    return create_app(BenchmarkConfig)
+
+
+def seed(app, args):
+    from models import db
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    data = tempfile.mkdtemp()
+    runner = app.test_cli_runner()
+    for command in (
+            ['catalog', 'generate', '--venues', str(args.venues), '--artists', str(args.artists),
+             '--shows', str(args.shows), '--out', data],
+            ['catalog', 'import', '--venues', os.path.join(data, 'venues.jsonl'),
+             '--artists', os.path.join(data, 'artists.jsonl'),
+             '--shows', os.path.join(data, 'shows.jsonl'), '--chunk-size', '5000']):
+        result = runner.invoke(args=command)
+        if result.exit_code != 0:
+            raise SystemExit(result.output)
+
+
+def read_routes(args):
+    """(name, method, url factory, form data) for every read route."""
+    venue = lambda rng: rng.randint(1, args.venues)  # noqa: E731
+    artist = lambda rng: rng.randint(1, args.artists)  # noqa: E731
+    return [
+        ('index', 'GET', lambda rng: '/', None),
+        ('venues', 'GET', lambda rng: '/venues', None),
+        ('venues?genre', 'GET', lambda rng: '/venues?genre=Jazz', None),
+        ('show_venue', 'GET', lambda rng: f'/venues/{venue(rng)}', None),
+        ('search_venues', 'POST', lambda rng: '/venues/search', {'search_term': 'Venue 1'}),
+        ('nearby_venues', 'GET', lambda rng: '/venues/nearby?lat=37.77&lng=-122.42&radius=25', None),
+        ('venue_availability', 'GET',
+         lambda rng: f'/venues/{venue(rng)}/availability?from=2030-01-01&to=2030-03-01', None),
+        ('edit_venue', 'GET', lambda rng: f'/venues/{venue(rng)}/edit', None),
+        ('create_venue_form', 'GET', lambda rng: '/venues/create', None),
+        ('artists', 'GET', lambda rng: '/artists', None),
+        ('artists?genre', 'GET', lambda rng: '/artists?genre=Jazz', None),
+        ('show_artist', 'GET', lambda rng: f'/artists/{artist(rng)}', None),
+        ('search_artists', 'POST', lambda rng: '/artists/search', {'search_term': 'Artist 1'}),
+        ('edit_artist', 'GET', lambda rng: f'/artists/{artist(rng)}/edit', None),
+        ('create_artist_form', 'GET', lambda rng: '/artists/create', None),
+        ('shows', 'GET', lambda rng: '/shows', None),
+        ('shows?from', 'GET', lambda rng: '/shows?from=2030-01-01', None),
+        ('create_shows', 'GET', lambda rng: '/shows/create', None),
+        ('api_venues', 'GET', lambda rng: '/api/v1/venues', None),
+        ('api_venue', 'GET', lambda rng: f'/api/v1/venues/{venue(rng)}', None),
+        ('api_search_venues', 'GET', lambda rng: '/api/v1/venues/search?search_term=Venue%201', None),
+        ('api_artists', 'GET', lambda rng: '/api/v1/artists', None),
+        ('api_artist', 'GET', lambda rng: f'/api/v1/artists/{artist(rng)}', None),
+        ('api_search_artists', 'GET', lambda rng: '/api/v1/artists/search?search_term=Artist%201', None),
+        ('api_autocomplete_venues', 'GET', lambda rng: '/api/v1/venues/autocomplete?q=venue%201', None),
+        ('api_autocomplete_artists', 'GET', lambda rng: '/api/v1/artists/autocomplete?q=artist%202', None),
+        ('api_shows', 'GET', lambda rng: '/api/v1/shows', None),
+        ('cache_stats', 'GET', lambda rng: '/cache/stats', None),
+        ('pool_stats', 'GET', lambda rng: '/db/pool/stats', None),
+    ]
+
+
+def write_routes(app, args):
+    """Like read_routes, but the form data may also be a function of the
+    random generator."""
+    from models import db, Venue, Artist
+    entity = {'city': 'San Francisco', 'state': 'CA', 'phone': '415-555-0100', 'genres': 'Jazz',
+              'facebook_link': 'https://www.facebook.com/fyyur'}
+
+    def edit(model, count, values):
+        # Edits must carry the version they were made against.
+        def data(rng):
+            id = rng.randint(1, count)
+            with app.app_context():
+                version = db.session.query(model.version_id).filter(model.id == id).scalar()
+            return id, dict(values, version_id=version)
+        return data
+
+    edit_venue = edit(Venue, args.venues, dict(entity, name='Edited Venue', address='2 Main Street'))
+    edit_artist = edit(Artist, args.artists, dict(entity, name='Edited Artist'))
+    def show(rng):
+        # A fresh slot each time: a show at a taken one is rejected.
+        start_time = datetime.now() + timedelta(days=30, minutes=rng.randrange(60 * 24 * 365 * 50))
+        return {'venue_id': rng.randint(1, args.venues), 'artist_id': rng.randint(1, args.artists),
+                'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S')}
+
+    return [
+        ('create_venue', 'POST', lambda rng: '/venues/create',
+         dict(entity, name='Benchmark Venue', address='1 Main Street')),
+        ('create_artist', 'POST', lambda rng: '/artists/create', dict(entity, name='Benchmark Artist')),
+        ('create_show', 'POST', lambda rng: '/shows/create', show),
+        ('edit_venue_submission', 'POST', lambda rng: '/venues/{}/edit', edit_venue),
+        ('edit_artist_submission', 'POST', lambda rng: '/artists/{}/edit', edit_artist),
+    ]
+
+
+def request_args(rng, url, data):
+    """The URL and form data of one request to a route. Callable data
+    returns the form, or an (id, form) pair filling in the URL."""
+    if callable(data):
+        data = data(rng)
+        if isinstance(data, tuple):
+            id, data = data
+            return url(rng).format(id), data
+    return url(rng), data
+
+
+def drive(app, routes, samples):
+    client = app.test_client()
+    rng = random.Random(0)
+    results = {}
+    for name, method, url, data in routes:
+        latencies, queries, errors = [], [], 0
+        for i in range(samples + 3):
+            path, form = request_args(rng, url, data)
+            started = time.perf_counter()
+            response = client.open(path, method=method, data=form)
+            elapsed = time.perf_counter() - started
+            if i < 3:
+                continue  # warm-up: template compilation, first connection
+            latencies.append(elapsed)
+            errors += response.status_code >= 400
+            match = SERVER_TIMING_QUERIES.search(response.headers.get('Server-Timing', ''))
+            queries.append(int(match.group(1)) if match else 0)
+        results[name] = dict(summary(latencies), samples=samples, errors=errors,
+                             queries_per_request=round(statistics.mean(queries), 2))
+        print(f'{name:>24}: p50 {results[name]["p50_ms"]:8.2f} ms  p95 {results[name]["p95_ms"]:8.2f} ms'
+              f'  p99 {results[name]["p99_ms"]:8.2f} ms  queries {results[name]["queries_per_request"]:5.1f}'
+              f'{"  errors " + str(errors) if errors else ""}')
+    return results
+
+
+def load(app, routes, concurrency, duration):
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    deadline = time.perf_counter() + duration
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def worker(number):
+        rng = random.Random(number)
+        own = []
+        while time.perf_counter() < deadline:
+            name, method, url, data = rng.choice(routes)
+            path, form = request_args(rng, url, data)
+            connection = http.client.HTTPConnection('127.0.0.1', server.server_port, timeout=60)
+            body = None
+            headers = {}
+            if form:
+                body = '&'.join(f'{key}={value}' for key, value in form.items()).replace(' ', '+')
+                headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            started = time.perf_counter()
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            own.append(time.perf_counter() - started)
+            connection.close()
+            if response.status >= 400:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            latencies.extend(own)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+    result = dict(summary(latencies), concurrency=concurrency, duration_s=round(elapsed, 2),
+                  requests=len(latencies), errors=errors[0],
+                  throughput_rps=round(len(latencies) / elapsed, 1))
+    print(f'{"load":>24}: {result["requests"]} requests, {result["throughput_rps"]} req/s,'
+          f' p50 {result["p50_ms"]:.2f} ms  p95 {result["p95_ms"]:.2f} ms  p99 {result["p99_ms"]:.2f} ms'
+          f'{"  errors " + str(result["errors"]) if result["errors"] else ""}')
+    return result
+
+
+def regressions(results, baseline, tolerance):
+    problems = []
+    for name, current in results['routes'].items():
+        previous = baseline.get('routes', {}).get(name)
+        if previous is None:
+            continue
+        if current['queries_per_request'] > previous['queries_per_request']:
+            problems.append(f'{name}: {current["queries_per_request"]} queries per request,'
+                            f' was {previous["queries_per_request"]}')
+        # Sub-millisecond routes are mostly noise; require a real slowdown.
+        if current['p50_ms'] > max(previous['p50_ms'] * (1 + tolerance), previous['p50_ms'] + 2):
+            problems.append(f'{name}: p50 {current["p50_ms"]} ms, was {previous["p50_ms"]} ms')
+    return problems
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shows', type=volume, default='1k', help='1k, 100k, 1m or a number')
+    parser.add_argument('--venues', type=volume)
+    parser.add_argument('--artists', type=volume)
+    parser.add_argument('--database-url')
+    parser.add_argument('--samples', type=int, default=100, help='test client requests per route')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10, help='seconds of concurrent load')
+    parser.add_argument('--cache', action='store_true', help='enable the response cache')
+    parser.add_argument('--out', default=os.path.join('benchmarks', 'results',
+                                                       datetime.now().strftime('%Y%m%d-%H%M%S') + '.json'))
+    parser.add_argument('--baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+    args.venues = args.venues or max(10, args.shows // 100)
+    args.artists = args.artists or max(20, args.shows // 50)
+    if args.database_url is None:
+        args.database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+    app = make_app(args)
+    print(f'seeding {args.venues} venues, {args.artists} artists, {args.shows} shows'
+          f' into {args.database_url} ...')
+    started = time.perf_counter()
+    seed(app, args)
+    print(f'seeded in {time.perf_counter() - started:.1f} s')
+
+    results = {
+        'meta': {'revision': git_revision(), 'date': datetime.now().isoformat(timespec='seconds'),
+                 'python': platform.python_version(), 'database': args.database_url.split(':')[0],
+                 'venues': args.venues, 'artists': args.artists, 'shows': args.shows,
+                 'cache': args.cache, 'samples': args.samples},
+        'routes': drive(app, read_routes(args), args.samples),
+    }
+    results['routes'].update(drive(app, write_routes(app, args), max(1, args.samples // 10)))
+    results['load'] = load(app, read_routes(args), args.concurrency, args.duration)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'wrote {args.out}')
+
+    if args.baseline:
+        if not os.path.exists(args.baseline):
+            with open(args.baseline, 'w') as f:
+                json.dump(results, f, indent=2)
+            print(f'no baseline yet, wrote {args.baseline}')
+            return
+        with open(args.baseline) as f:
+            problems = regressions(results, json.load(f), args.tolerance)
+        for problem in problems:
+            print('REGRESSION', problem)
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
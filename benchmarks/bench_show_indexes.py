@@ -0,0 +1,116 @@
+"""Detail-page latency with and without the Show foreign key indexes.
+
+Seeds a throwaway database with N shows spread over venues and artists,
+then times the venue and artist detail pages (query only, and the full
+page through the Flask test client) with the (venue_id, start_time) and
+(artist_id, start_time) indexes dropped and then restored.
+
+    python benchmarks/bench_show_indexes.py [--shows 1000000] [--database-url URL]
+
+Defaults to a temporary SQLite file; pass a Postgres URL to measure there.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument('--shows', type=int, default=1000000)
+parser.add_argument('--venues', type=int, default=2000)
+parser.add_argument('--artists', type=int, default=10000)
+parser.add_argument('--samples', type=int, default=200)
+parser.add_argument('--batch', type=int, default=50000)
+parser.add_argument('--database-url')
+args = parser.parse_args()
+
+if args.database_url is None:
+    args.database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = args.database_url
+os.environ['CACHE_TYPE'] = 'null'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, show_rows, split_shows  # noqa: E402
+from models import db, Venue, Artist, Show  # noqa: E402
+
+app = create_app()
+
+INDEXES = [index for index in Show.__table__.indexes
+           if index.name in ('ix_Show_venue_id_start_time', 'ix_Show_artist_id_start_time')]
+
+
+def seed():
+    random.seed(0)
+    db.session.execute(Venue.__table__.insert(), [
+        {'name': f'Venue {i}', 'city': 'City', 'state': 'CA', 'address': f'{i} Main St'}
+        for i in range(1, args.venues + 1)])
+    db.session.execute(Artist.__table__.insert(), [
+        {'name': f'Artist {i}', 'city': 'City', 'state': 'CA'}
+        for i in range(1, args.artists + 1)])
+    start = datetime(2015, 1, 1)
+    for offset in range(0, args.shows, args.batch):
+        start_times = [start + timedelta(minutes=random.randint(0, 60 * 24 * 365 * 30))
+                       for _ in range(min(args.batch, args.shows - offset))]
+        # Only the index scans are measured: clashing bookings do not matter.
+        db.session.execute(Show.__table__.insert(), [
+            {'venue_id': random.randint(1, args.venues),
+             'artist_id': random.randint(1, args.artists),
+             'start_time': start_time, 'end_time': start_time + timedelta(hours=3)}
+            for start_time in start_times])
+    db.session.commit()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def measure(label):
+    client = app.test_client()
+    rng = random.Random(1)
+    results = {}
+    for kind, count in (('venue', args.venues), ('artist', args.artists)):
+        ids = [rng.randint(1, count) for _ in range(args.samples)]
+        query_ms, page_ms = [], []
+        for id in ids:
+            started = time.perf_counter()
+            if kind == 'venue':
+                split_shows(show_rows(db.session.query(Show.artist_id, Artist.name, Artist.image_link, Show.start_time)
+                            .join(Artist, Show.artist_id == Artist.id).filter(Show.venue_id == id)),
+                            ('artist_id', 'artist_name', 'artist_image_link', 'start_time'))
+            else:
+                split_shows(show_rows(db.session.query(Show.venue_id, Venue.name, Venue.image_link, Show.start_time)
+                            .join(Venue, Show.venue_id == Venue.id).filter(Show.artist_id == id)),
+                            ('venue_id', 'venue_name', 'venue_image_link', 'start_time'))
+            query_ms.append((time.perf_counter() - started) * 1000)
+            db.session.remove()
+            started = time.perf_counter()
+            client.get(f'/{kind}s/{id}')
+            page_ms.append((time.perf_counter() - started) * 1000)
+        results[kind] = (query_ms, page_ms)
+        print(f'{label:>16} {kind:>6}: query p50 {statistics.median(query_ms):8.2f} ms'
+              f'  p95 {percentile(query_ms, 0.95):8.2f} ms | page p50 {statistics.median(page_ms):8.2f} ms'
+              f'  p95 {percentile(page_ms, 0.95):8.2f} ms')
+    return results
+
+
+def main():
+    with app.app_context():
+        print(f'seeding {args.shows} shows into {args.database_url} ...')
+        started = time.perf_counter()
+        db.create_all()
+        seed()
+        print(f'seeded in {time.perf_counter() - started:.1f} s')
+        for index in INDEXES:
+            index.drop(db.engine)
+        measure('without indexes')
+        for index in INDEXES:
+            index.create(db.engine)
+        measure('with indexes')
+
+
+if __name__ == '__main__':
+    main()
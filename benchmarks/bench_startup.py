@@ -0,0 +1,77 @@
+"""Worker startup time: module import, app creation and the first requests.
+
+Every sample is a fresh interpreter, like a newly scheduled worker:
+
+    python benchmarks/bench_startup.py [--samples 20] [--database-url URL] [--root DIR]
+
+--root points at another checkout of the project to compare against (e.g.
+a `git worktree` of an older commit). Defaults to a temporary SQLite file
+with the schema already created, so only startup itself is measured.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import sys, time, json
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+import app as module
+imported = time.perf_counter()
+app = module.create_app() if hasattr(module, 'create_app') else module.app
+created = time.perf_counter()
+if {create_schema!r}:
+    # Older trees create the schema on import.
+    if hasattr(module, 'create_app'):
+        from models import db
+        with app.app_context():
+            db.create_all()
+    sys.exit()
+client = app.test_client()
+home = client.get('/').status_code
+first = time.perf_counter()
+venues = client.get('/venues').status_code
+queried = time.perf_counter()
+print(json.dumps({{'import': imported - started, 'create_app': created - imported,
+                  'first_request': first - created, 'first_query': queried - first,
+                  'status': [home, venues]}}))
+'''
+
+
+def run(args, create_schema=False):
+    env = dict(os.environ, DATABASE_URL=args.database_url, CACHE_TYPE='null')
+    code = CHILD.format(root=args.root, create_schema=create_schema)
+    output = subprocess.run([sys.executable, '-c', code], env=env, cwd=args.root,
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output) if output.strip() else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--samples', type=int, default=20)
+    parser.add_argument('--database-url')
+    parser.add_argument('--root', default=ROOT)
+    args = parser.parse_args()
+    if args.database_url is None:
+        args.database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+        run(args, create_schema=True)
+
+    samples = [run(args) for _ in range(args.samples)]
+    print(f'{args.samples} cold starts of {args.root} against {args.database_url}, '
+          f'status {samples[0]["status"]}')
+    for phase in ('import', 'create_app', 'first_request', 'first_query'):
+        values = [sample[phase] * 1000 for sample in samples]
+        print(f'{phase:>14}: p50 {statistics.median(values):8.1f} ms  max {max(values):8.1f} ms')
+    totals = [sum(sample[phase] for phase in ('import', 'create_app', 'first_request')) * 1000
+              for sample in samples]
+    print(f'{"ready to serve":>14}: p50 {statistics.median(totals):8.1f} ms  max {max(totals):8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Show bookings: a show occupies its venue and its artist over
+[start_time, end_time), and no venue or artist can be in two shows at once.
+
+On Postgres the database enforces this with exclusion constraints over
+tsrange(start_time, end_time) (see models.py), and overlap queries use their
+GiST indexes. Elsewhere (SQLite) overlaps are found by scanning the
+(owner, start_time) indexes from MAX_SHOW_DURATION before the window, which
+no show can exceed, and IntervalIndex settles them in memory.
+"""
+import bisect
+
+from sqlalchemy import and_, func, or_
+
+from models import db, Show, MAX_SHOW_DURATION
+
+
+class IntervalIndex(object):
+    """Half-open [start, end) intervals sorted by start, with the running
+    maximum of their ends. Intervals overlapping a window are found with two
+    binary searches: those starting before the window ends, after the last
+    one whose running maximum end is still before the window starts."""
+
+    def __init__(self, intervals=()):
+        self.intervals = sorted(intervals)
+        self._max_ends = []
+        self._reindex(0)
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def _reindex(self, position):
+        del self._max_ends[position:]
+        running = self._max_ends[-1] if self._max_ends else None
+        for start, end in self.intervals[position:]:
+            if running is None or end > running:
+                running = end
+            self._max_ends.append(running)
+
+    def add(self, start, end):
+        position = bisect.bisect_right(self.intervals, (start, end))
+        self.intervals.insert(position, (start, end))
+        self._reindex(position)
+
+    def overlapping(self, start, end):
+        """The intervals overlapping [start, end), by start."""
+        stop = bisect.bisect_left(self.intervals, (end,))
+        first = bisect.bisect_right(self._max_ends, start, 0, stop)
+        return [(s, e) for s, e in self.intervals[first:stop] if e > start]
+
+    def free(self, start, end):
+        """The gaps in [start, end) not covered by any interval."""
+        gaps = []
+        cursor = start
+        for s, e in self.overlapping(start, end):
+            if s > cursor:
+                gaps.append((cursor, s))
+            cursor = max(cursor, e)
+        if cursor < end:
+            gaps.append((cursor, end))
+        return gaps
+
+
+def during(start, end):
+    """Condition for shows overlapping [start, end)."""
+    if db.engine.dialect.name == 'postgresql':
+        return func.tsrange(Show.start_time, Show.end_time).op('&&')(func.tsrange(start, end))
+    return and_(Show.start_time > start - MAX_SHOW_DURATION, Show.start_time < end,
+                Show.end_time > start)
+
+
+def clashes(venue_id, artist_id, intervals):
+    """Existing shows of the venue or the artist overlapping any of
+    intervals, in one query probing the indexes once per interval."""
+    return db.session.query(Show.id, Show.venue_id, Show.artist_id, Show.start_time, Show.end_time) \
+        .filter(or_(Show.venue_id == venue_id, Show.artist_id == artist_id),
+                or_(*[during(start, end) for start, end in intervals])) \
+        .order_by(Show.start_time).all()
+
+
+def is_clash(error):
+    """Whether an IntegrityError is a booking exclusion constraint
+    violation: a clashing show committed after clashes() was checked."""
+    return getattr(error.orig, 'pgcode', None) == '23P01'
+
+
+def availability(venue_id, start, end):
+    """(booked, free) intervals of the venue within [start, end)."""
+    booked = db.session.query(Show.start_time, Show.end_time) \
+        .filter(Show.venue_id == venue_id, during(start, end))
+    index = IntervalIndex(booked)
+    return index.overlapping(start, end), index.free(start, end)
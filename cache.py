@@ -0,0 +1,206 @@
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, session
+
+
+class CacheBackend(object):
+    """Storage used by ResponseCache. Shared backends (e.g. Redis) let every
+    worker see the same entries and the same invalidations."""
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, timeout=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class NullCache(CacheBackend):
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, timeout=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+class LRUCache(CacheBackend):
+    """In-process least-recently-used cache with per-entry expiry."""
+
+    def __init__(self, max_entries=1024, default_timeout=300):
+        self.max_entries = max_entries
+        self.default_timeout = default_timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        timeout = self.default_timeout if timeout is None else timeout
+        expires = time.monotonic() + timeout if timeout else None
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCache(CacheBackend):
+    """Shared backend on top of a redis-py client (optional dependency)."""
+
+    def __init__(self, url, default_timeout=300, prefix='fyyur:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.default_timeout = default_timeout
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value, timeout=None):
+        timeout = self.default_timeout if timeout is None else timeout
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=timeout or None)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+class ResponseCache(object):
+    """Caches rendered pages keyed by endpoint and arguments.
+
+    Every cached page is tagged (e.g. 'venues', 'venue:3'). Each tag has a
+    generation token that is part of the cache key, so invalidating a tag
+    is a single write and stale entries simply stop being addressed. Tokens
+    are never reused, so a generation evicted from the backend cannot bring
+    an old page back."""
+
+    def __init__(self, app=None):
+        self.backend = NullCache()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # Counters are bumped by every request thread
+        self._stats_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        kind = app.config.get('CACHE_TYPE', 'lru')
+        timeout = app.config.get('CACHE_DEFAULT_TIMEOUT', 300)
+        if kind == 'lru':
+            self.backend = LRUCache(app.config.get('CACHE_MAX_ENTRIES', 1024), timeout)
+        elif kind == 'redis':
+            self.backend = RedisCache(app.config['CACHE_REDIS_URL'], timeout)
+        elif kind == 'null':
+            self.backend = NullCache()
+        else:
+            raise ValueError(f'Unknown CACHE_TYPE {kind!r}')
+        app.extensions['response_cache'] = self
+
+    def _generation(self, tag):
+        generation = self.backend.get('tag:' + tag)
+        if generation is None:
+            generation = self._new_generation(tag)
+        return generation
+
+    def _new_generation(self, tag):
+        generation = uuid.uuid4().hex[:12]
+        self.backend.set('tag:' + tag, generation, timeout=0)
+        return generation
+
+    def _key(self, tags):
+        args = '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+        generations = ','.join(f'{tag}@{self._generation(tag)}' for tag in tags)
+        return f'page:{request.endpoint}:{request.view_args}:{args}:{generations}'
+
+    def cached(self, tags):
+        """Cache a GET view's rendered output. tags is a function of the
+        view's keyword arguments returning the tags the page depends on."""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                # Pages carrying a one-off flash message are never shared.
+                if request.method != 'GET' or session.get('_flashes'):
+                    return view(**kwargs)
+                key = self._key(tags(**kwargs))
+                page = self.backend.get(key)
+                if page is not None:
+                    self._count(hits=1)
+                    return page
+                self._count(misses=1)
+                page = view(**kwargs)
+                if isinstance(page, str):
+                    self.backend.set(key, page)
+                return page
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self._new_generation(tag)
+        self._count(invalidations=len(tags))
+
+    def _count(self, hits=0, misses=0, invalidations=0):
+        with self._stats_lock:
+            self.hits += hits
+            self.misses += misses
+            self.invalidations += invalidations
+
+    def generation(self, tag):
+        """Token that changes whenever tag is invalidated, by any worker
+        sharing the backend."""
+        return self._generation(tag)
+
+    def stats(self):
+        with self._stats_lock:
+            hits, misses, invalidations = self.hits, self.misses, self.invalidations
+        lookups = hits + misses
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / lookups if lookups else 0.0,
+            'invalidations': invalidations,
+        }
@@ -0,0 +1,329 @@
+"""`flask catalog` commands for bulk loading venues, artists and shows.
+
+    flask catalog import --venues venues.jsonl --artists artists.csv --shows shows.jsonl
+    flask catalog generate --venues 10000 --artists 50000 --shows 1000000 --out data/synthetic
+
+Input files are CSV (header row) or JSON Lines, chosen by extension. Rows
+are validated with the same rules as VenueForm/ArtistForm/ShowForm and
+written in chunks with one multi-row INSERT (or COPY on Postgres) each.
+Venues and artists may carry latitude and longitude, or are located from
+the gazetteer (geo.py). Show rows may carry a duration in minutes; shows
+clashing with an earlier booking of their venue or artist are skipped.
+"""
+import csv
+import io
+import json
+import os
+import random
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import click
+import dateutil.parser
+from flask import current_app
+from flask.cli import AppGroup
+from werkzeug.datastructures import MultiDict
+
+import geo
+
+catalog = AppGroup('catalog', help='Bulk import and synthetic data generation.')
+
+LOCATION_COLUMNS = ('latitude', 'longitude', 'geohash')
+VENUE_COLUMNS = ('id', 'name', 'city', 'state', 'address', 'phone', 'image_link', 'website',
+                 'seeking_talent', 'seeking_description', 'facebook_link') + LOCATION_COLUMNS
+ARTIST_COLUMNS = ('id', 'name', 'city', 'state', 'phone', 'image_link', 'website',
+                  'seeking_venue', 'seeking_description', 'facebook_link') + LOCATION_COLUMNS
+SHOW_COLUMNS = ('venue_id', 'artist_id', 'start_time', 'end_time')
+SHOW_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def read_rows(path):
+    """Stream dict rows from a .csv or .jsonl/.json file."""
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.csv'):
+            for row in csv.DictReader(f):
+                if row.get('genres'):
+                    row['genres'] = [genre.strip() for genre in row['genres'].split(',')]
+                yield row
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def parse_bool(value):
+    if isinstance(value, bool) or value is None:
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y', 't')
+
+
+_forms = {}
+
+
+def form_errors(form_class, row):
+    """Validate row with form_class's rules. One form instance per class is
+    reprocessed for every row, which is much cheaper than building a form."""
+    formdata = MultiDict()
+    for key, value in row.items():
+        if isinstance(value, list):
+            formdata.setlist(key, value)
+        elif value is not None:
+            formdata[key] = str(value)
+    form = _forms.get(form_class)
+    if form is None:
+        form = _forms[form_class] = form_class(formdata=None, meta={'csrf': False})
+    form.process(formdata)
+    form.validate()
+    return dict(form.errors)
+
+
+def parse_datetime(value):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return dateutil.parser.parse(value)
+
+
+class BatchWriter(object):
+    """Buffers rows for one table and writes each full chunk in a single
+    round trip: COPY FROM STDIN on Postgres, a multi-row INSERT elsewhere.
+    Rows of depends_on (e.g. the owners of association rows) are always
+    written first."""
+
+    def __init__(self, db, table, columns, chunk_size, use_copy, depends_on=None):
+        self.db = db
+        self.depends_on = depends_on
+        self.table = table
+        self.columns = columns
+        self.chunk_size = chunk_size
+        self.use_copy = use_copy
+        self.rows = []
+        self.written = 0
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        if self.depends_on is not None:
+            self.depends_on.flush()
+        if self.use_copy:
+            self._copy()
+        else:
+            self.db.session.execute(self.table.insert().values(self.rows))
+        self.written += len(self.rows)
+        self.rows = []
+
+    def _copy(self):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in self.rows:
+            writer.writerow(['\\N' if row.get(column) is None else row[column]
+                             for column in self.columns])
+        buffer.seek(0)
+        columns = ', '.join(f'"{column}"' for column in self.columns)
+        cursor = self.db.session.connection().connection.cursor()
+        cursor.copy_expert(f'COPY "{self.table.name}" ({columns}) FROM STDIN '
+                           f"WITH (FORMAT csv, NULL '\\N')", buffer)
+
+
+class Importer(object):
+
+    def __init__(self, chunk_size, use_copy):
+        from models import db, Genre, Venue, Artist, Show, venue_genres, artist_genres
+        self.db = db
+        self.models = {'venue': (Venue, venue_genres, VENUE_COLUMNS),
+                       'artist': (Artist, artist_genres, ARTIST_COLUMNS)}
+        self.Genre = Genre
+        self.Show = Show
+        self.chunk_size = chunk_size
+        self.use_copy = use_copy
+        self.genre_ids = dict(db.session.query(Genre.name, Genre.id))
+        self.ids = {}
+
+    def writer(self, table, columns, depends_on=None):
+        return BatchWriter(self.db, table, columns, self.chunk_size, self.use_copy, depends_on)
+
+    def genre_id(self, name):
+        if name not in self.genre_ids:
+            genre = self.Genre(name=name)
+            self.db.session.add(genre)
+            self.db.session.flush()
+            self.genre_ids[name] = genre.id
+        return self.genre_ids[name]
+
+    def known_ids(self, kind):
+        if kind not in self.ids:
+            model = self.models[kind][0]
+            self.ids[kind] = {id for id, in self.db.session.query(model.id)}
+        return self.ids[kind]
+
+    def import_entities(self, kind, path, form_class):
+        model, association, columns = self.models[kind]
+        owner_column = f'{kind}_id'
+        ids = self.known_ids(kind)
+        next_id = max(ids, default=0) + 1
+        rows = self.writer(model.__table__, columns)
+        links = self.writer(association, (owner_column, 'genre_id'), depends_on=rows)
+        skipped = 0
+        for number, row in enumerate(read_rows(path), start=1):
+            errors = form_errors(form_class, row)
+            if errors:
+                skipped += 1
+                click.echo(f'{path}:{number}: skipped, {errors}', err=True)
+                continue
+            id = int(row['id']) if row.get('id') else next_id
+            if id in ids:
+                skipped += 1
+                click.echo(f'{path}:{number}: skipped, duplicate id {id}', err=True)
+                continue
+            next_id = max(next_id, id + 1)
+            ids.add(id)
+            values = {column: row.get(column) or None for column in columns}
+            values['id'] = id
+            for flag in ('seeking_talent', 'seeking_venue'):
+                if flag in values:
+                    values[flag] = parse_bool(row.get(flag))
+            values.update(geo.location(row['city'], row['state'], row.get('latitude'), row.get('longitude')))
+            # Genre rows must exist before the association chunk is written.
+            genre_ids = [self.genre_id(name) for name in dict.fromkeys(row['genres'])]
+            rows.add(values)
+            for genre_id in genre_ids:
+                links.add({owner_column: id, 'genre_id': genre_id})
+        links.flush()
+        rows.flush()
+        self.reset_sequence(model.__table__)
+        return rows.written, skipped
+
+    def bookings(self):
+        """IntervalIndexes of the shows already booked, per venue and per
+        artist, so clashing rows are skipped instead of failing the import."""
+        from bookings import IntervalIndex
+        Show = self.Show
+        venues, artists = defaultdict(IntervalIndex), defaultdict(IntervalIndex)
+        # In start order every add is an append.
+        for venue_id, artist_id, start, end in self.db.session.query(
+                Show.venue_id, Show.artist_id, Show.start_time, Show.end_time).order_by(Show.start_time):
+            venues[venue_id].add(start, end)
+            artists[artist_id].add(start, end)
+        return venues, artists
+
+    def import_shows(self, path, form_class):
+        from forms import DEFAULT_SHOW_MINUTES
+        venue_ids = self.known_ids('venue')
+        artist_ids = self.known_ids('artist')
+        venues, artists = self.bookings()
+        rows = self.writer(self.Show.__table__, SHOW_COLUMNS)
+        skipped = 0
+        for number, row in enumerate(read_rows(path), start=1):
+            try:
+                row['start_time'] = parse_datetime(str(row.get('start_time'))) \
+                    .replace(tzinfo=None).strftime(SHOW_TIME_FORMAT)
+            except (ValueError, OverflowError):
+                pass
+            errors = form_errors(form_class, row)
+            if not str(row.get('venue_id', '')).isdigit() or int(row['venue_id']) not in venue_ids:
+                errors['venue_id'] = ['Unknown venue.']
+            if not str(row.get('artist_id', '')).isdigit() or int(row['artist_id']) not in artist_ids:
+                errors['artist_id'] = ['Unknown artist.']
+            if not errors:
+                venue_id, artist_id = int(row['venue_id']), int(row['artist_id'])
+                start = datetime.strptime(row['start_time'], SHOW_TIME_FORMAT)
+                end = start + timedelta(minutes=int(row.get('duration') or DEFAULT_SHOW_MINUTES))
+                if venues[venue_id].overlapping(start, end):
+                    errors['start_time'] = ['The venue is already booked.']
+                elif artists[artist_id].overlapping(start, end):
+                    errors['start_time'] = ['The artist is already booked.']
+            if errors:
+                skipped += 1
+                click.echo(f'{path}:{number}: skipped, {errors}', err=True)
+                continue
+            venues[venue_id].add(start, end)
+            artists[artist_id].add(start, end)
+            rows.add({'venue_id': venue_id, 'artist_id': artist_id, 'start_time': start, 'end_time': end})
+        rows.flush()
+        return rows.written, skipped
+
+    def reset_sequence(self, table):
+        # Ids were assigned client-side; move the serial past them.
+        if self.db.engine.dialect.name == 'postgresql':
+            self.db.session.execute(
+                f'''SELECT setval(pg_get_serial_sequence('"{table.name}"', 'id'),
+                    COALESCE((SELECT MAX(id) FROM "{table.name}"), 1))''')
+
+
+@catalog.command('import')
+@click.option('--venues', 'venues_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--artists', 'artists_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--shows', 'shows_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=1000, show_default=True, help='Rows per INSERT/COPY round trip.')
+@click.option('--copy/--no-copy', default=None, help='Use COPY (default on Postgres).')
+def import_catalog(venues_path, artists_path, shows_path, chunk_size, copy):
+    """Import venues, artists and shows from CSV or JSON Lines files."""
+    from models import db, Venue, Artist
+    from forms import VenueForm, ArtistForm, ShowForm
+    import counters
+    if copy is None:
+        copy = db.engine.dialect.name == 'postgresql'
+    importer = Importer(chunk_size, copy)
+    try:
+        for label, path, load in (
+                ('venues', venues_path, lambda p: importer.import_entities('venue', p, VenueForm)),
+                ('artists', artists_path, lambda p: importer.import_entities('artist', p, ArtistForm)),
+                ('shows', shows_path, lambda p: importer.import_shows(p, ShowForm))):
+            if path:
+                written, skipped = load(path)
+                click.echo(f'{label}: imported {written}, skipped {skipped}')
+        if shows_path:
+            # One set-based recount instead of maintaining counters per row.
+            counters.refresh(Venue)
+            counters.refresh(Artist)
+        db.session.commit()
+        current_app.extensions['autocomplete'].invalidate(
+            *[kind for kind, path in (('venue', venues_path), ('artist', artists_path)) if path])
+        if venues_path:
+            current_app.extensions['response_cache'].invalidate('venue-locations')
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+@catalog.command('generate')
+@click.option('--venues', default=1000, show_default=True)
+@click.option('--artists', default=5000, show_default=True)
+@click.option('--shows', default=100000, show_default=True)
+@click.option('--out', default='data/synthetic', show_default=True, type=click.Path(file_okay=False))
+@click.option('--seed', default=0, show_default=True)
+def generate_catalog(venues, artists, shows, out, seed):
+    """Write synthetic venues/artists/shows JSON Lines files for load testing."""
+    from forms import VenueForm
+    rng = random.Random(seed)
+    genres = [value for value, label in VenueForm.genres.kwargs['choices']]
+    cities = [('San Francisco', 'CA'), ('New York', 'NY'), ('Austin', 'TX'), ('Chicago', 'IL'),
+              ('Seattle', 'WA'), ('Nashville', 'TN'), ('New Orleans', 'LA'), ('Denver', 'CO')]
+    os.makedirs(out, exist_ok=True)
+
+    def write(name, rows):
+        path = os.path.join(out, f'{name}.jsonl')
+        with open(path, 'w', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, separators=(',', ':')) + '\n')
+        click.echo(f'wrote {path}')
+
+    def entity(kind, id):
+        city, state = rng.choice(cities)
+        return {'id': id, 'name': f'{kind} {id}', 'city': city, 'state': state,
+                'phone': f'{rng.randint(200, 999)}-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}',
+                'genres': rng.sample(genres, rng.randint(1, 3))}
+
+    write('venues', (dict(entity('Venue', id), address=f'{id} Main Street',
+                          seeking_talent=rng.random() < 0.3) for id in range(1, venues + 1)))
+    write('artists', (dict(entity('Artist', id), seeking_venue=rng.random() < 0.3)
+                      for id in range(1, artists + 1)))
+    start = datetime(2015, 1, 1)
+    write('shows', ({'venue_id': rng.randint(1, venues), 'artist_id': rng.randint(1, artists),
+                     'start_time': (start + timedelta(hours=rng.randint(0, 24 * 365 * 25))).isoformat()}
+                    for _ in range(shows)))
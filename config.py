@@ -1,15 +1,144 @@
 import os
-SECRET_KEY = os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-# Enable debug mode.
-DEBUG = True
 
-# Connect to the database
+def env_flag(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
 
 
-# TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgres://daikiakiyoshi@localhost:5432/fyyur'
+class Config(object):
+    """Settings shared by every environment. create_app() picks one of the
+    classes in CONFIGS by the FYYUR_CONFIG environment variable."""
 
-SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    # Must be the same in every worker, or sessions and CSRF tokens signed by
+    # one worker are rejected by the others. Without it, development and
+    # testing generate one into the instance folder; production refuses
+    # to start.
+    SECRET_KEY = os.environ.get('SECRET_KEY')
+    DEBUG = False
+    TESTING = False
+
+    # Connect to the database
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgres://daikiakiyoshi@localhost:5432/fyyur')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Connection pool, per worker process: a deployment opens at most
+    # workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections, which must stay
+    # below the server's max_connections. Ignored for SQLite.
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    # Seconds to wait for a free connection before failing the request
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+    # Replace connections older than this many seconds, before a proxy or
+    # the server drops them
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    # Test each connection on checkout so a restarted server costs a
+    # reconnect instead of a failed request
+    DB_POOL_PRE_PING = env_flag('DB_POOL_PRE_PING', True)
+    # Postgres statement_timeout in milliseconds, 0 to disable
+    DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 0))
+    # Connecting through PgBouncer in transaction pooling mode: PgBouncer does
+    # the pooling, so no connection is kept between requests
+    DB_PGBOUNCER = env_flag('DB_PGBOUNCER', False)
+
+    # Detail pages run their independent queries (entity and shows) at the
+    # same time, each on its own pooled connection, from a per-process pool
+    # of this many threads. A detail page briefly holds two connections.
+    CONCURRENT_READS = env_flag('CONCURRENT_READS', True)
+    CONCURRENT_READ_THREADS = int(os.environ.get('CONCURRENT_READ_THREADS', 8))
+
+    # Keyset pagination for the venue, artist and show listings
+    PAGE_SIZE = 20
+    MAX_PAGE_SIZE = 100
+
+    # Maximum number of ranked results returned by the venue and artist search
+    SEARCH_LIMIT = 50
+
+    # Name typeahead (autocomplete.py): matches returned by default and at
+    # most, and how often each worker looks for names changed by the others
+    AUTOCOMPLETE_LIMIT = 10
+    AUTOCOMPLETE_MAX_LIMIT = 50
+    AUTOCOMPLETE_CHECK_SECONDS = int(os.environ.get('AUTOCOMPLETE_CHECK_SECONDS', 5))
+
+    # Venue radius search (geo.py): default and largest radius in km, and
+    # most results; "venues near this artist" on artist pages
+    NEARBY_RADIUS_KM = 25
+    NEARBY_MAX_RADIUS_KM = 500
+    NEARBY_LIMIT = 50
+    ARTIST_NEARBY_RADIUS_KM = 50
+    ARTIST_NEARBY_VENUES = 6
+    # City/state -> coordinates CSV; None for the bundled US gazetteer
+    GAZETTEER_PATH = os.environ.get('GAZETTEER_PATH')
+
+    # Artist/venue recommendations (matches.py): weights of the signals,
+    # distance at which the location signal reaches 0, matches kept per
+    # artist and venue, artists scored at once by `flask matches build`,
+    # and whether edits rescore on a background thread
+    MATCH_WEIGHTS = {'genre': 0.4, 'history': 0.2, 'location': 0.3, 'repeat': 0.1}
+    MATCH_RADIUS_KM = 100
+    MATCH_TOP_K = 10
+    MATCH_BLOCK_SIZE = int(os.environ.get('MATCH_BLOCK_SIZE', 128))
+    MATCH_REFRESH_IN_BACKGROUND = env_flag('MATCH_REFRESH_IN_BACKGROUND', True)
+
+    # Most shows a single recurring listing may create
+    MAX_RECURRING_SHOWS = 104
+    # Longest window /venues/<id>/availability reports on
+    AVAILABILITY_MAX_DAYS = 92
+
+    # Session store (sessions.py): 'sql' (the sessions table), 'sqlite' (a
+    # file shared by one host's workers, SESSION_SQLITE_PATH) or 'cookie'
+    # (Flask's signed cookie); expired sessions are deleted every
+    # SESSION_SWEEP_SECONDS by each worker
+    SESSION_TYPE = os.environ.get('SESSION_TYPE', 'sql')
+    SESSION_SQLITE_PATH = os.environ.get('SESSION_SQLITE_PATH')
+    SESSION_SWEEP_SECONDS = int(os.environ.get('SESSION_SWEEP_SECONDS', 3600))
+    PERMANENT_SESSION_LIFETIME = int(os.environ.get('PERMANENT_SESSION_LIFETIME', 7 * 24 * 3600))
+
+    # Rendered-page cache: 'lru' (per process), 'redis' (shared, needs redis-py
+    # and CACHE_REDIS_URL) or 'null' (disabled)
+    CACHE_TYPE = os.environ.get('CACHE_TYPE', 'lru')
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+    CACHE_DEFAULT_TIMEOUT = 300
+    CACHE_MAX_ENTRIES = 1024
+
+    # Request instrumentation: Server-Timing response headers (query count,
+    # database, render and slowest statement times) and the Prometheus
+    # /metrics endpoint. Statements slower than the threshold are logged.
+    SERVER_TIMING = False
+    METRICS_ENDPOINT = False
+    SLOW_QUERY_THRESHOLD_MS = int(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100))
+    SLOWEST_STATEMENTS = 3
+
+
+class DevelopmentConfig(Config):
+    # Enable debug mode.
+    DEBUG = True
+    SERVER_TIMING = True
+    # Bundle static assets from their sources on every request, so edits
+    # show up without `flask assets build`
+    ASSETS_MANIFEST = None
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite://')
+    CACHE_TYPE = 'null'
+    WTF_CSRF_ENABLED = False
+    MATCH_REFRESH_IN_BACKGROUND = False
+
+
+class ProductionConfig(Config):
+    SESSION_COOKIE_SECURE = env_flag('SESSION_COOKIE_SECURE', True)
+    DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 30000))
+    METRICS_ENDPOINT = True
+
+
+CONFIGS = {
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+    'production': ProductionConfig,
+}
@@ -0,0 +1,155 @@
+"""Show counters maintained on Venue and Artist.
+
+upcoming_shows_count, past_shows_count and next_show_at summarise an
+entity's shows so listings never touch the Show table:
+
+- new shows are counted with one relative UPDATE per owner (shows_added),
+  in the caller's transaction;
+- owners losing shows to a cascading delete are recomputed (refresh);
+- shows pass from upcoming to past as time goes by. Exactly the rows whose
+  next_show_at is in the past are stale, so `flask counters roll-forward`
+  (run it from cron every few minutes) recomputes only those, and
+  upcoming_shows() stays exact for them in between;
+- `flask counters check` recomputes everything from scratch and reports
+  (or, with --fix, repairs) rows that disagree.
+"""
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import and_, case, func, literal, or_, select
+
+from models import db, Venue, Artist, Show
+
+counters = AppGroup('counters', help='Maintain the show counters on venues and artists.')
+
+OWNERS = {
+    Venue: Show.venue_id,
+    Artist: Show.artist_id,
+}
+
+
+def _shows_of(model, *conditions):
+    return and_(OWNERS[model] == model.id, *conditions)
+
+
+def computed(model):
+    """Correlated subqueries computing model's counters from Show, served
+    by the (owner_id, start_time) indexes."""
+    now = func.now()
+    table = model.__table__
+    return {
+        'upcoming_shows_count': select([func.count(Show.id)])
+            .where(_shows_of(model, Show.start_time > now)).correlate(table).as_scalar(),
+        'past_shows_count': select([func.count(Show.id)])
+            .where(_shows_of(model, Show.start_time <= now)).correlate(table).as_scalar(),
+        'next_show_at': select([func.min(Show.start_time)])
+            .where(_shows_of(model, Show.start_time > now)).correlate(table).as_scalar(),
+    }
+
+
+def upcoming_shows(model):
+    """model.upcoming_shows_count, recounted for the rows whose next show
+    has started since the last roll-forward, so readers never see a stale
+    count."""
+    return case([(model.next_show_at <= func.now(), computed(model)['upcoming_shows_count'])],
+                else_=model.upcoming_shows_count)
+
+
+def refresh(model, ids=None):
+    """Recompute the counters of model rows with the given ids, or of every
+    row when ids is None. Returns the number of rows updated."""
+    statement = model.__table__.update().values(**computed(model))
+    if ids is not None:
+        ids = list(ids)
+        if not ids:
+            return 0
+        statement = statement.where(model.id.in_(ids))
+    return db.session.execute(statement).rowcount
+
+
+def shows_added(venue_id, artist_id, start_times):
+    """Count new shows of one venue and artist. Relative, row-locking
+    updates keep concurrent inserts for the same owner correct."""
+    start_times = [literal(start_time, db.DateTime()) for start_time in sorted(start_times)]
+    now = func.now()
+    upcoming = sum(case([(start_time > now, 1)], else_=0) for start_time in start_times)
+    # The earliest of the new shows that is still to come
+    first_upcoming = case([(start_time > now, start_time) for start_time in start_times])
+    for model, id in ((Venue, venue_id), (Artist, artist_id)):
+        db.session.execute(model.__table__.update().where(model.id == id).values(
+            upcoming_shows_count=model.upcoming_shows_count + upcoming,
+            past_shows_count=model.past_shows_count + len(start_times) - upcoming,
+            next_show_at=case([(and_(first_upcoming.isnot(None),
+                                     or_(model.next_show_at.is_(None),
+                                         first_upcoming < model.next_show_at)), first_upcoming)],
+                              else_=model.next_show_at)))
+
+
+def roll_forward():
+    """Recompute the rows whose next show has started. Returns the number
+    of venues and artists updated."""
+    updated = 0
+    for model in OWNERS:
+        due = db.session.query(model.id).filter(model.next_show_at <= func.now())
+        updated += refresh(model, [id for id, in due])
+    return updated
+
+
+def mismatches(model):
+    """Rows of model whose stored counters differ from a full recount."""
+    now = func.now()
+    owner = OWNERS[model]
+    actual = db.session.query(
+        owner.label('id'),
+        func.sum(case([(Show.start_time > now, 1)], else_=0)).label('upcoming'),
+        func.sum(case([(Show.start_time <= now, 1)], else_=0)).label('past'),
+        func.min(case([(Show.start_time > now, Show.start_time)])).label('next_show_at'),
+    ).group_by(owner).subquery()
+    upcoming = func.coalesce(actual.c.upcoming, 0)
+    past = func.coalesce(actual.c.past, 0)
+    return db.session.query(model.id, model.upcoming_shows_count, upcoming, model.past_shows_count,
+                            past, model.next_show_at, actual.c.next_show_at) \
+        .outerjoin(actual, actual.c.id == model.id) \
+        .filter(or_(model.upcoming_shows_count != upcoming,
+                    model.past_shows_count != past,
+                    and_(model.next_show_at.is_(None), actual.c.next_show_at.isnot(None)),
+                    and_(model.next_show_at.isnot(None), actual.c.next_show_at.is_(None)),
+                    model.next_show_at != actual.c.next_show_at)) \
+        .order_by(model.id)
+
+
+def _invalidate_listings():
+    current_app.extensions['response_cache'].invalidate('venues', 'artists')
+
+
+@counters.command('roll-forward')
+def roll_forward_command():
+    """Move shows that have started from upcoming to past."""
+    updated = roll_forward()
+    db.session.commit()
+    if updated:
+        _invalidate_listings()
+    click.echo(f'rolled forward {updated} venues/artists')
+
+
+@counters.command('check')
+@click.option('--fix', is_flag=True, help='Recompute every row instead of only reporting.')
+@click.option('--limit', default=20, show_default=True, help='Mismatches to print per table.')
+def check_command(fix, limit):
+    """Recount every venue's and artist's shows and report disagreements."""
+    total = 0
+    for model in OWNERS:
+        rows = mismatches(model).all()
+        total += len(rows)
+        click.echo(f'{model.__tablename__}: {len(rows)} mismatched')
+        for id, upcoming, actual_upcoming, past, actual_past, next_show_at, actual_next in rows[:limit]:
+            click.echo(f'  {id}: upcoming {upcoming}/{actual_upcoming}, past {past}/{actual_past}, '
+                       f'next {next_show_at}/{actual_next}')
+    if fix:
+        for model in OWNERS:
+            refresh(model)
+        db.session.commit()
+        _invalidate_listings()
+        click.echo('recomputed all counters')
+    elif total:
+        raise SystemExit(1)
@@ -0,0 +1,31 @@
+from datetime import datetime, timezone
+from functools import lru_cache
+
+import babel.dates
+import dateutil.parser
+
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+@lru_cache(maxsize=64)
+def compiled_datetime_format(format, locale):
+    # Babel re-parses pattern strings and locale identifiers on every
+    # format_datetime() call; keep the parsed forms per (format, locale).
+    return (babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)),
+            babel.Locale.parse(locale))
+
+
+@lru_cache(maxsize=4096)
+def format_datetime(value, format='medium', locale=None):
+    if not isinstance(value, datetime):
+        value = dateutil.parser.parse(value)
+    locale = locale or babel.dates.LC_TIME
+    if format in ('long', 'short'):
+        return babel.dates.format_datetime(value, format, locale=locale)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    pattern, locale = compiled_datetime_format(format, locale)
+    return pattern.apply(value, locale)
@@ -1,21 +1,91 @@
-from datetime import datetime
+from datetime import datetime, time, timedelta
+from dateutil.relativedelta import relativedelta
+from flask import current_app
 from flask_wtf import FlaskForm
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField
-from wtforms.validators import DataRequired, AnyOf, URL, Regexp, ValidationError, Optional
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, DateField, IntegerField
+from wtforms.widgets import HiddenInput
+from wtforms.validators import DataRequired, AnyOf, URL, Regexp, ValidationError, Optional, NumberRange
 import re
 
+from models import MAX_SHOW_DURATION
+
+DEFAULT_SHOW_MINUTES = 180
+
+RECURRENCE_STEPS = {
+    'weekly': relativedelta(weeks=1),
+    'monthly': relativedelta(months=1),
+}
+
 class ShowForm(FlaskForm):
     artist_id = StringField(
-        'artist_id'
+        'artist_id', validators=[DataRequired(), Regexp(r'^[0-9]+$', message='Not an id.')]
     )
     venue_id = StringField(
-        'venue_id'
+        'venue_id', validators=[DataRequired(), Regexp(r'^[0-9]+$', message='Not an id.')]
     )
     start_time = DateTimeField(
         'start_time',
         validators=[DataRequired()],
         default= datetime.today()
     )
+    duration = IntegerField(
+        'duration',
+        validators=[DataRequired(), NumberRange(min=1, max=int(MAX_SHOW_DURATION.total_seconds() // 60))],
+        default=DEFAULT_SHOW_MINUTES
+    )
+    # Recurrence: repeat weekly or monthly, either repeat_count times in all
+    # or up to and including repeat_until.
+    repeat = SelectField(
+        'repeat',
+        choices=[
+            ('', 'Does not repeat'),
+            ('weekly', 'Weekly'),
+            ('monthly', 'Monthly'),
+        ],
+        default=''
+    )
+    repeat_count = IntegerField(
+        'repeat_count', validators=[Optional(), NumberRange(min=1)]
+    )
+    repeat_until = DateField(
+        'repeat_until', validators=[Optional()]
+    )
+
+    def validate_repeat(self, field):
+        if not field.data:
+            return
+        if (self.repeat_count.data is None) == (self.repeat_until.data is None):
+            raise ValidationError('Give either a number of shows or an end date.')
+        if self.start_time.data is None:
+            return
+        if self.repeat_until.data is not None and self.repeat_until.data < self.start_time.data.date():
+            raise ValidationError('The end date is before the first show.')
+        limit = current_app.config['MAX_RECURRING_SHOWS']
+        if len(self.occurrences(limit + 1)) > limit:
+            raise ValidationError(f'At most {limit} shows can be listed at once.')
+
+    def occurrences(self, limit=None):
+        """Start times of every show the form describes, in order. Months
+        are stepped from the first show, so a show on the 31st falls on the
+        last day of shorter months."""
+        start = self.start_time.data
+        if not self.repeat.data:
+            return [start]
+        step = RECURRENCE_STEPS[self.repeat.data]
+        count = self.repeat_count.data
+        until = self.repeat_until.data and datetime.combine(self.repeat_until.data, time.max)
+        times = []
+        while (count is None or len(times) < count) and (limit is None or len(times) < limit):
+            occurrence = start + step * len(times)
+            if until is not None and occurrence > until:
+                break
+            times.append(occurrence)
+        return times
+
+    def bookings(self):
+        """(start, end) of every show the form describes."""
+        duration = timedelta(minutes=self.duration.data)
+        return [(start, start + duration) for start in self.occurrences()]
 
 # Refer to https://knowledge.udacity.com/questions/105337
 def isValidPhone(form, field):
@@ -218,3 +288,15 @@ class ArtistForm(FlaskForm):
     facebook_link = StringField(
         'facebook_link', validators=[URL(), Optional()]
     )
+
+# Edits carry the version of the row they were made against; see
+# Venue.version_id.
+class EditVenueForm(VenueForm):
+    version_id = IntegerField(
+        'version_id', validators=[DataRequired()], widget=HiddenInput()
+    )
+
+class EditArtistForm(ArtistForm):
+    version_id = IntegerField(
+        'version_id', validators=[DataRequired()], widget=HiddenInput()
+    )
@@ -0,0 +1,227 @@
+"""Venue and artist locations, and "near here" queries.
+
+Locations come from a gazetteer of US cities bundled in
+data/gazetteer/us_cities.csv (city, state, latitude, longitude), so
+geocoding never leaves the machine. New and edited venues and artists are
+located from their city and state as they are saved; `flask geo geocode`
+fills in rows saved before (or whose city was missing from the gazetteer
+then).
+
+Each located row also stores the geohash of its point. Points close to
+each other share a geohash prefix, so the ordinary (geohash) B-tree index
+answers "within r km" as a handful of prefix range scans: the cell around
+the centre that is at least r km across, and its eight neighbours, which
+together contain the whole circle. Exact distances are then computed for
+those candidates only. The same queries run on Postgres and SQLite,
+without PostGIS.
+"""
+import csv
+import math
+import os
+import re
+import unicodedata
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import and_, bindparam, or_
+
+geo = AppGroup('geo', help='Geocode venues and artists.')
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+
+DEFAULT_GAZETTEER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 'data', 'gazetteer', 'us_cities.csv')
+
+# Spellings that differ from the gazetteer's name for the same place
+ABBREVIATIONS = {'st': 'saint', 'ste': 'sainte', 'ft': 'fort', 'mt': 'mount'}
+ALIASES = {'nyc': 'new york', 'new york city': 'new york', 'la': 'los angeles',
+           'sf': 'san francisco', 'washington dc': 'washington', 'philly': 'philadelphia'}
+
+
+# Geohash
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Geohash of a point: alternating longitude/latitude bisections,
+    five bits per character."""
+    bounds = [[-90.0, 90.0], [-180.0, 180.0]]
+    value = (latitude, longitude)
+    code = []
+    bit = 0
+    char = 0
+    even = True
+    while len(code) < precision:
+        axis = 1 if even else 0
+        low, high = bounds[axis]
+        middle = (low + high) / 2
+        char <<= 1
+        if value[axis] >= middle:
+            char |= 1
+            bounds[axis][0] = middle
+        else:
+            bounds[axis][1] = middle
+        even = not even
+        bit += 1
+        if bit == 5:
+            code.append(GEOHASH_ALPHABET[char])
+            bit = char = 0
+    return ''.join(code)
+
+
+def cell_size(precision):
+    """(latitude, longitude) span in degrees of a geohash cell."""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def successor(prefix):
+    """The smallest geohash greater than every geohash starting with
+    prefix, or None if there is none."""
+    prefix = prefix.rstrip(GEOHASH_ALPHABET[-1])
+    if not prefix:
+        return None
+    return prefix[:-1] + GEOHASH_ALPHABET[GEOHASH_ALPHABET.index(prefix[-1]) + 1]
+
+
+def covering(latitude, longitude, radius_km):
+    """Geohash prefixes whose cells together contain the circle, or None
+    when it is too large (or too close to a pole) for them to."""
+    # Meridians converge: the narrowest latitude the circle reaches decides
+    # how wide the cells are.
+    highest = min(90.0, abs(latitude) + radius_km / KM_PER_DEGREE)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_span, lng_span = cell_size(precision)
+        if lat_span * KM_PER_DEGREE >= radius_km \
+                and lng_span * KM_PER_DEGREE * math.cos(math.radians(highest)) >= radius_km:
+            break
+    else:
+        return None
+    cells = set()
+    for dlat in (-1, 0, 1):
+        for dlng in (-1, 0, 1):
+            lat = max(-90.0, min(90.0 - 1e-9, latitude + dlat * lat_span))
+            lng = (longitude + dlng * lng_span + 180.0) % 360.0 - 180.0
+            cells.add(encode(lat, lng, precision))
+    return sorted(cells)
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Great-circle (haversine) distance."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+# Gazetteer
+
+def place_key(city, state):
+    """Normalised (city, state) for gazetteer lookups: case, accents,
+    punctuation and common abbreviations ignored."""
+    city = unicodedata.normalize('NFKD', city or '')
+    city = ''.join(char for char in city if not unicodedata.combining(char)).casefold()
+    words = [ABBREVIATIONS.get(word, word) for word in re.findall(r"[a-z0-9]+", city.replace("'", ''))]
+    city = ' '.join(words)
+    return ALIASES.get(city, city), (state or '').strip().upper()
+
+
+_gazetteers = {}
+
+
+def gazetteer():
+    """{place_key: (latitude, longitude)} from GAZETTEER_PATH, read once."""
+    path = current_app.config.get('GAZETTEER_PATH') or DEFAULT_GAZETTEER
+    if path not in _gazetteers:
+        places = {}
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                places[place_key(row['city'], row['state'])] = \
+                    (float(row['latitude']), float(row['longitude']))
+        _gazetteers[path] = places
+    return _gazetteers[path]
+
+
+def parse_point(latitude, longitude):
+    """(latitude, longitude) as floats, or None unless both are valid."""
+    try:
+        point = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None
+    if -90 <= point[0] <= 90 and -180 <= point[1] <= 180:
+        return point
+    return None
+
+
+def location(city, state, latitude=None, longitude=None):
+    """Column values locating a venue or artist: the given coordinates if
+    valid, else its city's. All None when neither is known."""
+    point = parse_point(latitude, longitude) or gazetteer().get(place_key(city, state))
+    if point is None:
+        return {'latitude': None, 'longitude': None, 'geohash': None}
+    return {'latitude': point[0], 'longitude': point[1], 'geohash': encode(*point)}
+
+
+# Queries
+
+def around(model, latitude, longitude, radius_km):
+    """Condition selecting the located model rows in the geohash cells
+    covering the circle: a superset of those within radius_km, found with
+    index range scans."""
+    cells = covering(latitude, longitude, radius_km)
+    if cells is None:
+        return model.geohash.isnot(None)
+    ranges = []
+    for cell in cells:
+        upper = successor(cell)
+        ranges.append(model.geohash >= cell if upper is None
+                      else and_(model.geohash >= cell, model.geohash < upper))
+    return or_(*ranges)
+
+
+def nearby(model, latitude, longitude, radius_km, limit, exclude_id=None):
+    """[(distance_km, row)] of the located model rows within radius_km of
+    the point, nearest first. Rows carry id, name, city and state."""
+    from models import db
+    query = db.session.query(model.id, model.name, model.city, model.state,
+                             model.latitude, model.longitude) \
+        .filter(around(model, latitude, longitude, radius_km))
+    if exclude_id is not None:
+        query = query.filter(model.id != exclude_id)
+    found = []
+    for row in query:
+        distance = distance_km(latitude, longitude, row.latitude, row.longitude)
+        if distance <= radius_km:
+            found.append((distance, row))
+    found.sort(key=lambda item: (item[0], item[1].id))
+    return found[:limit]
+
+
+@geo.command('geocode')
+@click.option('--all', 'everything', is_flag=True, help='Relocate every row, not only unlocated ones.')
+def geocode_command(everything):
+    """Locate venues and artists from the bundled gazetteer."""
+    from models import db, Venue, Artist
+    for model in (Venue, Artist):
+        rows = db.session.query(model.id, model.city, model.state)
+        if not everything:
+            rows = rows.filter(model.geohash.is_(None))
+        updates = []
+        missing = {}
+        for id, city, state in rows:
+            values = location(city, state)
+            if values['geohash'] is None:
+                missing[(city, state)] = missing.get((city, state), 0) + 1
+            updates.append(dict(values, row_id=id))
+        table = model.__table__
+        if updates:
+            db.session.execute(table.update().where(table.c.id == bindparam('row_id')), updates)
+        located = len(updates) - sum(missing.values())
+        click.echo(f'{table.name}: located {located}, not in the gazetteer {sum(missing.values())}')
+        for (city, state), count in sorted(missing.items(), key=lambda item: -item[1])[:10]:
+            click.echo(f'  {city}, {state}: {count}')
+    db.session.commit()
+    current_app.extensions['response_cache'].invalidate('venue-locations')
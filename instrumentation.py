@@ -0,0 +1,232 @@
+"""Per-request SQL and template instrumentation.
+
+Every request records how many statements it ran, the time spent in the
+database and in template rendering, and its slowest statements. In
+development the numbers go out as a Server-Timing header (shown by the
+browser dev tools); in production they are aggregated per endpoint and
+served in the Prometheus text format at /metrics. Statements slower than
+SLOW_QUERY_THRESHOLD_MS are logged wherever they run.
+
+Metrics are per process: scrape each worker, or sum them in Prometheus.
+"""
+import heapq
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import (Response, before_render_template, current_app, g, has_request_context, request,
+                   template_rendered)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_bound = threading.local()
+
+# Upper bounds, in seconds, of the request duration histogram buckets.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class RequestStats(object):
+
+    def __init__(self, endpoint, keep_slowest, slow_threshold, logger):
+        self.started = time.perf_counter()
+        self.endpoint = endpoint
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.keep_slowest = keep_slowest
+        self.slow_threshold = slow_threshold
+        self.logger = logger
+        self.slowest = []  # min-heap of (duration, statement)
+        # Statements of one request may run on several threads.
+        self._lock = threading.Lock()
+
+    def add_query(self, statement, duration):
+        with self._lock:
+            self.queries += 1
+            self.db_time += duration
+            if len(self.slowest) < self.keep_slowest:
+                heapq.heappush(self.slowest, (duration, statement))
+            elif self.slowest and duration > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (duration, statement))
+        return bool(self.slow_threshold) and duration >= self.slow_threshold
+
+    def slowest_statements(self):
+        return sorted(self.slowest, reverse=True)
+
+
+class Metrics(object):
+    """Process-wide counters per (endpoint, method, status)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.duration = defaultdict(float)
+        self.queries = defaultdict(int)
+        self.db_time = defaultdict(float)
+        self.render_time = defaultdict(float)
+        self.buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+        self.slow_queries = 0
+
+    def observe(self, endpoint, method, status, duration, stats):
+        labels = (endpoint, method, str(status))
+        with self._lock:
+            self.requests[labels] += 1
+            self.duration[labels] += duration
+            self.queries[labels] += stats.queries
+            self.db_time[labels] += stats.db_time
+            self.render_time[labels] += stats.render_time
+            buckets = self.buckets[labels]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    buckets[i] += 1
+
+    def observe_slow_query(self):
+        with self._lock:
+            self.slow_queries += 1
+
+    def render(self):
+        lines = []
+
+        def family(name, kind, help, samples):
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(samples)
+
+        with self._lock:
+            labelled = sorted(self.requests)
+            label = {key: 'endpoint="{}",method="{}",status="{}"'.format(*key) for key in labelled}
+            family('fyyur_requests_total', 'counter', 'Requests served.',
+                   [f'fyyur_requests_total{{{label[key]}}} {self.requests[key]}' for key in labelled])
+            histogram = []
+            for key in labelled:
+                for bound, count in zip(DURATION_BUCKETS, self.buckets[key]):
+                    histogram.append(f'fyyur_request_duration_seconds_bucket{{{label[key]},le="{bound}"}} {count}')
+                histogram.append(f'fyyur_request_duration_seconds_bucket{{{label[key]},le="+Inf"}} {self.requests[key]}')
+                histogram.append(f'fyyur_request_duration_seconds_sum{{{label[key]}}} {self.duration[key]:.6f}')
+                histogram.append(f'fyyur_request_duration_seconds_count{{{label[key]}}} {self.requests[key]}')
+            family('fyyur_request_duration_seconds', 'histogram', 'Time to build the response.', histogram)
+            family('fyyur_db_queries_total', 'counter', 'SQL statements executed while serving requests.',
+                   [f'fyyur_db_queries_total{{{label[key]}}} {self.queries[key]}' for key in labelled])
+            family('fyyur_db_seconds_total', 'counter', 'Time spent in SQL statements.',
+                   [f'fyyur_db_seconds_total{{{label[key]}}} {self.db_time[key]:.6f}' for key in labelled])
+            family('fyyur_template_render_seconds_total', 'counter', 'Time spent rendering templates.',
+                   [f'fyyur_template_render_seconds_total{{{label[key]}}} {self.render_time[key]:.6f}'
+                    for key in labelled])
+            family('fyyur_slow_queries_total', 'counter', 'Statements slower than SLOW_QUERY_THRESHOLD_MS.',
+                   [f'fyyur_slow_queries_total {self.slow_queries}'])
+        return '\n'.join(lines) + '\n'
+
+
+def compact(statement, limit=200):
+    statement = re.sub(r'\s+', ' ', statement).strip()
+    return statement if len(statement) <= limit else statement[:limit - 3] + '...'
+
+
+class Instrumentation(object):
+    """Hooks SQLAlchemy cursor events and Flask request/template signals.
+
+    Config:
+      SERVER_TIMING           add a Server-Timing header to every response
+      METRICS_ENDPOINT        serve the Prometheus text format at /metrics
+      SLOW_QUERY_THRESHOLD_MS log statements slower than this (0 disables)
+      SLOWEST_STATEMENTS      slowest statements kept per request
+    """
+
+    def __init__(self, app=None):
+        self.metrics = Metrics()
+        self._listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SERVER_TIMING', False)
+        app.config.setdefault('METRICS_ENDPOINT', False)
+        app.config.setdefault('SLOW_QUERY_THRESHOLD_MS', 100)
+        app.config.setdefault('SLOWEST_STATEMENTS', 3)
+        if not self._listening:
+            # Engines are created lazily, so listen on every Engine and only
+            # record statements issued inside a request.
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._listening = True
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        if app.config['METRICS_ENDPOINT']:
+            app.add_url_rule('/metrics', 'metrics', self._metrics_view)
+        app.extensions['instrumentation'] = self
+
+    @staticmethod
+    def current():
+        """The RequestStats of the current request, if it is being recorded."""
+        stats = getattr(_bound, 'stats', None)
+        if stats is not None:
+            return stats
+        if has_request_context():
+            return g.get('_request_stats')
+        return None
+
+    @staticmethod
+    @contextmanager
+    def recording(stats):
+        """Attribute statements run on this thread, outside the request
+        context (e.g. a background read for the request), to stats."""
+        _bound.stats = stats
+        try:
+            yield
+        finally:
+            _bound.stats = None
+
+    def _before_request(self):
+        g._request_stats = RequestStats(request.endpoint, current_app.config['SLOWEST_STATEMENTS'],
+                                        current_app.config['SLOW_QUERY_THRESHOLD_MS'] / 1000,
+                                        current_app.logger)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.current() is not None:
+            conn.info.setdefault('_query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = self.current()
+        started = conn.info.get('_query_started')
+        if stats is None or not started:
+            return
+        duration = time.perf_counter() - started.pop()
+        if stats.add_query(statement, duration):
+            self.metrics.observe_slow_query()
+            stats.logger.warning('slow query (%.1f ms) in %s: %s',
+                                 duration * 1000, stats.endpoint, compact(statement))
+
+    def _before_render(self, app, template, context):
+        stats = self.current()
+        if stats is not None:
+            g._render_started = time.perf_counter()
+
+    def _after_render(self, app, template, context):
+        stats = self.current()
+        if stats is not None and g.get('_render_started') is not None:
+            stats.render_time += time.perf_counter() - g.pop('_render_started')
+
+    def _after_request(self, response):
+        stats = self.current()
+        if stats is None:
+            return response
+        duration = time.perf_counter() - stats.started
+        if current_app.config['METRICS_ENDPOINT'] and request.endpoint != 'metrics':
+            self.metrics.observe(request.endpoint or 'unmatched', request.method,
+                                 response.status_code, duration, stats)
+        if current_app.config['SERVER_TIMING']:
+            timings = [f'db;dur={stats.db_time * 1000:.2f};desc="{stats.queries} queries"',
+                       f'render;dur={stats.render_time * 1000:.2f}',
+                       f'app;dur={duration * 1000:.2f}']
+            for rank, (query_time, statement) in enumerate(stats.slowest_statements(), start=1):
+                statement = compact(statement, 80).replace('\\', '\\\\').replace('"', '\\"')
+                timings.append(f'sql{rank};dur={query_time * 1000:.2f};desc="{statement}"')
+            response.headers['Server-Timing'] = ', '.join(timings)
+        return response
+
+    def _metrics_view(self):
+        return Response(self.metrics.render(), mimetype='text/plain; version=0.0.4')
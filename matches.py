@@ -0,0 +1,372 @@
+"""Artist <-> venue recommendations.
+
+A pair scores between 0 and 1, a weighted sum (MATCH_WEIGHTS) of:
+
+- genre: cosine similarity of the artist's and the venue's genres;
+- history: how well each side's genres fit what the other has booked or
+  played before (the genres of the artists a venue has hosted, and of
+  the venues an artist has played);
+- location: 1 in the same place, falling linearly to 0 at MATCH_RADIUS_KM;
+- repeat: shows the pair has already played together, up to three.
+
+Artists are recommended venues seeking talent; venues are recommended
+artists seeking a venue. `flask matches build` scores every pair, keeps
+each side's MATCH_TOP_K best and rewrites artist_matches and
+venue_matches. Run it nightly. It works through the artists in blocks of
+MATCH_BLOCK_SIZE, scoring each block against every venue. Genres are
+sparse matrices and the scores of a block are one dense array, so
+memory stays at O(block x venues), which is fine at 100k x 100k.
+
+Between builds, refresh() rescores an artist or venue that was just
+created or edited. Its candidates are the counterparts sharing a genre,
+within MATCH_RADIUS_KM or already played with. refresh() rebuilds its
+list and updates its place in theirs. Needs NumPy and SciPy.
+"""
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, func, or_, select
+from sqlalchemy.pool import SingletonThreadPool, StaticPool
+
+import geo
+from catalog import BatchWriter
+from models import db, Genre, Venue, Artist, Show, venue_genres, artist_genres, artist_matches, venue_matches
+
+matches = AppGroup('matches', help='Build the artist/venue recommendations.')
+
+# Shows together at which the repeat signal is full
+REPEAT_SATURATION = 3
+
+Side = namedtuple('Side', ['model', 'genres', 'genre_owner', 'seeking', 'show_owner', 'table', 'other'])
+
+SIDES = {
+    'artist': Side(Artist, artist_genres, artist_genres.c.artist_id, Artist.seeking_venue,
+                   Show.artist_id, artist_matches, 'venue'),
+    'venue': Side(Venue, venue_genres, venue_genres.c.venue_id, Venue.seeking_talent,
+                  Show.venue_id, venue_matches, 'artist'),
+}
+
+# Rows of one kind, in id order: L2-normalised genre and booked-genre
+# matrices (CSR), coordinates (NaN when unknown) and the same points as
+# unit vectors (zero when unknown), and seeking flags.
+Features = namedtuple('Features', ['ids', 'index', 'genres', 'booked', 'latitude', 'longitude', 'points',
+                                   'seeking'])
+
+
+def _normalized(rows, count, width):
+    """CSR matrix of count x width from (row, column, value) triples, each
+    row scaled to unit length."""
+    import numpy as np
+    from scipy import sparse
+    row, column, value = zip(*rows) if rows else ((), (), ())
+    matrix = sparse.csr_matrix((np.asarray(value, dtype=np.float32), (row, column)),
+                               shape=(count, width), dtype=np.float32)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms).dot(matrix).tocsr()
+
+
+def load(kind, condition=None):
+    """Features of the rows of kind matching condition (all by default)."""
+    import numpy as np
+    side, other = SIDES[kind], SIDES[SIDES[kind].other]
+    model = side.model
+    query = db.session.query(model.id, model.latitude, model.longitude, side.seeking).order_by(model.id)
+    if condition is not None:
+        query = query.filter(condition)
+    rows = query.all()
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    latitude = np.array([np.nan if row[1] is None else row[1] for row in rows], dtype=np.float64)
+    longitude = np.array([np.nan if row[2] is None else row[2] for row in rows], dtype=np.float64)
+    phi, lambda_ = np.radians(latitude), np.radians(longitude)
+    points = np.nan_to_num(np.stack([np.cos(phi) * np.cos(lambda_), np.cos(phi) * np.sin(lambda_),
+                                     np.sin(phi)], axis=1).reshape(len(ids), 3))
+    index = {id: i for i, id in enumerate(ids.tolist())}
+    width = (db.session.query(func.max(Genre.id)).scalar() or 0) + 1
+
+    genres = db.session.query(side.genre_owner, side.genres.c.genre_id)
+    # What the other side of their shows plays or books
+    booked = db.session.query(side.show_owner, other.genres.c.genre_id, func.count()) \
+        .join(other.genres, other.genre_owner == other.show_owner) \
+        .group_by(side.show_owner, other.genres.c.genre_id)
+    if condition is not None:
+        selected = db.session.query(model.id).filter(condition)
+        genres = genres.filter(side.genre_owner.in_(selected))
+        booked = booked.filter(side.show_owner.in_(selected))
+    return Features(
+        ids=ids,
+        index=index,
+        genres=_normalized([(index[id], genre_id, 1) for id, genre_id in genres if id in index],
+                           len(ids), width),
+        booked=_normalized([(index[id], genre_id, count) for id, genre_id, count in booked if id in index],
+                           len(ids), width),
+        latitude=latitude,
+        longitude=longitude,
+        points=points,
+        seeking=np.array([bool(row[3]) for row in rows], dtype=bool),
+    )
+
+
+def pair_counts(artists, venues, condition=None):
+    """CSR matrix of the shows each artist played at each venue."""
+    import numpy as np
+    from scipy import sparse
+    query = db.session.query(Show.artist_id, Show.venue_id, func.count()) \
+        .group_by(Show.artist_id, Show.venue_id)
+    if condition is not None:
+        query = query.filter(condition)
+    rows = [(artists.index[artist_id], venues.index[venue_id], count)
+            for artist_id, venue_id, count in query
+            if artist_id in artists.index and venue_id in venues.index]
+    row, column, value = zip(*rows) if rows else ((), (), ())
+    return sparse.csr_matrix((np.asarray(value, dtype=np.float32), (row, column)),
+                             shape=(len(artists.ids), len(venues.ids)), dtype=np.float32)
+
+
+def block(features, start, stop):
+    """Rows start:stop of features."""
+    return features._replace(ids=features.ids[start:stop], index=None,
+                             genres=features.genres[start:stop], booked=features.booked[start:stop],
+                             latitude=features.latitude[start:stop],
+                             longitude=features.longitude[start:stop],
+                             points=features.points[start:stop],
+                             seeking=features.seeking[start:stop])
+
+
+def proximity(artists, venues, radius_km):
+    """Dense artists x venues location signal: 1 - distance / radius_km,
+    floored at 0, and 0 where either side is not located. Distances are
+    chords, from one matrix product of the unit vectors; within
+    radius_km they are arcs to well under a metre."""
+    import numpy as np
+    chord = artists.points.dot(venues.points.T)
+    np.multiply(chord, -2, out=chord)
+    np.add(chord, 2, out=chord)
+    np.maximum(chord, 0, out=chord)
+    np.sqrt(chord, out=chord)
+    signal = 1 - chord.astype(np.float32) * (geo.EARTH_RADIUS_KM / radius_km)
+    return np.maximum(signal, 0, out=signal)
+
+
+def genre_targets(venues, weights):
+    """Dense (2 x genres) x venues right-hand side of the genre signals:
+    with [genres booked] of the artists on the left, one product gives
+    genre * cosine + history / 2 * (both cross terms)."""
+    import numpy as np
+    from scipy import sparse
+    return np.asarray(sparse.vstack([
+        weights['genre'] * venues.genres.T + weights['history'] / 2 * venues.booked.T,
+        weights['history'] / 2 * venues.genres.T,
+    ]).todense(), dtype=np.float32)
+
+
+def score(artists, venues, repeat, weights, radius_km, targets=None):
+    """Dense float32 artists x venues scores. targets is genre_targets()
+    of venues, computed once by callers scoring many blocks."""
+    import numpy as np
+    from scipy import sparse
+    if targets is None:
+        targets = genre_targets(venues, weights)
+    scores = np.asarray(sparse.hstack([artists.genres, artists.booked]).tocsr().dot(targets))
+    scores += weights['location'] * proximity(artists, venues, radius_km)
+    repeat = repeat.tocoo()
+    scores[repeat.row, repeat.col] += weights['repeat'] / REPEAT_SATURATION \
+        * np.minimum(repeat.data, REPEAT_SATURATION)
+    return scores
+
+
+def top_k(scores, k):
+    """(columns, values) of the k best of each row of scores, best first."""
+    import numpy as np
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        columns = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        columns = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    values = np.take_along_axis(scores, columns, axis=1)
+    order = np.argsort(-values, axis=1, kind='stable')
+    return np.take_along_axis(columns, order, axis=1), np.take_along_axis(values, order, axis=1)
+
+
+def build(k, block_size, chunk_size=5000):
+    """Recompute both tables. Returns the rows written to each."""
+    import numpy as np
+    config = current_app.config
+    weights, radius_km = config['MATCH_WEIGHTS'], config['MATCH_RADIUS_KM']
+    artists, venues = load('artist'), load('venue')
+    repeat = pair_counts(artists, venues)
+    targets = genre_targets(venues, weights)
+    seeking_venues = np.flatnonzero(venues.seeking)
+    # Running best artists of every venue, merged block by block
+    best_scores = np.zeros((len(venues.ids), 0), dtype=np.float32)
+    best_artists = np.zeros((len(venues.ids), 0), dtype=np.int64)
+
+    use_copy = db.engine.dialect.name == 'postgresql'
+    db.session.execute(artist_matches.delete())
+    db.session.execute(venue_matches.delete())
+    artist_rows = BatchWriter(db, artist_matches, ('artist_id', 'venue_id', 'score'), chunk_size, use_copy)
+    venue_rows = BatchWriter(db, venue_matches, ('venue_id', 'artist_id', 'score'), chunk_size, use_copy)
+    for start in range(0, len(artists.ids), block_size):
+        stop = min(start + block_size, len(artists.ids))
+        scores = score(block(artists, start, stop), venues, repeat[start:stop], weights, radius_km, targets)
+
+        if len(seeking_venues):
+            columns, values = top_k(scores[:, seeking_venues], k)
+            for artist_id, row_columns, row_values in zip(artists.ids[start:stop].tolist(),
+                                                           venues.ids[seeking_venues[columns]].tolist(),
+                                                           values.tolist()):
+                for venue_id, value in zip(row_columns, row_values):
+                    if value > 0:
+                        artist_rows.add({'artist_id': artist_id, 'venue_id': venue_id, 'score': value})
+
+        seeking_artists = np.flatnonzero(artists.seeking[start:stop])
+        if len(seeking_artists) and len(venues.ids):
+            rows, values = top_k(scores[seeking_artists].T, k)
+            merged_scores = np.concatenate([best_scores, values], axis=1)
+            merged_artists = np.concatenate([best_artists, artists.ids[start + seeking_artists[rows]]], axis=1)
+            columns, best_scores = top_k(merged_scores, k)
+            best_artists = np.take_along_axis(merged_artists, columns, axis=1)
+    artist_rows.flush()
+
+    for venue_id, row_artists, row_values in zip(venues.ids.tolist(), best_artists.tolist(), best_scores.tolist()):
+        for artist_id, value in zip(row_artists, row_values):
+            if value > 0:
+                venue_rows.add({'venue_id': venue_id, 'artist_id': artist_id, 'score': value})
+    venue_rows.flush()
+    return artist_rows.written, venue_rows.written
+
+
+def refresh(kind, id):
+    """Rescore the artist or venue id against its candidates, replace its
+    list and update its entries in theirs. Returns the ids (of the other
+    kind) whose lists changed; the caller commits."""
+    import numpy as np
+    config = current_app.config
+    k, weights, radius_km = config['MATCH_TOP_K'], config['MATCH_WEIGHTS'], config['MATCH_RADIUS_KM']
+    side, other = SIDES[kind], SIDES[SIDES[kind].other]
+    own = load(kind, side.model.id == id)
+    if not len(own.ids):
+        return set()
+
+    genre_ids = [genre_id for genre_id, in db.session.query(side.genres.c.genre_id)
+                 .filter(side.genre_owner == id)]
+    candidates = [other.model.id.in_(db.session.query(other.show_owner).filter(side.show_owner == id))]
+    if genre_ids:
+        candidates.append(other.model.id.in_(
+            db.session.query(other.genre_owner).filter(other.genres.c.genre_id.in_(genre_ids))))
+    if not np.isnan(own.latitude[0]):
+        candidates.append(geo.around(other.model, own.latitude[0], own.longitude[0], radius_km))
+    others = load(side.other, or_(*candidates))
+    if kind == 'artist':
+        scores = score(own, others, pair_counts(own, others, Show.artist_id == id), weights, radius_km)[0]
+    else:
+        scores = score(others, own, pair_counts(others, own, Show.venue_id == id), weights, radius_km)[:, 0]
+
+    # Its own list: the best of the candidates seeking a match
+    own_column, other_column = side.table.c[f'{kind}_id'], side.table.c[f'{side.other}_id']
+    db.session.execute(side.table.delete().where(own_column == id))
+    eligible = np.flatnonzero(others.seeking & (scores > 0))
+    best = eligible[np.argsort(-scores[eligible], kind='stable')[:k]]
+    if len(best):
+        db.session.execute(side.table.insert(), [
+            {own_column.name: id, other_column.name: other_id, 'score': value}
+            for other_id, value in zip(others.ids[best].tolist(), scores[best].tolist())])
+
+    # Its place in the candidates' lists
+    owner_column, member_column = other.table.c[f'{side.other}_id'], other.table.c[f'{kind}_id']
+    changed = {owner for owner, in db.session.query(owner_column).filter(member_column == id)}
+    db.session.execute(other.table.delete().where(member_column == id))
+    if own.seeking[0]:
+        positive = np.flatnonzero(scores > 0)
+        new_scores = dict(zip(others.ids[positive].tolist(), scores[positive].tolist()))
+        owners = list(new_scores)
+        lists = {}
+        for start in range(0, len(owners), 500):
+            lists.update((owner, (count, lowest)) for owner, count, lowest in
+                         db.session.query(owner_column, func.count(), func.min(other.table.c.score))
+                         .filter(owner_column.in_(owners[start:start + 500])).group_by(owner_column))
+        entering = [owner for owner, value in new_scores.items()
+                    if owner not in lists or lists[owner][0] < k or value > lists[owner][1]]
+        if entering:
+            db.session.execute(other.table.insert(), [
+                {owner_column.name: owner, member_column.name: id, 'score': new_scores[owner]}
+                for owner in entering])
+            # Full lists drop their lowest entry to make room
+            full = [{'owner': owner} for owner in entering if owner in lists and lists[owner][0] >= k]
+            if full:
+                lowest = select([member_column]).where(owner_column == bindparam('owner')) \
+                    .order_by(other.table.c.score, member_column).limit(1).as_scalar()
+                db.session.execute(other.table.delete().where(owner_column == bindparam('owner'))
+                                   .where(member_column == lowest), full)
+            changed.update(entering)
+    return changed
+
+
+def recommended(kind, id):
+    """Query of the stored matches of the artist or venue id, best first:
+    (id, name, image_link, score) of each counterpart."""
+    side, other = SIDES[kind], SIDES[SIDES[kind].other]
+    table = side.table
+    return db.session.query(other.model.id, other.model.name, other.model.image_link, table.c.score) \
+        .join(table, table.c[f'{side.other}_id'] == other.model.id) \
+        .filter(table.c[f'{kind}_id'] == id) \
+        .order_by(table.c.score.desc(), other.model.id)
+
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def _refresh_and_invalidate(kind, id):
+    cache = current_app.extensions['response_cache']
+    try:
+        changed = refresh(kind, id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        # The profile change itself is committed: only its matches stay
+        # stale, until the next build.
+        current_app.logger.exception('refreshing the matches of %s %s failed', kind, id)
+        return
+    cache.invalidate(f'{kind}:{id}', *[f'{SIDES[kind].other}:{other_id}' for other_id in changed])
+
+
+def refresh_later(kind, id):
+    """Refresh the matches of a just committed artist or venue on a
+    background thread (one per process, so refreshes never race each
+    other), or right away with MATCH_REFRESH_IN_BACKGROUND off or a
+    database the thread could not share (in-memory SQLite)."""
+    global _refresher
+    app = current_app._get_current_object()
+    if not app.config['MATCH_REFRESH_IN_BACKGROUND'] \
+            or isinstance(db.engine.pool, (StaticPool, SingletonThreadPool)):
+        _refresh_and_invalidate(kind, id)
+        return
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = ThreadPoolExecutor(1, thread_name_prefix='matches')
+
+    def run():
+        with app.app_context():
+            _refresh_and_invalidate(kind, id)
+    _refresher.submit(run)
+
+
+@matches.command('build')
+@click.option('--top-k', type=int, help='Matches kept per artist and venue [default: MATCH_TOP_K].')
+@click.option('--block-size', type=int, help='Artists scored at once [default: MATCH_BLOCK_SIZE].')
+def build_command(top_k, block_size):
+    """Score every artist against every venue and store the best matches."""
+    config = current_app.config
+    try:
+        artists, venues = build(top_k or config['MATCH_TOP_K'], block_size or config['MATCH_BLOCK_SIZE'])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    current_app.extensions['response_cache'].invalidate('matches')
+    click.echo(f'artist_matches: {artists} rows, venue_matches: {venues} rows')
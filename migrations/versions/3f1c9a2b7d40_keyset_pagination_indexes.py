@@ -0,0 +1,28 @@
+"""keyset pagination indexes
+
+Revision ID: 3f1c9a2b7d40
+Revises: 98212cf37c40
+Create Date: 2026-10-18 10:12:04.511023
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a2b7d40'
+down_revision = '98212cf37c40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Show_start_time_id', 'Show', ['start_time', 'id'], unique=False)
+    op.create_index('ix_Artist_name_id', 'Artist', ['name', 'id'], unique=False)
+    op.create_index('ix_Venue_name_id', 'Venue', ['name', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Venue_name_id', table_name='Venue')
+    op.drop_index('ix_Artist_name_id', table_name='Artist')
+    op.drop_index('ix_Show_start_time_id', table_name='Show')
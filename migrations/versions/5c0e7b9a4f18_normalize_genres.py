@@ -0,0 +1,91 @@
+"""normalize genres
+
+Revision ID: 5c0e7b9a4f18
+Revises: d2a6f83c51e9
+Create Date: 2026-10-18 13:41:09.336702
+
+"""
+import csv
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c0e7b9a4f18'
+down_revision = 'd2a6f83c51e9'
+branch_labels = None
+depends_on = None
+
+
+OWNERS = (('Venue', 'venue_genres', 'venue_id'), ('Artist', 'artist_genres', 'artist_id'))
+
+OLD_SEARCH_DOCUMENT = "((name || ' ' || city || ' ' || state || ' ' || genres))"
+NEW_SEARCH_DOCUMENT = "((name || ' ' || city || ' ' || state))"
+
+
+def parse_genres(value):
+    # genres was written from a Python list, so rows hold Postgres array
+    # literals such as {Jazz,"Rock n Roll"}.
+    value = (value or '').strip()
+    if value.startswith('{') and value.endswith('}'):
+        value = value[1:-1]
+    names = next(csv.reader([value], skipinitialspace=True), [])
+    return [name.strip() for name in names if name.strip()]
+
+
+def upgrade():
+    genre = op.create_table('Genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    links = {}
+    for owner, association, owner_id in OWNERS:
+        links[owner] = op.create_table(association,
+        sa.Column(owner_id, sa.Integer(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint([owner_id], [f'{owner}.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint(owner_id, 'genre_id')
+        )
+        op.create_index(f'ix_{association}_genre_id_{owner_id}', association, ['genre_id', owner_id], unique=False)
+
+    # Move the stringified lists into the lookup and association tables.
+    connection = op.get_bind()
+    genre_ids = {}
+    for owner, association, owner_id in OWNERS:
+        rows = connection.execute(sa.text(f'SELECT id, genres FROM "{owner}"')).fetchall()
+        values = []
+        for id, genres in rows:
+            for name in dict.fromkeys(parse_genres(genres)):
+                if name not in genre_ids:
+                    genre_ids[name] = connection.execute(
+                        genre.insert().values(name=name).returning(genre.c.id)).scalar()
+                values.append({owner_id: id, 'genre_id': genre_ids[name]})
+        if values:
+            op.bulk_insert(links[owner], values)
+
+    for owner, association, owner_id in OWNERS:
+        op.execute(f'DROP INDEX "ix_{owner}_search_trgm"')
+        op.drop_column(owner, 'genres')
+        op.execute(f'CREATE INDEX "ix_{owner}_search_trgm" ON "{owner}" '
+                   f'USING gin ({NEW_SEARCH_DOCUMENT} gin_trgm_ops)')
+
+
+def downgrade():
+    for owner, association, owner_id in OWNERS:
+        op.execute(f'DROP INDEX "ix_{owner}_search_trgm"')
+        op.add_column(owner, sa.Column('genres', sa.String(length=120), nullable=True))
+        op.execute(f'''UPDATE "{owner}" SET genres = (
+            SELECT '{{' || string_agg(g.name, ',' ORDER BY g.name) || '}}'
+            FROM {association} a JOIN "Genre" g ON g.id = a.genre_id
+            WHERE a.{owner_id} = "{owner}".id)''')
+        op.execute(f'''UPDATE "{owner}" SET genres = '{{}}' WHERE genres IS NULL''')
+        op.alter_column(owner, 'genres', nullable=False)
+        op.execute(f'CREATE INDEX "ix_{owner}_search_trgm" ON "{owner}" '
+                   f'USING gin ({OLD_SEARCH_DOCUMENT} gin_trgm_ops)')
+        op.drop_index(f'ix_{association}_genre_id_{owner_id}', table_name=association)
+        op.drop_table(association)
+    op.drop_table('Genre')
@@ -0,0 +1,64 @@
+"""show end times and booking exclusion constraints
+
+Revision ID: 7a5c2e9d4b83
+Revises: e4f2a7c9b130
+Create Date: 2026-10-18 21:36:05.582910
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a5c2e9d4b83'
+down_revision = 'e4f2a7c9b130'
+branch_labels = None
+depends_on = None
+
+OWNERS = ('venue_id', 'artist_id')
+
+
+def upgrade():
+    connection = op.get_bind()
+    postgres = connection.dialect.name == 'postgresql'
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    if postgres:
+        # Existing shows get three hours, cut short where the venue or the
+        # artist has a later show starting sooner.
+        op.execute('''
+            UPDATE "Show" SET end_time = LEAST(start_time + interval '3 hours',
+              (SELECT min(s.start_time) FROM "Show" s
+                WHERE s.venue_id = "Show".venue_id AND s.start_time > "Show".start_time),
+              (SELECT min(s.start_time) FROM "Show" s
+                WHERE s.artist_id = "Show".artist_id AND s.start_time > "Show".start_time))''')
+        # Only shows starting at the same moment can still overlap.
+        clashes = connection.execute('''
+            SELECT a.id, b.id FROM "Show" a JOIN "Show" b ON a.id < b.id AND a.start_time = b.start_time
+              AND (a.venue_id = b.venue_id OR a.artist_id = b.artist_id) LIMIT 20''').fetchall()
+        if clashes:
+            raise RuntimeError('Shows booked at the same time for the same venue or artist '
+                               f'(Show ids {clashes}); delete or move one of each pair and retry.')
+    else:
+        # Keep the stored format (and fractional seconds) of start_time.
+        op.execute('''UPDATE "Show" SET end_time =
+            strftime('%Y-%m-%d %H:%M:%S', start_time, '+3 hours') || substr(start_time, 20)''')
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=False)
+        batch_op.create_check_constraint('ck_Show_end_after_start', 'end_time > start_time')
+    if postgres:
+        op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+        for owner in OWNERS:
+            op.execute(f'''ALTER TABLE "Show" ADD CONSTRAINT "ex_Show_{owner}_booked"
+                EXCLUDE USING gist ({owner} WITH =, tsrange(start_time, end_time) WITH &&)''')
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for owner in OWNERS:
+            op.execute(f'ALTER TABLE "Show" DROP CONSTRAINT "ex_Show_{owner}_booked"')
+    with op.batch_alter_table('Show') as batch_op:
+        # SQLite's batch mode rebuilds the table without reflected CHECKs.
+        if dialect != 'sqlite':
+            batch_op.drop_constraint('ck_Show_end_after_start', type_='check')
+        batch_op.drop_column('end_time')
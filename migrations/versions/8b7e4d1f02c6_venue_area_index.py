@@ -0,0 +1,24 @@
+"""venue area index
+
+Revision ID: 8b7e4d1f02c6
+Revises: 3f1c9a2b7d40
+Create Date: 2026-10-18 11:03:47.208391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b7e4d1f02c6'
+down_revision = '3f1c9a2b7d40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Venue_state_city_name_id', 'Venue', ['state', 'city', 'name', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Venue_state_city_name_id', table_name='Venue')
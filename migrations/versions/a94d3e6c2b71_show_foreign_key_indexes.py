@@ -0,0 +1,34 @@
+"""show foreign key indexes and cascades
+
+Revision ID: a94d3e6c2b71
+Revises: 5c0e7b9a4f18
+Create Date: 2026-10-18 15:08:52.640177
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a94d3e6c2b71'
+down_revision = '5c0e7b9a4f18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+    op.drop_constraint('Show_venue_id_fkey', 'Show', type_='foreignkey')
+    op.drop_constraint('Show_artist_id_fkey', 'Show', type_='foreignkey')
+    op.create_foreign_key('Show_venue_id_fkey', 'Show', 'Venue', ['venue_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('Show_artist_id_fkey', 'Show', 'Artist', ['artist_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade():
+    op.drop_constraint('Show_artist_id_fkey', 'Show', type_='foreignkey')
+    op.drop_constraint('Show_venue_id_fkey', 'Show', type_='foreignkey')
+    op.create_foreign_key('Show_artist_id_fkey', 'Show', 'Artist', ['artist_id'], ['id'])
+    op.create_foreign_key('Show_venue_id_fkey', 'Show', 'Venue', ['venue_id'], ['id'])
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
@@ -0,0 +1,32 @@
+"""latitude, longitude and geohash of venues and artists
+
+Revision ID: b61e0d4c8a52
+Revises: 7a5c2e9d4b83
+Create Date: 2026-10-18 22:14:37.520913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b61e0d4c8a52'
+down_revision = '7a5c2e9d4b83'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing rows are located afterwards with `flask geo geocode`.
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('latitude', sa.Float(), nullable=True))
+        op.add_column(table, sa.Column('longitude', sa.Float(), nullable=True))
+        op.add_column(table, sa.Column('geohash', sa.String(length=12), nullable=True))
+        op.create_index(f'ix_{table}_geohash', table, ['geohash'])
+
+
+def downgrade():
+    for table in ('Venue', 'Artist'):
+        op.drop_index(f'ix_{table}_geohash', table_name=table)
+        for column in ('geohash', 'longitude', 'latitude'):
+            op.drop_column(table, column)
@@ -0,0 +1,43 @@
+"""show counters on venues and artists
+
+Revision ID: c3d81f5a9e27
+Revises: a94d3e6c2b71
+Create Date: 2026-10-18 19:24:10.318402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3d81f5a9e27'
+down_revision = 'a94d3e6c2b71'
+branch_labels = None
+depends_on = None
+
+OWNERS = (('Venue', 'venue_id'), ('Artist', 'artist_id'))
+
+
+def upgrade():
+    for table, owner in OWNERS:
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), nullable=False, server_default='0'))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), nullable=False, server_default='0'))
+        op.add_column(table, sa.Column('next_show_at', sa.DateTime(), nullable=True))
+        op.execute(f'''
+            UPDATE "{table}" SET
+              upcoming_shows_count = (SELECT count(*) FROM "Show" s
+                WHERE s.{owner} = "{table}".id AND s.start_time > now()),
+              past_shows_count = (SELECT count(*) FROM "Show" s
+                WHERE s.{owner} = "{table}".id AND s.start_time <= now()),
+              next_show_at = (SELECT min(s.start_time) FROM "Show" s
+                WHERE s.{owner} = "{table}".id AND s.start_time > now())
+        ''')
+        op.create_index(f'ix_{table}_next_show_at', table, ['next_show_at'], unique=False)
+
+
+def downgrade():
+    for table, owner in reversed(OWNERS):
+        op.drop_index(f'ix_{table}_next_show_at', table_name=table)
+        op.drop_column(table, 'next_show_at')
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
@@ -0,0 +1,33 @@
+"""search trigram indexes
+
+Revision ID: d2a6f83c51e9
+Revises: 8b7e4d1f02c6
+Create Date: 2026-10-18 12:20:31.874215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a6f83c51e9'
+down_revision = '8b7e4d1f02c6'
+branch_labels = None
+depends_on = None
+
+
+# The indexed expression must match search_document() in app.py exactly for
+# the planner to use these indexes.
+SEARCH_DOCUMENT = "((name || ' ' || city || ' ' || state || ' ' || genres))"
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in ('Venue', 'Artist'):
+        op.execute(f'CREATE INDEX "ix_{table}_search_trgm" ON "{table}" '
+                   f'USING gin ({SEARCH_DOCUMENT} gin_trgm_ops)')
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.execute(f'DROP INDEX "ix_{table}_search_trgm"')
@@ -0,0 +1,26 @@
+"""version counters for optimistic locking of venue and artist edits
+
+Revision ID: e4f2a7c9b130
+Revises: c3d81f5a9e27
+Create Date: 2026-10-18 20:41:52.106275
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4f2a7c9b130'
+down_revision = 'c3d81f5a9e27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('version_id', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    for table in ('Venue', 'Artist'):
+        op.drop_column(table, 'version_id')
@@ -0,0 +1,39 @@
+"""precomputed artist and venue matches
+
+Revision ID: f3b8c6a1d925
+Revises: b61e0d4c8a52
+Create Date: 2026-10-18 23:02:11.847305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8c6a1d925'
+down_revision = 'b61e0d4c8a52'
+branch_labels = None
+depends_on = None
+
+SIDES = (('artist_matches', 'artist_id', 'Artist', 'venue_id', 'Venue'),
+         ('venue_matches', 'venue_id', 'Venue', 'artist_id', 'Artist'))
+
+
+def upgrade():
+    # Filled by `flask matches build`.
+    for table, owner, owner_table, other, other_table in SIDES:
+        op.create_table(table,
+            sa.Column(owner, sa.Integer(), nullable=False),
+            sa.Column(other, sa.Integer(), nullable=False),
+            sa.Column('score', sa.Float(), nullable=False),
+            sa.ForeignKeyConstraint([owner], [f'{owner_table}.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint([other], [f'{other_table}.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint(owner, other)
+        )
+        op.create_index(f'ix_{table}_{other}', table, [other])
+
+
+def downgrade():
+    for table, owner, owner_table, other, other_table in SIDES:
+        op.drop_index(f'ix_{table}_{other}', table_name=table)
+        op.drop_table(table)
@@ -0,0 +1,233 @@
+"""SQLAlchemy models. `db` is bound to an application by create_app(); the
+schema itself is managed with Flask-Migrate (`flask db upgrade`)."""
+import sqlite3
+from datetime import timedelta
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
+from sqlalchemy.engine import Engine
+
+db = SQLAlchemy()
+
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+    def __repr__(self):
+        return f'<Genre ID: {self.id}, name: {self.name}>'
+
+
+# Keyed on (owner, genre) for loading an entity's genres; the genre-first
+# index serves "every artist/venue in this genre" lookups.
+venue_genres = db.Table('venue_genres',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_venue_genres_genre_id_venue_id', 'genre_id', 'venue_id')
+)
+
+artist_genres = db.Table('artist_genres',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_artist_genres_genre_id_artist_id', 'genre_id', 'artist_id')
+)
+
+
+class Venue(db.Model):
+    __tablename__ = 'Venue'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String, nullable=False)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
+    address = db.Column(db.String(120), nullable=False)
+    phone = db.Column(db.String(120))
+    image_link = db.Column(db.String(500))
+    website = db.Column(db.String(120))
+    seeking_talent = db.Column(db.Boolean)
+    seeking_description = db.Column(db.String(500))
+    facebook_link = db.Column(db.String(120))
+    # Maintained by counters.py
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_at = db.Column(db.DateTime())
+    # Located by geo.py; the geohash of the point serves radius queries
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12))
+    # Bumped by every ORM update, which only applies if the row still has
+    # the version it was read at (optimistic locking of edits)
+    version_id = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    show = db.relationship('Show', backref='venue', lazy=True,
+        cascade='all, delete-orphan', passive_deletes=True)
+    genres = db.relationship('Genre', secondary=venue_genres, order_by='Genre.name', lazy=True)
+
+    __table_args__ = (
+        db.Index('ix_Venue_name_id', 'name', 'id'),
+        db.Index('ix_Venue_state_city_name_id', 'state', 'city', 'name', 'id'),
+        db.Index('ix_Venue_next_show_at', 'next_show_at'),
+        db.Index('ix_Venue_geohash', 'geohash'),
+        # Never reuse the id of a deleted row, as Postgres sequences don't:
+        # autocomplete.py counts on a create moving the highest id.
+        {'sqlite_autoincrement': True},
+    )
+    __mapper_args__ = {'version_id_col': version_id}
+
+    def __repr__(self):
+        return (f'<Venue ID: {self.id}, name: {self.name}, city: {self.city},'
+            f' state: {self.state}, address: {self.address}, phone: {self.phone},'
+            f' image_link: {self.image_link}, facebook_link: {self.facebook_link}>')
+
+
+class Artist(db.Model):
+    __tablename__ = 'Artist'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String, nullable=False)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
+    phone = db.Column(db.String(120))
+    image_link = db.Column(db.String(500))
+    facebook_link = db.Column(db.String(120))
+    website = db.Column(db.String(120))
+    seeking_venue = db.Column(db.Boolean)
+    seeking_description = db.Column(db.String(500))
+    # Maintained by counters.py
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_at = db.Column(db.DateTime())
+    # See Venue.latitude
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12))
+    # See Venue.version_id
+    version_id = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    show = db.relationship('Show', backref='artist', lazy=True,
+        cascade='all, delete-orphan', passive_deletes=True)
+    genres = db.relationship('Genre', secondary=artist_genres, order_by='Genre.name', lazy=True)
+
+    __table_args__ = (
+        db.Index('ix_Artist_name_id', 'name', 'id'),
+        db.Index('ix_Artist_next_show_at', 'next_show_at'),
+        db.Index('ix_Artist_geohash', 'geohash'),
+        # See Venue
+        {'sqlite_autoincrement': True},
+    )
+    __mapper_args__ = {'version_id_col': version_id}
+
+    def __repr__(self):
+        return (f'<Artist ID: {self.id}, name: {self.name}, city: {self.city},'
+            f' state: {self.state}, phone: {self.phone},'
+            f' image_link: {self.image_link}, facebook_link: {self.facebook_link}>')
+
+
+# Longest booking a show may have. Overlap queries without range types
+# (SQLite) rely on it to bound their index range scans.
+MAX_SHOW_DURATION = timedelta(hours=24)
+
+
+class Show(db.Model):
+    __tablename__ = 'Show'
+
+    id = db.Column(db.Integer, primary_key=True)
+    start_time = db.Column(db.DateTime(), nullable=False)
+    # The venue and artist are booked over [start_time, end_time)
+    end_time = db.Column(db.DateTime(), nullable=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.CheckConstraint('end_time > start_time', name='ck_Show_end_after_start'),
+    )
+
+    def __repr__(self):
+        return (f'<Show ID: {self.id}, start_time: {self.start_time}, end_time: {self.end_time},'
+            f' venue_id: {self.venue_id}, artist_id: {self.artist_id}>')
+
+
+# Recommendations precomputed by matches.py: the best venues for each
+# artist and the best artists for each venue, with their scores.
+artist_matches = db.Table('artist_matches',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('score', db.Float, nullable=False),
+    db.Index('ix_artist_matches_venue_id', 'venue_id')
+)
+
+venue_matches = db.Table('venue_matches',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('score', db.Float, nullable=False),
+    db.Index('ix_venue_matches_artist_id', 'artist_id')
+)
+
+
+# Server-side sessions (sessions.py, SESSION_TYPE = 'sql'): the serialized
+# session by its id, until it expires (naive UTC).
+sessions = db.Table('sessions',
+    db.Column('id', db.String(64), primary_key=True),
+    db.Column('data', db.Text, nullable=False),
+    db.Column('expires_at', db.DateTime(), nullable=False),
+    db.Index('ix_sessions_expires_at', 'expires_at')
+)
+
+
+# SQLite only honours ON DELETE CASCADE with foreign keys switched on.
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.execute('PRAGMA foreign_keys=ON')
+
+
+# Local SQLite databases get an FTS5 trigram index per searchable table,
+# kept in sync by triggers; Postgres uses the pg_trgm GIN indexes created
+# by migration instead.
+SEARCH_COLUMNS = ('name', 'city', 'state')
+
+
+def add_sqlite_search_index(model):
+    tablename = model.__tablename__
+    columns = ', '.join(SEARCH_COLUMNS)
+    new_values = ', '.join('new.' + column for column in SEARCH_COLUMNS)
+    old_values = ', '.join('old.' + column for column in SEARCH_COLUMNS)
+    statements = [
+        f'''CREATE VIRTUAL TABLE "{tablename}_search" USING fts5({columns},
+          content='{tablename}', content_rowid='id', tokenize='trigram')''',
+        f'''CREATE TRIGGER "{tablename}_search_ai" AFTER INSERT ON "{tablename}" BEGIN
+          INSERT INTO "{tablename}_search"(rowid, {columns}) VALUES (new.id, {new_values}); END''',
+        f'''CREATE TRIGGER "{tablename}_search_ad" AFTER DELETE ON "{tablename}" BEGIN
+          INSERT INTO "{tablename}_search"("{tablename}_search", rowid, {columns}) VALUES ('delete', old.id, {old_values}); END''',
+        f'''CREATE TRIGGER "{tablename}_search_au" AFTER UPDATE ON "{tablename}" BEGIN
+          INSERT INTO "{tablename}_search"("{tablename}_search", rowid, {columns}) VALUES ('delete', old.id, {old_values});
+          INSERT INTO "{tablename}_search"(rowid, {columns}) VALUES (new.id, {new_values}); END''',
+    ]
+    for statement in statements:
+        event.listen(model.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+
+add_sqlite_search_index(Venue)
+add_sqlite_search_index(Artist)
+
+
+# On Postgres no venue or artist can be booked twice at once: exclusion
+# constraints over tsrange(start_time, end_time), whose GiST indexes also
+# serve the overlap queries in bookings.py.
+BOOKING_OWNERS = ('venue_id', 'artist_id')
+
+
+def add_postgres_booking_constraints():
+    statements = ['CREATE EXTENSION IF NOT EXISTS btree_gist'] + [
+        f'''ALTER TABLE "Show" ADD CONSTRAINT "ex_Show_{owner}_booked"
+          EXCLUDE USING gist ({owner} WITH =, tsrange(start_time, end_time) WITH &&)'''
+        for owner in BOOKING_OWNERS]
+    for statement in statements:
+        event.listen(Show.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+
+
+add_postgres_booking_constraints()
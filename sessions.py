@@ -0,0 +1,291 @@
+"""Server-side sessions, shared by every worker and process.
+
+Flask's default session is the cookie itself, signed with SECRET_KEY: a
+worker whose key differs from the one that signed it drops the session,
+and with it flashed messages and the CSRF token of the form being
+submitted. Here the cookie only carries a random session id (still
+signed), and the session lives in a store every worker reads:
+
+- 'sql': the sessions table of the application database (`flask db
+  upgrade` creates it), for any number of hosts;
+- 'sqlite': a local SQLite file (SESSION_SQLITE_PATH), for the workers of
+  a single host without touching the main database;
+- 'cookie': Flask's signed cookie, unchanged.
+
+A session is only written when it changed (a flash, a new CSRF token) or
+when half its lifetime has passed, so reading pages costs at most one
+primary-key lookup, and none without a session cookie. Expired sessions
+are never loaded, and each worker deletes them every
+SESSION_SWEEP_SECONDS; `flask sessions sweep` does the same from cron.
+"""
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+sessions = AppGroup('sessions', help='Manage the server-side session store.')
+
+
+def instance_secret_key(app):
+    """SECRET_KEY for development: generated once into the instance folder,
+    so every worker and restart signs with the same key."""
+    path = os.path.join(app.instance_path, 'secret_key')
+    os.makedirs(app.instance_path, exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Another worker got there first
+        with open(path) as f:
+            return f.read().strip()
+    key = secrets.token_hex(32)
+    with os.fdopen(fd, 'w') as f:
+        f.write(key)
+    return key
+
+
+class ServerSession(CallbackDict, SessionMixin):
+
+    def __init__(self, data=None, sid=None, expires=None):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, data, on_update)
+        self.sid = sid
+        # When the stored copy expires; None for a session not stored yet
+        self.expires = expires
+        self.modified = False
+
+
+class SessionStore(object):
+    """Where ServerSessionInterface keeps sessions, as serialized strings
+    with a (naive UTC) expiry time."""
+
+    def load(self, sid):
+        """(data, expires) of the unexpired session sid, or None."""
+        raise NotImplementedError
+
+    def save(self, sid, data, expires):
+        raise NotImplementedError
+
+    def delete(self, sid):
+        raise NotImplementedError
+
+    def sweep(self):
+        """Delete the expired sessions. Returns how many."""
+        raise NotImplementedError
+
+
+class SqlSessionStore(SessionStore):
+    """The sessions table of the application database, written on its own
+    connection so it never commits or rolls back the request's work."""
+
+    def __init__(self, db):
+        self.db = db
+
+    @property
+    def table(self):
+        import models
+        return models.sessions
+
+    def load(self, sid):
+        table = self.table
+        with self.db.engine.connect() as connection:
+            row = connection.execute(table.select()
+                                     .where(table.c.id == sid)
+                                     .where(table.c.expires_at > datetime.utcnow())).first()
+        return None if row is None else (row.data, row.expires_at)
+
+    def save(self, sid, data, expires):
+        table = self.table
+        with self.db.engine.begin() as connection:
+            updated = connection.execute(table.update().where(table.c.id == sid)
+                                         .values(data=data, expires_at=expires)).rowcount
+            if not updated:
+                connection.execute(table.insert().values(id=sid, data=data, expires_at=expires))
+
+    def delete(self, sid):
+        with self.db.engine.begin() as connection:
+            connection.execute(self.table.delete().where(self.table.c.id == sid))
+
+    def sweep(self):
+        with self.db.engine.begin() as connection:
+            return connection.execute(self.table.delete()
+                                      .where(self.table.c.expires_at <= datetime.utcnow())).rowcount
+
+
+class SqliteSessionStore(SessionStore):
+    """A SQLite file shared by the processes of one host. WAL mode lets
+    readers and the writer proceed together; each thread keeps its own
+    connection."""
+
+    SCHEMA = '''CREATE TABLE IF NOT EXISTS sessions (
+      id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)'''
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        connection = self._connect()
+        try:
+            connection.execute('PRAGMA journal_mode=WAL')
+            with connection:
+                connection.execute(self.SCHEMA)
+                connection.execute('CREATE INDEX IF NOT EXISTS ix_sessions_expires_at ON sessions (expires_at)')
+        finally:
+            connection.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    def load(self, sid):
+        row = self.connection.execute('SELECT data, expires_at FROM sessions WHERE id = ? AND expires_at > ?',
+                                      (sid, time.time())).fetchone()
+        return None if row is None else (row[0], datetime.utcfromtimestamp(row[1]))
+
+    def save(self, sid, data, expires):
+        timestamp = (expires - datetime(1970, 1, 1)).total_seconds()
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO sessions (id, data, expires_at) VALUES (?, ?, ?)',
+                                    (sid, data, timestamp))
+
+    def delete(self, sid):
+        with self.connection:
+            self.connection.execute('DELETE FROM sessions WHERE id = ?', (sid,))
+
+    def sweep(self):
+        with self.connection:
+            return self.connection.execute('DELETE FROM sessions WHERE expires_at <= ?', (time.time(),)).rowcount
+
+
+class ServerSessionInterface(SessionInterface):
+    """Keeps sessions in store; the cookie holds the signed session id."""
+
+    serializer = session_json_serializer
+
+    def __init__(self, store, sweep_seconds):
+        self.store = store
+        self.sweep_seconds = sweep_seconds
+        self._swept = time.monotonic()
+        self._sweep_lock = threading.Lock()
+
+    @staticmethod
+    def _signer(app):
+        return Signer(app.secret_key, salt='session-id')
+
+    def open_session(self, app, request):
+        if not app.secret_key:
+            return None
+        cookie = request.cookies.get(app.session_cookie_name)
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            stored = self.store.load(sid) if sid else None
+            if stored is not None:
+                data, expires = stored
+                try:
+                    return ServerSession(self.serializer.loads(data), sid, expires)
+                except ValueError:
+                    pass
+        return ServerSession(sid=secrets.token_urlsafe(32))
+
+    def _stale(self, app, session):
+        """Whether the stored copy is past half its lifetime."""
+        if session.expires is None:
+            return True
+        lifetime = app.permanent_session_lifetime
+        return session.expires - datetime.utcnow() < lifetime / 2
+
+    def save_session(self, app, session, response):
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        name = app.session_cookie_name
+        if not session:
+            if session.expires is not None:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if session.modified or self._stale(app, session):
+            expires = datetime.utcnow() + app.permanent_session_lifetime
+            self.store.save(session.sid, self.serializer.dumps(dict(session)), expires)
+            session.expires = expires
+            response.set_cookie(name, self._signer(app).sign(session.sid.encode()).decode(),
+                                expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+        self._sweep_if_due()
+
+    def _sweep_if_due(self):
+        if not self.sweep_seconds or time.monotonic() - self._swept < self.sweep_seconds:
+            return
+        if not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self._swept = time.monotonic()
+            self.store.sweep()
+        except Exception:
+            current_app.logger.exception('sweeping expired sessions failed')
+        finally:
+            self._sweep_lock.release()
+
+
+class Sessions(object):
+    """Installs the session store chosen by SESSION_TYPE.
+
+    Config:
+      SESSION_TYPE           'sql' (default), 'sqlite' or 'cookie'
+      SESSION_SQLITE_PATH    file of the 'sqlite' store (default:
+                             sessions.db in the instance folder)
+      SESSION_SWEEP_SECONDS  how often each worker deletes expired
+                             sessions (0: only `flask sessions sweep`)
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SESSION_TYPE', 'sql')
+        app.config.setdefault('SESSION_SQLITE_PATH', None)
+        app.config.setdefault('SESSION_SWEEP_SECONDS', 3600)
+        kind = app.config['SESSION_TYPE']
+        if kind == 'sql':
+            from models import db
+            store = SqlSessionStore(db)
+        elif kind == 'sqlite':
+            store = SqliteSessionStore(app.config['SESSION_SQLITE_PATH']
+                                       or os.path.join(app.instance_path, 'sessions.db'))
+        elif kind == 'cookie':
+            store = None
+        else:
+            raise ValueError(f'Unknown SESSION_TYPE {kind!r}')
+        if store is not None:
+            app.session_interface = ServerSessionInterface(store, app.config['SESSION_SWEEP_SECONDS'])
+        app.extensions['sessions'] = store
+
+
+@sessions.command('sweep')
+def sweep_command():
+    """Delete expired sessions."""
+    store = current_app.extensions['sessions']
+    if store is None:
+        click.echo('SESSION_TYPE is cookie: nothing is stored')
+        return
+    click.echo(f'deleted {store.sweep()} expired sessions')
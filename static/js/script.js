@@ -2,3 +2,102 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// Name typeahead. An input with data-autocomplete="<endpoint>" lists the
+// names matching what is typed; picking one fills the input named by
+// data-autocomplete-target with its id, or opens data-autocomplete-link
+// with {id} replaced.
+$(function () {
+  $('[data-autocomplete]').each(function () {
+    var $input = $(this).attr('autocomplete', 'off');
+    var $menu = $('<ul class="dropdown-menu" role="listbox"></ul>').insertAfter($input);
+    var $target = $($input.data('autocomplete-target'));
+    var link = $input.data('autocomplete-link');
+    var matches = [];
+    var active = -1;
+    var sent = 0;
+    var timer = null;
+
+    function close() {
+      $menu.hide();
+      active = -1;
+    }
+
+    function highlight(index) {
+      active = index;
+      $menu.children().removeClass('active').eq(index).addClass('active');
+    }
+
+    function pick(index) {
+      var match = matches[index];
+      if (!match) {
+        return false;
+      }
+      close();
+      if (link) {
+        window.location = link.replace('{id}', match.id);
+      } else {
+        $input.val(match.name);
+        $target.val(match.id).trigger('change');
+      }
+      return true;
+    }
+
+    function show(data) {
+      matches = data;
+      $menu.empty();
+      $.each(data, function (index, match) {
+        $('<li role="option"><a href="#"></a></li>')
+          .find('a').text(match.name).append(' <small class="text-muted">#' + match.id + '</small>').end()
+          .on('mousedown', function (event) {
+            event.preventDefault();
+            pick(index);
+          })
+          .appendTo($menu);
+      });
+      active = -1;
+      $menu.toggle(data.length > 0);
+    }
+
+    function query() {
+      var q = $.trim($input.val());
+      var request = ++sent;
+      if (!q) {
+        show([]);
+        return;
+      }
+      $.getJSON($input.data('autocomplete'), {q: q}, function (response) {
+        // Drop answers to anything but the latest keystroke
+        if (request === sent) {
+          show(response.data);
+        }
+      });
+    }
+
+    $input.on('input', function () {
+      clearTimeout(timer);
+      timer = setTimeout(query, 80);
+    });
+    $input.on('keydown', function (event) {
+      if (!$menu.is(':visible')) {
+        return;
+      }
+      if (event.which === 40) {
+        highlight(Math.min(active + 1, matches.length - 1));
+      } else if (event.which === 38) {
+        highlight(Math.max(active - 1, 0));
+      } else if (event.which === 13) {
+        if (!pick(active)) {
+          close();
+          return;
+        }
+      } else if (event.which === 27) {
+        close();
+      } else {
+        return;
+      }
+      event.preventDefault();
+    });
+    $input.on('blur', close);
+  });
+});
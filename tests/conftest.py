@@ -0,0 +1,74 @@
+"""Shared fixtures: an application on the TestingConfig (in-memory SQLite,
+no page cache) with a fresh schema per test."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import create_app
+from config import TestingConfig
+from instrumentation import Instrumentation
+from models import db, Venue, Artist, Show
+
+
+@pytest.fixture
+def config():
+    """The configuration of app; override it to test other settings."""
+    return TestingConfig
+
+
+@pytest.fixture
+def app(config):
+    app = create_app(config)
+
+    @app.after_request
+    def keep_stats(response):
+        # The request's statement count, read back by query_count()
+        app.last_request_queries = Instrumentation.current().queries
+        return response
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def query_count(app, client):
+    """(statements run, page) of a GET of url."""
+    def count(url):
+        response = client.get(url)
+        assert response.status_code == 200
+        return app.last_request_queries, response.get_data(as_text=True)
+    return count
+
+
+@pytest.fixture
+def catalog(app):
+    """A venue and an artist; add_shows(n) books n more shows between them,
+    half of them past and half upcoming."""
+    venue = Venue(name='The Musical Hop', city='San Francisco', state='CA', address='1015 Folsom Street')
+    artist = Artist(name='Guns N Petals', city='San Francisco', state='CA')
+    db.session.add_all([venue, artist])
+    db.session.commit()
+    added = [0]
+
+    def add_shows(n):
+        now = datetime.now().replace(microsecond=0)
+        rows = []
+        for i in range(added[0], added[0] + n):
+            # Alternately past and upcoming, never overlapping
+            offset = timedelta(hours=4 * (i // 2 + 1))
+            start_time = now - offset if i % 2 else now + offset
+            rows.append({'venue_id': venue.id, 'artist_id': artist.id,
+                         'start_time': start_time, 'end_time': start_time + timedelta(hours=3)})
+        db.session.execute(Show.__table__.insert(), rows)
+        db.session.commit()
+        added[0] += n
+
+    return {'venue_id': venue.id, 'artist_id': artist.id, 'add_shows': add_shows}
@@ -0,0 +1,110 @@
+"""A venue or artist is never in two shows at once: clashing shows are
+refused by the show form and skipped by `flask catalog import`."""
+import json
+from datetime import datetime, timedelta
+
+from bookings import IntervalIndex
+from models import db, Show, Venue, Artist
+
+EVENING = datetime(2030, 5, 1, 20, 0)
+
+
+def book(venue_id, artist_id, start, minutes=180):
+    db.session.execute(Show.__table__.insert().values(
+        venue_id=venue_id, artist_id=artist_id, start_time=start,
+        end_time=start + timedelta(minutes=minutes)))
+    db.session.commit()
+
+
+def list_show(client, venue_id, artist_id, start, minutes=60):
+    return client.post('/shows/create', data={
+        'venue_id': venue_id, 'artist_id': artist_id,
+        'start_time': start.strftime('%Y-%m-%d %H:%M:%S'), 'duration': minutes})
+
+
+def shows():
+    return db.session.query(Show.venue_id, Show.artist_id, Show.start_time).order_by(Show.start_time).all()
+
+
+def add_venue(name='Park Square Live Music & Coffee'):
+    venue = Venue(name=name, city='San Francisco', state='CA', address='34 Whiskey Moore Ave')
+    db.session.add(venue)
+    db.session.commit()
+    return venue.id
+
+
+def test_interval_index():
+    hour = timedelta(hours=1)
+    index = IntervalIndex([(EVENING, EVENING + 3 * hour), (EVENING - 8 * hour, EVENING - 7 * hour)])
+    # A long interval starting early still overlaps a late window
+    index.add(EVENING - 10 * hour, EVENING + hour)
+    assert index.overlapping(EVENING + 2 * hour, EVENING + 4 * hour) == [(EVENING, EVENING + 3 * hour)]
+    assert len(index.overlapping(EVENING - hour, EVENING)) == 1
+    # Half-open: touching intervals do not overlap
+    assert index.overlapping(EVENING + 3 * hour, EVENING + 4 * hour) == []
+    assert index.free(EVENING - 12 * hour, EVENING + 4 * hour) == [
+        (EVENING - 12 * hour, EVENING - 10 * hour), (EVENING + 3 * hour, EVENING + 4 * hour)]
+
+
+def test_overlapping_show_is_a_conflict(client, catalog):
+    book(catalog['venue_id'], catalog['artist_id'], EVENING)
+    other_artist = Artist(name='The Wild Sax Band', city='San Francisco', state='CA')
+    db.session.add(other_artist)
+    db.session.commit()
+
+    response = list_show(client, catalog['venue_id'], other_artist.id, EVENING + timedelta(hours=2))
+    assert response.status_code == 409
+    assert 'The venue is already booked from' in response.get_data(as_text=True)
+    assert len(shows()) == 1
+
+
+def test_back_to_back_show_is_accepted(client, catalog):
+    book(catalog['venue_id'], catalog['artist_id'], EVENING)
+
+    response = list_show(client, catalog['venue_id'], catalog['artist_id'], EVENING + timedelta(hours=3))
+    assert response.status_code == 200
+    assert 'Show was successfully listed!' in response.get_data(as_text=True)
+    assert len(shows()) == 2
+
+
+def test_artist_booked_at_another_venue_is_a_conflict(client, catalog):
+    book(catalog['venue_id'], catalog['artist_id'], EVENING)
+    venue_id = add_venue()
+
+    response = list_show(client, venue_id, catalog['artist_id'], EVENING + timedelta(hours=1))
+    assert response.status_code == 409
+    assert 'The artist is already booked from' in response.get_data(as_text=True)
+    assert len(shows()) == 1
+
+
+def test_venue_availability(client, catalog):
+    book(catalog['venue_id'], catalog['artist_id'], EVENING)
+    response = client.get(f"/venues/{catalog['venue_id']}/availability"
+                          '?from=2030-05-01T18:00&to=2030-05-02T00:00')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['booked'] == [{'start': '2030-05-01T20:00:00', 'end': '2030-05-01T23:00:00'}]
+    assert data['free'] == [{'start': '2030-05-01T18:00:00', 'end': '2030-05-01T20:00:00'},
+                            {'start': '2030-05-01T23:00:00', 'end': '2030-05-02T00:00:00'}]
+
+
+def test_import_skips_clashing_shows(app, catalog, tmp_path):
+    venue_id, artist_id = catalog['venue_id'], catalog['artist_id']
+    other_venue_id = add_venue()
+    book(venue_id, artist_id, EVENING)
+    rows = [
+        # Clashes with the show already booked
+        {'venue_id': venue_id, 'artist_id': artist_id, 'start_time': '2030-05-01T21:00:00'},
+        # Back to back with it
+        {'venue_id': venue_id, 'artist_id': artist_id, 'start_time': '2030-05-01T23:00:00'},
+        # The artist is playing the row above
+        {'venue_id': other_venue_id, 'artist_id': artist_id, 'start_time': '2030-05-02T00:00:00',
+         'duration': 60},
+    ]
+    path = tmp_path / 'shows.jsonl'
+    path.write_text(''.join(json.dumps(row) + '\n' for row in rows))
+
+    result = app.test_cli_runner().invoke(args=['catalog', 'import', '--shows', str(path)])
+    assert result.exit_code == 0, result.output
+    assert 'shows: imported 1, skipped 2' in result.output
+    assert shows() == [(venue_id, artist_id, EVENING), (venue_id, artist_id, EVENING + timedelta(hours=3))]
@@ -0,0 +1,93 @@
+"""Cached pages are invalidated by the writes that change what they render."""
+import pytest
+
+from app import response_cache
+from config import TestingConfig
+from models import db, Venue
+
+
+class CachedConfig(TestingConfig):
+    CACHE_TYPE = 'lru'
+
+
+@pytest.fixture
+def config():
+    return CachedConfig
+
+
+def page(client, url):
+    # Pending flashes bypass the cache: let the home page take them first
+    client.get('/')
+    response = client.get(url)
+    assert response.status_code == 200
+    return response.get_data(as_text=True)
+
+
+def venue_form(**changes):
+    form = {'name': 'The Musical Hop', 'city': 'San Francisco', 'state': 'CA',
+            'address': '1015 Folsom Street', 'phone': '123-123-1234', 'genres': ['Jazz'],
+            'facebook_link': '', 'version_id': 1}
+    form.update(changes)
+    return form
+
+
+def test_pages_are_served_from_the_cache(client, catalog):
+    url = f"/venues/{catalog['venue_id']}"
+    page(client, url)
+    hits = response_cache.stats()['hits']
+    # Not written through the app, so nothing is invalidated
+    db.session.execute(Venue.__table__.update().values(name='Renamed Behind The Back'))
+    db.session.commit()
+    assert 'The Musical Hop' in page(client, url)
+    assert response_cache.stats()['hits'] == hits + 1
+
+
+def test_venue_edit_invalidates_its_pages(client, catalog):
+    catalog['add_shows'](2)
+    urls = ['/venues', f"/venues/{catalog['venue_id']}", f"/artists/{catalog['artist_id']}", '/shows']
+    for url in urls:
+        assert 'The Musical Hop' in page(client, url)
+
+    response = client.post(f"/venues/{catalog['venue_id']}/edit", data=venue_form(name='The Hop'))
+    assert response.status_code == 302
+    for url in urls:
+        text = page(client, url)
+        assert 'The Hop' in text and 'The Musical Hop' not in text, url
+
+
+def test_artist_edit_invalidates_its_venues(client, catalog):
+    catalog['add_shows'](2)
+    url = f"/venues/{catalog['venue_id']}"
+    assert 'Guns N Petals' in page(client, url)
+
+    response = client.post(f"/artists/{catalog['artist_id']}/edit", data={
+        'name': 'Matt Quevedo', 'city': 'San Francisco', 'state': 'CA', 'phone': '123-123-1234',
+        'genres': ['Jazz'], 'facebook_link': '', 'version_id': 1})
+    assert response.status_code == 302
+    assert 'Matt Quevedo' in page(client, url)
+
+
+def test_new_show_invalidates_the_listings_and_both_pages(client, catalog):
+    urls = ['/shows', f"/venues/{catalog['venue_id']}", f"/artists/{catalog['artist_id']}"]
+    before = [page(client, url) for url in urls]
+    assert before[0].count('tile-show') == 0
+
+    response = client.post('/shows/create', data={
+        'venue_id': catalog['venue_id'], 'artist_id': catalog['artist_id'],
+        'start_time': '2030-05-01 20:00:00', 'duration': 180})
+    assert response.status_code == 200
+    after = [page(client, url) for url in urls]
+    assert after[0].count('tile-show') == 1
+    assert after[1] != before[1] and after[2] != before[2]
+
+
+def test_deleted_venue_leaves_every_page(client, catalog):
+    catalog['add_shows'](2)
+    urls = ['/venues', f"/artists/{catalog['artist_id']}", '/shows']
+    for url in urls:
+        assert 'The Musical Hop' in page(client, url)
+
+    response = client.delete(f"/venues/{catalog['venue_id']}")
+    assert response.status_code == 200
+    for url in urls:
+        assert 'The Musical Hop' not in page(client, url), url
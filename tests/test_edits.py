@@ -0,0 +1,86 @@
+"""Edits are optimistic: a form filled in from an older version of the row
+gets a 409 with the conflicting fields instead of overwriting."""
+import re
+
+from sqlalchemy import event
+
+from models import db, Venue
+
+
+def venue_form(version_id, **changes):
+    form = {'name': 'The Musical Hop', 'city': 'San Francisco', 'state': 'CA',
+            'address': '1015 Folsom Street', 'phone': '123-123-1234', 'genres': ['Jazz'],
+            'facebook_link': '', 'version_id': version_id}
+    form.update(changes)
+    return form
+
+
+def edit_venue(client, venue_id, form):
+    return client.post(f'/venues/{venue_id}/edit', data=form)
+
+
+def form_version(page):
+    return int(re.search(r'<input id="version_id"[^>]* value="(\d+)"', page).group(1))
+
+
+def venue(venue_id):
+    db.session.expire_all()
+    return Venue.query.get(venue_id)
+
+
+def test_edit_bumps_the_version(client, catalog):
+    venue_id = catalog['venue_id']
+    response = edit_venue(client, venue_id, venue_form(1, name='The Hop'))
+    assert response.status_code == 302
+    assert venue(venue_id).name == 'The Hop'
+    assert venue(venue_id).version_id == 2
+
+
+def test_stale_edit_is_a_conflict(client, catalog):
+    venue_id = catalog['venue_id']
+    assert edit_venue(client, venue_id, venue_form(1, name='Theirs')).status_code == 302
+
+    response = edit_venue(client, venue_id, venue_form(1, name='Mine'))
+    assert response.status_code == 409
+    page = response.get_data(as_text=True)
+    assert 'Someone else saved changes' in page
+    assert '<td>name</td>' in page
+    assert '<td>Mine</td>' in page and '<td>Theirs</td>' in page
+    # Rebased on the current version, so submitting again overwrites
+    assert form_version(page) == 2
+    assert venue(venue_id).name == 'Theirs'
+
+    assert edit_venue(client, venue_id, venue_form(2, name='Mine')).status_code == 302
+    assert venue(venue_id).name == 'Mine'
+
+
+def test_genres_only_edit_bumps_the_version(client, catalog):
+    venue_id = catalog['venue_id']
+    assert edit_venue(client, venue_id, venue_form(1)).status_code == 302
+    assert edit_venue(client, venue_id, venue_form(2, genres=['Jazz', 'Blues'])).status_code == 302
+    assert venue(venue_id).version_id == 3
+    assert sorted(genre.name for genre in venue(venue_id).genres) == ['Blues', 'Jazz']
+
+    response = edit_venue(client, venue_id, venue_form(2, genres=['Folk']))
+    assert response.status_code == 409
+    page = response.get_data(as_text=True)
+    assert '<td>genres</td>' in page
+    assert '<td>Folk</td>' in page and '<td>Blues, Jazz</td>' in page
+    assert form_version(page) == 3
+    assert sorted(genre.name for genre in venue(venue_id).genres) == ['Blues', 'Jazz']
+
+
+def test_edit_committed_during_the_update_is_a_conflict(client, catalog):
+    venue_id = catalog['venue_id']
+
+    # Another edit lands between the version check and our UPDATE
+    @event.listens_for(db.session, 'before_flush', once=True)
+    def concurrent_edit(session, flush_context, instances):
+        table = Venue.__table__
+        session.execute(table.update().where(table.c.id == venue_id)
+                        .values(version_id=table.c.version_id + 1))
+
+    response = edit_venue(client, venue_id, venue_form(1, name='Mine'))
+    assert response.status_code == 409
+    assert 'Someone else saved changes' in response.get_data(as_text=True)
+    assert venue(venue_id).name == 'The Musical Hop'
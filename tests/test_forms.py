@@ -0,0 +1,57 @@
+"""Recurring shows: ShowForm.occurrences() and its validation."""
+from datetime import datetime
+
+from werkzeug.datastructures import MultiDict
+
+from forms import ShowForm
+
+
+def show_form(app, **fields):
+    data = {'venue_id': '1', 'artist_id': '1', 'start_time': '2030-01-31 20:00:00', 'duration': '180'}
+    data.update(fields)
+    with app.test_request_context(method='POST'):
+        form = ShowForm(MultiDict(data))
+        form.validate()
+    return form
+
+
+def test_single_show(app):
+    form = show_form(app)
+    assert not form.errors
+    assert form.occurrences() == [datetime(2030, 1, 31, 20)]
+
+
+def test_weekly_repeat_count(app):
+    form = show_form(app, start_time='2030-01-01 20:00:00', repeat='weekly', repeat_count='3')
+    assert not form.errors
+    assert form.occurrences() == [datetime(2030, 1, 1, 20), datetime(2030, 1, 8, 20), datetime(2030, 1, 15, 20)]
+
+
+def test_monthly_from_the_31st_falls_on_the_last_day(app):
+    form = show_form(app, repeat='monthly', repeat_count='4')
+    assert form.occurrences() == [datetime(2030, 1, 31, 20), datetime(2030, 2, 28, 20),
+                                  datetime(2030, 3, 31, 20), datetime(2030, 4, 30, 20)]
+
+
+def test_repeat_until_is_inclusive(app):
+    form = show_form(app, start_time='2030-01-01 20:00:00', repeat='weekly', repeat_until='2030-01-15')
+    assert not form.errors
+    assert form.occurrences()[-1] == datetime(2030, 1, 15, 20)
+    assert len(form.occurrences()) == 3
+
+
+def test_repeat_needs_count_or_end_date(app):
+    assert 'repeat' in show_form(app, repeat='weekly').errors
+    assert 'repeat' in show_form(app, repeat='weekly', repeat_count='2', repeat_until='2030-03-01').errors
+
+
+def test_repeat_until_before_the_first_show(app):
+    assert 'repeat' in show_form(app, repeat='weekly', repeat_until='2030-01-30').errors
+
+
+def test_too_many_recurring_shows(app):
+    limit = app.config['MAX_RECURRING_SHOWS']
+    assert not show_form(app, repeat='weekly', repeat_count=str(limit)).errors
+    errors = show_form(app, repeat='weekly', repeat_count=str(limit + 1)).errors
+    assert errors['repeat'] == [f'At most {limit} shows can be listed at once.']
+    assert 'repeat' in show_form(app, repeat='weekly', repeat_until='2040-01-01').errors
@@ -0,0 +1,26 @@
+"""Pages run a fixed number of statements however many shows there are."""
+import pytest
+
+N = 20
+
+
+def test_shows_listing_query_count_is_constant(catalog, query_count):
+    # The largest page, so that more shows mean more rows rendered
+    url = '/shows?limit=100'
+    catalog['add_shows'](N)
+    small, page = query_count(url)
+    assert page.count('tile-show') == N
+    catalog['add_shows'](9 * N)
+    queries, page = query_count(url)
+    assert page.count('tile-show') == 100
+    assert queries == small
+
+
+@pytest.mark.parametrize('url', ['/venues/{venue_id}', '/artists/{artist_id}'])
+def test_detail_page_query_count_is_constant(catalog, query_count, url):
+    url = url.format(**catalog)
+    catalog['add_shows'](N)
+    small, _ = query_count(url)
+    catalog['add_shows'](9 * N)
+    queries, _ = query_count(url)
+    assert queries == small
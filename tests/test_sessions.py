@@ -0,0 +1,72 @@
+"""Server-side sessions on the 'sqlite' store: the cookie carries a signed
+session id, the session itself lives in the store."""
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from config import TestingConfig
+
+SAVED = 'Venue The Hop was successfully updated!'
+
+
+@pytest.fixture
+def config(tmp_path):
+    class SqliteSessionConfig(TestingConfig):
+        SESSION_TYPE = 'sqlite'
+        SESSION_SQLITE_PATH = str(tmp_path / 'sessions.db')
+    return SqliteSessionConfig
+
+
+def flash_saved(client, catalog):
+    """Edit the venue, which flashes a message for the next page."""
+    response = client.post(f"/venues/{catalog['venue_id']}/edit", data={
+        'name': 'The Hop', 'city': 'San Francisco', 'state': 'CA', 'address': '1015 Folsom Street',
+        'phone': '123-123-1234', 'genres': ['Jazz'], 'facebook_link': '', 'version_id': 1})
+    assert response.status_code == 302
+
+
+def session_cookie(app, client):
+    return next(cookie.value for cookie in client.cookie_jar if cookie.name == app.session_cookie_name)
+
+
+def stored(app):
+    with sqlite3.connect(app.config['SESSION_SQLITE_PATH']) as connection:
+        return connection.execute('SELECT id, data FROM sessions').fetchall()
+
+
+def test_flash_survives_to_the_next_request(app, client, catalog):
+    flash_saved(client, catalog)
+    (sid, data), = stored(app)
+    # The cookie holds the signed id, not the session
+    assert session_cookie(app, client).startswith(sid + '.')
+    assert SAVED in data
+
+    assert SAVED in client.get('/').get_data(as_text=True)
+    assert SAVED not in client.get('/').get_data(as_text=True)
+
+
+def test_tampered_cookie_starts_a_fresh_session(app, client, catalog):
+    flash_saved(client, catalog)
+    cookie = session_cookie(app, client)
+    client.set_cookie('localhost', app.session_cookie_name, cookie[:-1] + ('A' if cookie[-1] != 'A' else 'B'))
+    assert SAVED not in client.get('/').get_data(as_text=True)
+
+
+def test_expired_session_is_not_loaded(app, client, catalog):
+    flash_saved(client, catalog)
+    with sqlite3.connect(app.config['SESSION_SQLITE_PATH']) as connection:
+        connection.execute('UPDATE sessions SET expires_at = expires_at - ?',
+                           (app.permanent_session_lifetime.total_seconds() + 1,))
+    assert SAVED not in client.get('/').get_data(as_text=True)
+
+
+def test_sweep_deletes_only_expired_sessions(app):
+    store = app.extensions['sessions']
+    now = datetime.utcnow()
+    store.save('expired', '{}', now - timedelta(seconds=1))
+    store.save('live', '{}', now + timedelta(hours=1))
+    assert store.sweep() == 1
+    assert store.load('expired') is None
+    assert store.load('live') is not None
+    assert [sid for sid, _ in stored(app)] == ['live']